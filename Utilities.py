@@ -1,4 +1,4 @@
-import re, ipaddress
+import re, ipaddress, base64, secrets
 import subprocess
 
 
@@ -59,6 +59,19 @@ def ValidateDNSAddress(addresses) -> tuple[bool, str]:
             return False, f"{address} does not appear to be an valid DNS address"
     return True, ""
 
+def ValidateWireguardKey(key: str) -> bool:
+    """
+    Check a WireGuard key: 44 characters of base64 encoding 32 bytes
+    @param key: Public, private or preshared key
+    @return: Boolean indicate if the key is well formed
+    """
+    if type(key) is not str or len(key) != 44 or not RegexMatch(r"^[A-Za-z0-9+/]{43}=$", key):
+        return False
+    try:
+        return len(base64.b64decode(key, validate=True)) == 32
+    except ValueError:
+        return False
+
 def GenerateWireguardPublicKey(privateKey: str) -> tuple[bool, str] | tuple[bool, None]:
     try:
         publicKey = subprocess.check_output(f"wg pubkey", input=privateKey.encode(), shell=True,
@@ -67,6 +80,31 @@ def GenerateWireguardPublicKey(privateKey: str) -> tuple[bool, str] | tuple[bool
     except subprocess.CalledProcessError:
         return False, None
     
+def GenerateWireguardKeyPairs(count: int) -> list[tuple[str, str]]:
+    """
+    Generate key pairs through one shell instead of starting wg genkey and wg pubkey from Python for each of them.
+    Private keys are clamped random scalars like wg genkey makes, wg pubkey derives every public key
+    @param count: Number of key pairs
+    @return: List of (private key, public key) in base64, same as wg genkey / wg pubkey
+    """
+    privateKeys = []
+    for _ in range(count):
+        privateKey = bytearray(secrets.token_bytes(32))
+        privateKey[0] &= 248
+        privateKey[31] &= 127
+        privateKey[31] |= 64
+        privateKeys.append(base64.b64encode(privateKey).decode())
+    if not privateKeys:
+        return []
+    # Keys only travel through stdin / stdout, the script itself is constant
+    result = subprocess.run(["sh", "-c", 'while read -r key; do printf "%s\\n" "$key" | wg pubkey || exit 1; done'],
+                            input="\n".join(privateKeys) + "\n", capture_output=True, text=True)
+    publicKeys = result.stdout.split()
+    if result.returncode != 0 or len(publicKeys) != len(privateKeys) \
+            or not all(ValidateWireguardKey(k) for k in publicKeys):
+        raise RuntimeError(f"wg pubkey failed: {result.stderr.strip() or 'unexpected output'}")
+    return list(zip(privateKeys, publicKeys))
+
 def GenerateWireguardPrivateKey() -> tuple[bool, str] | tuple[bool, None]:
     try:
         publicKey = subprocess.check_output(f"wg genkey", shell=True,
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark of typical RBAC page loads
+Compares shared per-thread connections with opening a connection on every call,
+on copies of the shipped databases filled with generated users, groups and organizations
+"""
+
+import sys
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from modules.DatabaseConnections import DatabaseConnections
+from modules.EnhancedRBACManager import EnhancedRBACManager
+from modules.OrganizationManager import OrganizationManager
+from modules.UserManager import UserManager
+
+GROUPS = 20
+ORGANIZATIONS = 40
+USERS = 500
+ROUNDS = 20
+
+
+def seed(directory):
+    """Copy the shipped databases and fill them with generated data"""
+    source = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db')
+    paths = {}
+    for name, file_name in (('users', 'users.db'), ('rbac', 'rbac.db'), ('organization', 'organization.db')):
+        paths[name] = os.path.join(directory, file_name)
+        shutil.copy(os.path.join(source, file_name), paths[name])
+
+    with sqlite3.connect(paths['organization']) as conn:
+        for table in ('user_organizations', 'organization_subnets', 'organizations'):
+            conn.execute(f"DELETE FROM {table}")
+        for org_id in range(1, ORGANIZATIONS + 1):
+            conn.execute("INSERT INTO organizations (id, name, description, color) VALUES (?, ?, '', '#007bff')",
+                         (org_id, f'org-{org_id}'))
+            conn.executemany("INSERT INTO organization_subnets (organization_id, subnet_cidr, description, is_primary) VALUES (?, ?, '', ?)",
+                             [(org_id, f'10.{org_id}.{i}.0/24', i == 0) for i in range(4)])
+
+    with sqlite3.connect(paths['rbac']) as conn:
+        for table in ('rbac_group_peers', 'rbac_group_organizations', 'rbac_groups'):
+            conn.execute(f"DELETE FROM {table}")
+        for group_id in range(1, GROUPS + 1):
+            conn.execute("INSERT INTO rbac_groups (id, name, description, color, vpn_enabled, vpn_server_name) VALUES (?, ?, '', '#007bff', 1, 'wg0')",
+                         (group_id, f'group-{group_id}'))
+            conn.executemany("INSERT INTO rbac_group_organizations (group_id, organization_id) VALUES (?, ?)",
+                             [(group_id, (group_id * 3 + i) % ORGANIZATIONS + 1) for i in range(3)])
+
+    with sqlite3.connect(paths['users']) as conn:
+        for table in ('user_vpn_peers', 'user_groups', 'user_sessions', 'user_permissions', 'users'):
+            conn.execute(f"DELETE FROM {table}")
+        for user_id in range(1, USERS + 1):
+            group_id = user_id % GROUPS + 1
+            conn.execute("INSERT INTO users (id, username, password_hash, email, role) VALUES (?, ?, 'x', '', 'user')",
+                         (user_id, f'user-{user_id}'))
+            conn.execute("INSERT INTO user_groups (user_id, group_id, vpn_peer_generated, peer_ip) VALUES (?, ?, 1, ?)",
+                         (user_id, group_id, f'10.200.{user_id // 250}.{user_id % 250 + 2}'))
+            conn.execute("INSERT INTO user_vpn_peers (user_id, group_id, vpn_server_name, peer_ip, public_key, private_key) VALUES (?, ?, 'wg0', '', '', '')",
+                         (user_id, group_id))
+    return paths
+
+
+def pages(users, organizations, rbac):
+    """The calls behind the RBAC pages"""
+    def groups_page():
+        for group in rbac.get_all_groups()['data']:
+            rbac.get_group_organizations(group['id'])
+            rbac.get_group_vpn_subnets(group['id'])
+            rbac.get_group_peers_summary(group['id'])
+
+    def group_detail_page():
+        rbac.get_group_users(1)
+        rbac.get_group_organizations(1)
+        rbac.get_available_organizations_for_group(1)
+
+    def users_page():
+        users.get_users()
+        for user_id in range(1, 51):
+            rbac.get_user_groups(user_id)
+
+    def user_detail_page():
+        rbac.get_user_groups(1)
+        rbac.get_user_vpn_peers(1)
+
+    def organizations_page():
+        organizations.get_all_organizations()
+        organizations.get_all_organization_subnets()
+
+    return {
+        'groups': groups_page,
+        'group detail': group_detail_page,
+        'users (50 rows)': users_page,
+        'user detail': user_detail_page,
+        'organizations': organizations_page
+    }
+
+
+def run(paths, pool_size):
+    connections = DatabaseConnections(paths, pool_size=pool_size)
+    users = UserManager(db_path=paths['users'], connections=connections)
+    organizations = OrganizationManager(db_path=paths['organization'], connections=connections)
+    rbac = EnhancedRBACManager(db_path=paths['rbac'], connections=connections)
+    results = {}
+    for name, page in pages(users, organizations, rbac).items():
+        page()
+        samples = []
+        for _ in range(ROUNDS):
+            started = time.perf_counter()
+            page()
+            samples.append((time.perf_counter() - started) * 1000)
+        results[name] = statistics.median(samples)
+    connections.close()
+    return results
+
+
+def benchmark():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = seed(directory)
+        per_call = run(paths, pool_size=0)
+        shared = run(paths, pool_size=2)
+    print(f"\n{'page':<20}{'connection per call':>22}{'shared connections':>22}{'speedup':>10}")
+    for name in per_call:
+        print(f"{name:<20}{per_call[name]:>19.2f} ms{shared[name]:>19.2f} ms{per_call[name] / shared[name]:>9.1f}x")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -1,19 +1,20 @@
-import random, shutil, sqlite3, configparser, hashlib, ipaddress, json, os, secrets, subprocess
-import time, re, urllib.error, uuid, bcrypt, psutil, pyotp, threading
+import io, random, shutil, sqlite3, configparser, hashlib, ipaddress, json, os, secrets, subprocess
+import time, re, urllib.error, uuid, bcrypt, psutil, pyotp, threading, atexit
 from uuid import uuid4
 from zipfile import ZipFile
 from datetime import datetime, timedelta
 from typing import Any
 from jinja2 import Template
-from flask import Flask, request, render_template, session, send_file
+from flask import Flask, request, render_template, session, send_file, Response, stream_with_context
 from json import JSONEncoder
 from flask_cors import CORS
 from icmplib import ping, traceroute
 from flask.json.provider import DefaultJSONProvider
 from itertools import islice
+from concurrent.futures import Future
 from Utilities import (
     RegexMatch, GetRemoteEndpoint, StringToBoolean,
-    ValidateIPAddressesWithRange, ValidateDNSAddress,
+    ValidateIPAddressesWithRange, ValidateDNSAddress, ValidateWireguardKey,
     GenerateWireguardPublicKey, GenerateWireguardPrivateKey
 )
 from packaging import version
@@ -24,12 +25,20 @@ from modules.PeerJobLogger import PeerJobLogger
 from modules.PeerJob import PeerJob
 from modules.SystemStatus import SystemStatus
 from modules.FirewallManager import FirewallManager
+from modules.FirewallBackend import get_firewall_backend
+from modules.FirewallAccounting import FirewallAccounting
 from modules.RouteManager import RouteManager
 from modules.LoggingManager import LoggingManager
 from modules.UserManager import UserManager
 from modules.RBACManager import RBACManager
 from modules.OrganizationManager import OrganizationManager
 from modules.EnhancedRBACManager import EnhancedRBACManager
+from modules.ConfigurationSaveScheduler import ConfigurationSaveScheduler
+from modules.DashboardDatabase import DashboardDatabase, DatabaseWriter
+from modules.BackupCatalog import BackupCatalog
+from modules.BackupStore import BackupStore
+from modules.ZipStream import zipStream
+from modules.BackupScheduler import BackupScheduler
 SystemStatus = SystemStatus()
 FirewallManager = FirewallManager()
 RouteManager = RouteManager()
@@ -38,6 +47,8 @@ UserManager = UserManager(db_path=os.path.join(os.path.dirname(os.path.abspath(_
 RBACManager = RBACManager(db_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db', 'rbac.db'))
 OrganizationManager = OrganizationManager(db_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db', 'organization.db'))
 enhanced_rbac_manager = EnhancedRBACManager(db_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db', 'rbac.db'))
+WireguardSaveScheduler = ConfigurationSaveScheduler()
+atexit.register(WireguardSaveScheduler.flushAll)
 
 DASHBOARD_VERSION = 'v4.2.5'
 
@@ -74,6 +85,39 @@ def ResponseObject(status=True, message=None, data=None, status_code = 200) -> F
     response.content_type = "application/json"
     return response       
 
+def ZipResponse(archive, filename: str) -> Flask.response_class:
+    """
+    Stream a ZIP produced by zipStream() as a download
+    """
+    return Response(stream_with_context(archive), mimetype="application/zip",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+class PendingDownloads:
+    """
+    Files prepared for /fileDownload, kept in memory and handed out once.
+    Files nobody fetched expire after `timeout` seconds
+    """
+    def __init__(self, timeout: int = 600):
+        self.timeout = timeout
+        self.__files: dict[str, tuple[float, bytes]] = {}
+        self.__lock = threading.Lock()
+
+    def add(self, data: bytes, extension: str) -> str:
+        name = f'{uuid4()}{extension}'
+        now = time.monotonic()
+        with self.__lock:
+            for k in [k for k, (t, _) in self.__files.items() if now - t > self.timeout]:
+                del self.__files[k]
+            self.__files[name] = (now, data)
+        return name
+
+    def take(self, name: str) -> bytes | None:
+        with self.__lock:
+            entry = self.__files.pop(name, None)
+        return None if entry is None else entry[1]
+
+AllPendingDownloads: PendingDownloads = PendingDownloads()
+
 """
 Peer Jobs
 """
@@ -345,6 +389,7 @@ class WireguardConfiguration:
         self.PreDown: str = ""
         self.PostDown: str = ""
         self.SaveConfig: bool = True
+        self.LastImport: dict = {}
         self.Name = name
         self.Protocol = "wg" if wg else "awg"
         self.configPath = os.path.join(self.__getProtocolPath(), f'{self.Name}.conf') if wg else os.path.join(DashboardConfig.GetConfig("Server", "awg_conf_path")[1], f'{self.Name}.conf')
@@ -421,6 +466,7 @@ class WireguardConfiguration:
         self.getRestrictedPeersList()
         
     def getRawConfigurationFile(self):
+        WireguardSaveScheduler.flush(self.Name)
         return open(self.configPath, 'r').read()
     
     def updateRawConfigurationFile(self, newRawConfiguration):
@@ -487,91 +533,94 @@ class WireguardConfiguration:
             self.Status = self.getStatus()
     
     def __dropDatabase(self):
-        existingTables = [self.Name, f'{self.Name}_restrict_access', f'{self.Name}_transfer', f'{self.Name}_deleted']        
-        # existingTables = sqlSelect(f"SELECT name FROM sqlite_master WHERE type='table' AND name LIKE '{self.Name}%'").fetchall()
-        for t in existingTables:
-            sqlUpdate("DROP TABLE '%s'" % t)
-
-        # existingTables = sqlSelect(f"SELECT name FROM sqlite_master WHERE type='table' AND name LIKE '{self.Name}%'").fetchall()
+        dropPeerViews(self.Name)
+        with sqlTransaction():
+            sqlUpdate("DELETE FROM WireguardPeers WHERE configuration = ?", (self.Name, ))
+            sqlUpdate("DELETE FROM WireguardPeerTransfer WHERE configuration = ?", (self.Name, ))
 
     def createDatabase(self, dbName = None):
         if dbName is None:
             dbName = self.Name
-        
-        existingTables = sqlSelect("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
-        existingTables = [t['name'] for t in existingTables]
-        if dbName not in existingTables:
-            sqlUpdate(
-                """
-                CREATE TABLE '%s'(
-                    id VARCHAR NOT NULL, private_key VARCHAR NULL, DNS VARCHAR NULL, 
-                    endpoint_allowed_ip VARCHAR NULL, name VARCHAR NULL, total_receive FLOAT NULL, 
-                    total_sent FLOAT NULL, total_data FLOAT NULL, endpoint VARCHAR NULL, 
-                    status VARCHAR NULL, latest_handshake VARCHAR NULL, allowed_ip VARCHAR NULL, 
-                    cumu_receive FLOAT NULL, cumu_sent FLOAT NULL, cumu_data FLOAT NULL, mtu INT NULL, 
-                    keepalive INT NULL, remote_endpoint VARCHAR NULL, preshared_key VARCHAR NULL,
-                    PRIMARY KEY (id)
-                )
-                """ % dbName
-            )
-        if f'{dbName}_restrict_access' not in existingTables:
-            sqlUpdate(
-                """
-                CREATE TABLE '%s_restrict_access' (
-                    id VARCHAR NOT NULL, private_key VARCHAR NULL, DNS VARCHAR NULL, 
-                    endpoint_allowed_ip VARCHAR NULL, name VARCHAR NULL, total_receive FLOAT NULL, 
-                    total_sent FLOAT NULL, total_data FLOAT NULL, endpoint VARCHAR NULL, 
-                    status VARCHAR NULL, latest_handshake VARCHAR NULL, allowed_ip VARCHAR NULL, 
-                    cumu_receive FLOAT NULL, cumu_sent FLOAT NULL, cumu_data FLOAT NULL, mtu INT NULL, 
-                    keepalive INT NULL, remote_endpoint VARCHAR NULL, preshared_key VARCHAR NULL,
-                    PRIMARY KEY (id)
-                )
-                """ % dbName
-            )
-        if f'{dbName}_transfer' not in existingTables:
-            sqlUpdate(
-                """
-                CREATE TABLE '%s_transfer' (
-                    id VARCHAR NOT NULL, total_receive FLOAT NULL,
-                    total_sent FLOAT NULL, total_data FLOAT NULL,
-                    cumu_receive FLOAT NULL, cumu_sent FLOAT NULL, cumu_data FLOAT NULL, time DATETIME
-                )
-                """ % dbName
-            )
-        if f'{dbName}_deleted' not in existingTables:
-            sqlUpdate(
-                """
-                CREATE TABLE '%s_deleted' (
-                    id VARCHAR NOT NULL, private_key VARCHAR NULL, DNS VARCHAR NULL, 
-                    endpoint_allowed_ip VARCHAR NULL, name VARCHAR NULL, total_receive FLOAT NULL, 
-                    total_sent FLOAT NULL, total_data FLOAT NULL, endpoint VARCHAR NULL, 
-                    status VARCHAR NULL, latest_handshake VARCHAR NULL, allowed_ip VARCHAR NULL, 
-                    cumu_receive FLOAT NULL, cumu_sent FLOAT NULL, cumu_data FLOAT NULL, mtu INT NULL, 
-                    keepalive INT NULL, remote_endpoint VARCHAR NULL, preshared_key VARCHAR NULL,
-                    PRIMARY KEY (id)
-                )
-                """ % dbName
-            )
+        createPeerViews(dbName, self.getPeerColumns())
+
+    def getPeerColumns(self) -> list[str]:
+        return AWG_PEER_COLUMNS if self.Protocol == "awg" else PEER_COLUMNS
             
-    def __dumpDatabase(self):
-        for line in sqldb.iterdump():
-            if (line.startswith(f"INSERT INTO \"{self.Name}\"") 
-                    or line.startswith(f'INSERT INTO "{self.Name}_restrict_access"')
-                    or line.startswith(f'INSERT INTO "{self.Name}_transfer"')
-                    or line.startswith(f'INSERT INTO "{self.Name}_deleted"')
-            ):
-                yield line
-                
-    def __importDatabase(self, sqlFilePath) -> bool:
-        self.__dropDatabase()
-        self.createDatabase()
-        if not os.path.exists(sqlFilePath):
+    def __dumpDatabase(self, f) -> int:
+        """
+        Stream this configuration's rows into f as INSERT statements against the per-configuration views.
+        Only this configuration's rows are read, through the (configuration, state) index and inside one
+        read snapshot, so the cost follows the size of the configuration and not of the whole database
+        """
+        DatabaseWriteQueue.flush()
+        tables = [(f'{self.Name}{suffix}', "WireguardPeers", self.getPeerColumns(), "AND state = ?", (state, ))
+                  for suffix, state in PEER_STATES.items()]
+        tables.append((f'{self.Name}_transfer', "WireguardPeerTransfer", PEER_TRANSFER_COLUMNS, "", ()))
+        rows = 0
+        with Database.snapshot():
+            for view, table, columns, condition, parameters in tables:
+                values = " || ',' || ".join(f"quote({c})" for c in columns)
+                cursor = sqlSelect(f"SELECT ? || {values} || ');' FROM {table} WHERE configuration = ? {condition}",
+                                   (f'INSERT INTO "{view}" VALUES(', self.Name) + parameters)
+                while batch := cursor.fetchmany(1000):
+                    f.writelines(f'{r[0]}\n' for r in batch)
+                    rows += len(batch)
+        return rows
+
+    def __readDatabaseBackup(self, sqlFilePath) -> tuple[bool, list[str] | str]:
+        """
+        Pre-validation pass over a .sql backup. Every line has to be one complete INSERT into one of the
+        backed up configuration's views, statements are re-targeted to this configuration's views
+        """
+        s = re.match(r"^(.*)_(\d{14})\.sql$", os.path.basename(sqlFilePath))
+        source = s.group(1) if s else self.Name
+        sourceIdentifier, identifier = source.replace('"', '""'), self.Name.replace('"', '""')
+        targets = {f'INSERT INTO "{sourceIdentifier}{suffix}" VALUES(': f'INSERT INTO "{identifier}{suffix}" VALUES('
+                   for suffix in list(PEER_STATES.keys()) + ["_transfer"]}
+        statements = []
+        for n, l in enumerate(WireguardBackupStore.readLines(sqlFilePath), start=1):
+            l = l.rstrip("\n")
+            if len(l) == 0:
+                continue
+            prefix = l[:l.find(" VALUES(") + 8]
+            if prefix not in targets or not l.endswith(");") or not sqlite3.complete_statement(l):
+                return False, f"Line {n} is not an INSERT into {source}'s peers"
+            statements.append(targets[prefix] + l[len(prefix):])
+        return True, statements
+
+    def __importDatabase(self, sqlFilePath, statements: list[str] = None) -> bool:
+        """
+        Swap this configuration's rows for the backup's rows in one transaction.
+        The backup is fully validated first, a failure at any point leaves the current rows untouched
+        """
+        if statements is None:
+            if not WireguardBackupStore.exists(sqlFilePath):
+                self.__dropDatabase()
+                self.createDatabase()
+                return False
+            status, statements = self.__readDatabaseBackup(sqlFilePath)
+            if not status:
+                print(f"[WGDashboard] Cannot restore {sqlFilePath}: {statements}", flush=True)
+                return False
+        start = time.perf_counter()
+        try:
+            with sqlTransaction() as conn:
+                self.__dropDatabase()
+                self.createDatabase()
+                for statement in statements:
+                    conn.execute(statement)
+        except sqlite3.Error as e:
+            print(f"[WGDashboard] Cannot restore {sqlFilePath}: {e}", flush=True)
             return False
-        with open(sqlFilePath, 'r') as f:
-            for l in f.readlines():
-                l = l.rstrip("\n")
-                if len(l) > 0:
-                    sqlUpdate(l)
+        duration = time.perf_counter() - start
+        self.LastImport = {
+            "Source": os.path.basename(sqlFilePath),
+            "Statements": len(statements),
+            "Seconds": round(duration, 3),
+            "StatementsPerSecond": round(len(statements) / duration, 1) if duration > 0 else len(statements)
+        }
+        print(f"[WGDashboard] Restored {len(statements)} row(s) into {self.Name} in {self.LastImport['Seconds']}s "
+              f"({self.LastImport['StatementsPerSecond']}/s)", flush=True)
         return True
         
     def __getPublicKey(self) -> str:
@@ -624,47 +673,48 @@ class WireguardConfiguration:
                             if len(split) == 2:
                                 p[pCounter]["name"] = split[1]
                     
-                    for i in p:
-                        if "PublicKey" in i.keys():
-                            checkIfExist = sqlSelect("SELECT * FROM '%s' WHERE id = ?" % self.Name,
-                                                          ((i['PublicKey']),)).fetchone()
-                            if checkIfExist is None:
-                                newPeer = {
-                                    "id": i['PublicKey'],
-                                    "private_key": "",
-                                    "DNS": DashboardConfig.GetConfig("Peers", "peer_global_DNS")[1],
-                                    "endpoint_allowed_ip": DashboardConfig.GetConfig("Peers", "peer_endpoint_allowed_ip")[
-                                        1],
-                                    "name": i.get("name"),
-                                    "total_receive": 0,
-                                    "total_sent": 0,
-                                    "total_data": 0,
-                                    "endpoint": "N/A",
-                                    "status": "stopped",
-                                    "latest_handshake": "N/A",
-                                    "allowed_ip": i.get("AllowedIPs", "N/A"),
-                                    "cumu_receive": 0,
-                                    "cumu_sent": 0,
-                                    "cumu_data": 0,
-                                    "traffic": [],
-                                    "mtu": DashboardConfig.GetConfig("Peers", "peer_mtu")[1],
-                                    "keepalive": DashboardConfig.GetConfig("Peers", "peer_keep_alive")[1],
-                                    "remote_endpoint": DashboardConfig.GetConfig("Peers", "remote_endpoint")[1],
-                                    "preshared_key": i["PresharedKey"] if "PresharedKey" in i.keys() else ""
-                                }
-                                sqlUpdate(
-                                    """
-                                    INSERT INTO '%s'
-                                        VALUES (:id, :private_key, :DNS, :endpoint_allowed_ip, :name, :total_receive, :total_sent, 
-                                        :total_data, :endpoint, :status, :latest_handshake, :allowed_ip, :cumu_receive, :cumu_sent, 
-                                        :cumu_data, :mtu, :keepalive, :remote_endpoint, :preshared_key);
-                                    """ % self.Name
-                                    , newPeer)
-                                self.Peers.append(Peer(newPeer, self))
-                            else:
-                                sqlUpdate("UPDATE '%s' SET allowed_ip = ? WHERE id = ?" % self.Name,
-                                               (i.get("AllowedIPs", "N/A"), i['PublicKey'],))
-                                self.Peers.append(Peer(checkIfExist, self))
+                    with sqlTransaction():
+                        for i in p:
+                            if "PublicKey" in i.keys():
+                                checkIfExist = sqlSelect("SELECT * FROM '%s' WHERE id = ?" % self.Name,
+                                                              ((i['PublicKey']),)).fetchone()
+                                if checkIfExist is None:
+                                    newPeer = {
+                                        "id": i['PublicKey'],
+                                        "private_key": "",
+                                        "DNS": DashboardConfig.GetConfig("Peers", "peer_global_DNS")[1],
+                                        "endpoint_allowed_ip": DashboardConfig.GetConfig("Peers", "peer_endpoint_allowed_ip")[
+                                            1],
+                                        "name": i.get("name"),
+                                        "total_receive": 0,
+                                        "total_sent": 0,
+                                        "total_data": 0,
+                                        "endpoint": "N/A",
+                                        "status": "stopped",
+                                        "latest_handshake": "N/A",
+                                        "allowed_ip": i.get("AllowedIPs", "N/A"),
+                                        "cumu_receive": 0,
+                                        "cumu_sent": 0,
+                                        "cumu_data": 0,
+                                        "traffic": [],
+                                        "mtu": DashboardConfig.GetConfig("Peers", "peer_mtu")[1],
+                                        "keepalive": DashboardConfig.GetConfig("Peers", "peer_keep_alive")[1],
+                                        "remote_endpoint": DashboardConfig.GetConfig("Peers", "remote_endpoint")[1],
+                                        "preshared_key": i["PresharedKey"] if "PresharedKey" in i.keys() else ""
+                                    }
+                                    sqlUpdate(
+                                        """
+                                        INSERT INTO '%s'
+                                            VALUES (:id, :private_key, :DNS, :endpoint_allowed_ip, :name, :total_receive, :total_sent, 
+                                            :total_data, :endpoint, :status, :latest_handshake, :allowed_ip, :cumu_receive, :cumu_sent, 
+                                            :cumu_data, :mtu, :keepalive, :remote_endpoint, :preshared_key);
+                                        """ % self.Name
+                                        , newPeer)
+                                    self.Peers.append(Peer(newPeer, self))
+                                else:
+                                    sqlUpdate("UPDATE '%s' SET allowed_ip = ? WHERE id = ?" % self.Name,
+                                                   (i.get("AllowedIPs", "N/A"), i['PublicKey'],))
+                                    self.Peers.append(Peer(checkIfExist, self))
                 except Exception as e:
                     if __name__ == '__main__':
                         print(f"[WGDashboard] {self.Name} Error: {str(e)}")
@@ -674,57 +724,68 @@ class WireguardConfiguration:
             for i in checkIfExist:
                 self.Peers.append(Peer(i, self))
             
+    def setPeers(self, peers: list):
+        """
+        Set allowed IPs and preshared keys of peers on the interface with one wg set
+        """
+        presharedKeyFiles = []
+        command = [self.Protocol, "set", self.Name]
+        try:
+            for p in peers:
+                command += ["peer", p['id'], "allowed-ips", p['allowed_ip'].replace(' ', '')]
+                if len(p['preshared_key']) > 0:
+                    rd = random.Random()
+                    uid = str(uuid.UUID(int=rd.getrandbits(128), version=4))
+                    with open(uid, "w+") as f:
+                        f.write(p['preshared_key'])
+                    presharedKeyFiles.append(uid)
+                    command += ["preshared-key", uid]
+            if len(peers) > 0:
+                subprocess.check_output(command, stderr=subprocess.STDOUT)
+        finally:
+            for uid in presharedKeyFiles:
+                os.remove(uid)
+
     def addPeers(self, peers: list) -> tuple[bool, dict]:
         result = {
             "message": None,
             "peers": []
         }
         try:
-            for i in peers:
-                newPeer = {
-                    "id": i['id'],
-                    "private_key": i['private_key'],
-                    "DNS": i['DNS'],
-                    "endpoint_allowed_ip": i['endpoint_allowed_ip'],
-                    "name": i['name'],
-                    "total_receive": 0,
-                    "total_sent": 0,
-                    "total_data": 0,
-                    "endpoint": "N/A",
-                    "status": "stopped",
-                    "latest_handshake": "N/A",
-                    "allowed_ip": i.get("allowed_ip", "N/A"),
-                    "cumu_receive": 0,
-                    "cumu_sent": 0,
-                    "cumu_data": 0,
-                    "traffic": [],
-                    "mtu": i['mtu'],
-                    "keepalive": i['keepalive'],
-                    "remote_endpoint": DashboardConfig.GetConfig("Peers", "remote_endpoint")[1],
-                    "preshared_key": i["preshared_key"]
-                }
-                sqlUpdate(
-                    """
-                    INSERT INTO '%s'
-                        VALUES (:id, :private_key, :DNS, :endpoint_allowed_ip, :name, :total_receive, :total_sent, 
-                        :total_data, :endpoint, :status, :latest_handshake, :allowed_ip, :cumu_receive, :cumu_sent, 
-                        :cumu_data, :mtu, :keepalive, :remote_endpoint, :preshared_key);
-                    """ % self.Name
-                    , newPeer)
-            for p in peers:
-                presharedKeyExist = len(p['preshared_key']) > 0
-                rd = random.Random()
-                uid = str(uuid.UUID(int=rd.getrandbits(128), version=4))
-                if presharedKeyExist:
-                    with open(uid, "w+") as f:
-                        f.write(p['preshared_key'])
-                
-                subprocess.check_output(f"{self.Protocol} set {self.Name} peer {p['id']} allowed-ips {p['allowed_ip'].replace(' ', '')}{f' preshared-key {uid}' if presharedKeyExist else ''}",
-                                        shell=True, stderr=subprocess.STDOUT)
-                if presharedKeyExist:
-                    os.remove(uid)
-            subprocess.check_output(
-                f"{self.Protocol}-quick save {self.Name}", shell=True, stderr=subprocess.STDOUT)
+            with sqlTransaction():
+                for i in peers:
+                    newPeer = {
+                        "id": i['id'],
+                        "private_key": i['private_key'],
+                        "DNS": i['DNS'],
+                        "endpoint_allowed_ip": i['endpoint_allowed_ip'],
+                        "name": i['name'],
+                        "total_receive": 0,
+                        "total_sent": 0,
+                        "total_data": 0,
+                        "endpoint": "N/A",
+                        "status": "stopped",
+                        "latest_handshake": "N/A",
+                        "allowed_ip": i.get("allowed_ip", "N/A"),
+                        "cumu_receive": 0,
+                        "cumu_sent": 0,
+                        "cumu_data": 0,
+                        "traffic": [],
+                        "mtu": i['mtu'],
+                        "keepalive": i['keepalive'],
+                        "remote_endpoint": DashboardConfig.GetConfig("Peers", "remote_endpoint")[1],
+                        "preshared_key": i["preshared_key"]
+                    }
+                    sqlUpdate(
+                        """
+                        INSERT INTO '%s'
+                            VALUES (:id, :private_key, :DNS, :endpoint_allowed_ip, :name, :total_receive, :total_sent, 
+                            :total_data, :endpoint, :status, :latest_handshake, :allowed_ip, :cumu_receive, :cumu_sent, 
+                            :cumu_data, :mtu, :keepalive, :remote_endpoint, :preshared_key);
+                        """ % self.Name
+                        , newPeer)
+            self.setPeers(peers)
+            self.requestSave()
             self.getPeersList()
             for p in peers:
                 p = self.searchPeer(p['id'])
@@ -745,28 +806,30 @@ class WireguardConfiguration:
         if not self.getStatus():
             self.toggleConfiguration()
         
+        # Every peer is looked up before anything is changed, an unknown one fails the whole request
+        restricted = []
         for i in listOfPublicKeys:
             p = sqlSelect("SELECT * FROM '%s_restrict_access' WHERE id = ?" % self.Name, (i,)).fetchone()
-            if p is not None:
-                sqlUpdate("INSERT INTO '%s' SELECT * FROM '%s_restrict_access' WHERE id = ?"
-                               % (self.Name, self.Name,), (p['id'],))
-                sqlUpdate("DELETE FROM '%s_restrict_access' WHERE id = ?"
-                               % self.Name, (p['id'],))
-                
+            if p is None:
+                return ResponseObject(False, "Failed to allow access of peer " + i)
+            restricted.append(p)
+
+        with sqlTransaction():
+            for p in restricted:
+                sqlUpdate("UPDATE WireguardPeers SET state = 'active' WHERE configuration = ? AND id = ?",
+                          (self.Name, p['id'],))
+            
                 presharedKeyExist = len(p['preshared_key']) > 0
                 rd = random.Random()
                 uid = str(uuid.UUID(int=rd.getrandbits(128), version=4))
                 if presharedKeyExist:
                     with open(uid, "w+") as f:
                         f.write(p['preshared_key'])
-                        
+                    
                 subprocess.check_output(f"{self.Protocol} set {self.Name} peer {p['id']} allowed-ips {p['allowed_ip'].replace(' ', '')}{f' preshared-key {uid}' if presharedKeyExist else ''}",
                                         shell=True, stderr=subprocess.STDOUT)
                 if presharedKeyExist: os.remove(uid)
-            else:
-                return ResponseObject(False, "Failed to allow access of peer " + i)
-        if not self.__wgSave():
-            return ResponseObject(False, "Failed to save configuration through WireGuard")
+        self.requestSave()
 
         self.getPeers()
         return ResponseObject(True, "Allow access successfully")
@@ -776,23 +839,20 @@ class WireguardConfiguration:
         numOfFailedToRestrictPeers = 0
         if not self.getStatus():
             self.toggleConfiguration()
-        for p in listOfPublicKeys:
-            found, pf = self.searchPeer(p)
-            if found:
-                try:
-                    subprocess.check_output(f"{self.Protocol} set {self.Name} peer {pf.id} remove",
-                                            shell=True, stderr=subprocess.STDOUT)
-                    sqlUpdate("INSERT INTO '%s_restrict_access' SELECT * FROM '%s' WHERE id = ?" %
-                                   (self.Name, self.Name,), (pf.id,))
-                    sqlUpdate("UPDATE '%s_restrict_access' SET status = 'stopped' WHERE id = ?" %
-                                   (self.Name,), (pf.id,))
-                    sqlUpdate("DELETE FROM '%s' WHERE id = ?" % self.Name, (pf.id,))
-                    numOfRestrictedPeers += 1
-                except Exception as e:
-                    numOfFailedToRestrictPeers += 1
+        with sqlTransaction():
+            for p in listOfPublicKeys:
+                found, pf = self.searchPeer(p)
+                if found:
+                    try:
+                        subprocess.check_output(f"{self.Protocol} set {self.Name} peer {pf.id} remove",
+                                                shell=True, stderr=subprocess.STDOUT)
+                        sqlUpdate("UPDATE WireguardPeers SET state = 'restricted', status = 'stopped' "
+                                  "WHERE configuration = ? AND id = ? AND state = 'active'", (self.Name, pf.id,))
+                        numOfRestrictedPeers += 1
+                    except Exception as e:
+                        numOfFailedToRestrictPeers += 1
 
-        if not self.__wgSave():
-            return ResponseObject(False, "Failed to save configuration through WireGuard")
+        self.requestSave()
 
         self.getPeers()
 
@@ -807,19 +867,20 @@ class WireguardConfiguration:
         numOfFailedToDeletePeers = 0
         if not self.getStatus():
             self.toggleConfiguration()
-        for p in listOfPublicKeys:
-            found, pf = self.searchPeer(p)
-            if found:
-                try:
-                    subprocess.check_output(f"{self.Protocol} set {self.Name} peer {pf.id} remove",
-                                            shell=True, stderr=subprocess.STDOUT)
-                    sqlUpdate("DELETE FROM '%s' WHERE id = ?" % self.Name, (pf.id,))
-                    numOfDeletedPeers += 1
-                except Exception as e:
-                    numOfFailedToDeletePeers += 1
+        with sqlTransaction():
+            for p in listOfPublicKeys:
+                found, pf = self.searchPeer(p)
+                if found:
+                    try:
+                        subprocess.check_output(f"{self.Protocol} set {self.Name} peer {pf.id} remove",
+                                                shell=True, stderr=subprocess.STDOUT)
+                        sqlUpdate("DELETE FROM WireguardPeers WHERE configuration = ? AND id = ? AND state = 'active'",
+                                  (self.Name, pf.id,))
+                        numOfDeletedPeers += 1
+                    except Exception as e:
+                        numOfFailedToDeletePeers += 1
 
-        if not self.__wgSave():
-            return ResponseObject(False, "Failed to save configuration through WireGuard")
+        self.requestSave()
 
         self.getPeers()
         
@@ -831,6 +892,247 @@ class WireguardConfiguration:
         return ResponseObject(False,
                               f"Deleted {numOfDeletedPeers} peer(s) successfully. Failed to delete {numOfFailedToDeletePeers} peer(s)")
 
+    def batchPeerOperations(self, operations: list) -> tuple[bool, dict]:
+        """
+        Apply an ordered list of add / update / restrict / allow / delete operations.
+        Every operation is validated first, then the result is applied with one `wg set`,
+        one SQLite transaction and one `wg-quick save`. Any failure rolls all of them back.
+        """
+        result = {
+            "message": None,
+            "failedOperation": None,
+            "peers": []
+        }
+        before = {}
+        for r in sqlSelect("SELECT * FROM '%s'" % self.Name).fetchall():
+            before[r['id']] = ("active", dict(r))
+        for r in sqlSelect("SELECT * FROM '%s_restrict_access'" % self.Name).fetchall():
+            before[r['id']] = ("restricted", dict(r))
+
+        state = dict(before)
+        touched = []
+        for index, operation in enumerate(operations):
+            status, message = self.__applyBatchOperation(state, operation)
+            if not status:
+                result['message'] = message
+                result['failedOperation'] = index
+                return False, result
+            if message not in touched:
+                touched.append(message)
+
+        takenIPs = {}
+        for peerId, (_, row) in state.items():
+            for ip in row['allowed_ip'].split(','):
+                ip = ip.strip()
+                if len(ip) == 0 or ip == "N/A":
+                    continue
+                if ip in takenIPs and (peerId in touched or takenIPs[ip] in touched):
+                    result['message'] = f"Allowed IP {ip} already taken by another peer"
+                    return False, result
+                takenIPs[ip] = peerId
+
+        if not self.getStatus():
+            self.toggleConfiguration()
+        try:
+            kernelSnapshot = subprocess.check_output([self.Protocol, "showconf", self.Name],
+                                                     stderr=subprocess.STDOUT)
+            originalConfiguration = self.getRawConfigurationFile()
+        except Exception as e:
+            result['message'] = f"Failed to snapshot configuration: {str(e)}"
+            return False, result
+
+        # Rows are staged and written after the interface was changed, in one short transaction,
+        # so the database's write lock is not held while wg / wg-quick run
+        pskFiles = []
+        try:
+            statements = []
+            command = [self.Protocol, "set", self.Name]
+            for peerId in touched:
+                statements.append(("DELETE FROM '%s' WHERE id = ?" % self.Name, (peerId,)))
+                statements.append(("DELETE FROM '%s_restrict_access' WHERE id = ?" % self.Name, (peerId,)))
+                wasActive = peerId in before and before[peerId][0] == "active"
+                isActive = peerId in state and state[peerId][0] == "active"
+                if peerId in state:
+                    where, row = state[peerId]
+                    table = self.Name if where == "active" else f"{self.Name}_restrict_access"
+                    statements.append(("INSERT INTO '%s' (%s) VALUES (%s)" % (
+                        table, ", ".join(row.keys()), ", ".join(f":{k}" for k in row.keys())), row))
+                if isActive:
+                    row = state[peerId][1]
+                    psk = "/dev/null"
+                    if row['preshared_key']:
+                        psk = str(uuid.UUID(int=random.Random().getrandbits(128), version=4))
+                        with open(psk, "w+") as f:
+                            f.write(row['preshared_key'])
+                        pskFiles.append(psk)
+                    command += ["peer", peerId, "allowed-ips", row['allowed_ip'].replace(' ', ''), "preshared-key", psk]
+                elif wasActive:
+                    command += ["peer", peerId, "remove"]
+            if len(command) > 3:
+                subprocess.check_output(command, stderr=subprocess.STDOUT)
+            subprocess.check_output([f"{self.Protocol}-quick", "save", self.Name], stderr=subprocess.STDOUT)
+            with sqlTransaction() as conn:
+                for statement, parameters in statements:
+                    conn.execute(statement, parameters)
+        except Exception as e:
+            self.__rollbackBatchPeerOperations(kernelSnapshot, originalConfiguration)
+            if isinstance(e, subprocess.CalledProcessError):
+                result['message'] = e.output.decode("UTF-8").strip()
+            else:
+                result['message'] = str(e)
+            return False, result
+        finally:
+            for psk in pskFiles:
+                if os.path.exists(psk):
+                    os.remove(psk)
+
+        self.getPeers()
+        self.getRestrictedPeers()
+        for peerId in touched:
+            found, peer = self.searchPeer(peerId)
+            if found:
+                result['peers'].append(peer)
+        result['message'] = f"Applied {len(operations)} operation(s) on {len(touched)} peer(s)"
+        return True, result
+
+    def __applyBatchOperation(self, state: dict, operation: dict) -> tuple[bool, str]:
+        """
+        Apply one operation onto the in-memory peer state.
+        Return the affected peer's public key, or the reason the operation is invalid
+        """
+        action = operation.get('action')
+        editable = ["name", "private_key", "preshared_key", "DNS", "allowed_ip", "endpoint_allowed_ip",
+                    "mtu", "keepalive"]
+        if self.Protocol == "awg":
+            editable.append("advanced_security")
+        for key in ["id"] + [k for k in editable if k not in ["mtu", "keepalive"]]:
+            if key in operation.keys() and type(operation[key]) is not str:
+                return False, f"{key} must be a string"
+        for key in ["id", "private_key", "preshared_key"]:
+            if len(operation.get(key, "")) > 0 and not ValidateWireguardKey(operation[key]):
+                return False, f"{key} is not a valid WireGuard key"
+
+        if action == "add":
+            peerId = operation.get('id', "")
+            private_key = operation.get('private_key', "")
+            if len(peerId) == 0:
+                if len(private_key) == 0:
+                    private_key = GenerateWireguardPrivateKey()[1]
+                peerId = GenerateWireguardPublicKey(private_key)[1]
+            elif len(private_key) > 0 and GenerateWireguardPublicKey(private_key)[1] != peerId:
+                return False, "Provided Public Key does not match provided Private Key"
+            if peerId is None:
+                return False, "Failed to generate key pair"
+            if peerId in state:
+                return False, f"Peer {peerId} already exist"
+            if len(operation.get('allowed_ip', "")) == 0:
+                return False, f"Please specify allowed_ip for peer {peerId}"
+            row = {
+                "id": peerId,
+                "private_key": private_key,
+                "DNS": operation.get('DNS', DashboardConfig.GetConfig("Peers", "peer_global_DNS")[1]),
+                "endpoint_allowed_ip": operation.get('endpoint_allowed_ip',
+                                                     DashboardConfig.GetConfig("Peers", "peer_endpoint_allowed_ip")[1]),
+                "name": operation.get('name', ""),
+                "total_receive": 0,
+                "total_sent": 0,
+                "total_data": 0,
+                "endpoint": "N/A",
+                "status": "stopped",
+                "latest_handshake": "N/A",
+                "allowed_ip": operation['allowed_ip'],
+                "cumu_receive": 0,
+                "cumu_sent": 0,
+                "cumu_data": 0,
+                "mtu": operation.get('mtu', int(DashboardConfig.GetConfig("Peers", "peer_MTU")[1])),
+                "keepalive": operation.get('keepalive', int(DashboardConfig.GetConfig("Peers", "peer_keep_alive")[1])),
+                "remote_endpoint": DashboardConfig.GetConfig("Peers", "remote_endpoint")[1],
+                "preshared_key": operation.get('preshared_key', "")
+            }
+            if self.Protocol == "awg":
+                row['advanced_security'] = operation.get('advanced_security', "off")
+            status, message = self.__validateBatchPeer(row)
+            if not status:
+                return False, message
+            state[peerId] = ("active", row)
+            return True, peerId
+
+        peerId = operation.get('id', "")
+        if peerId not in state:
+            return False, f"Peer {peerId} does not exist"
+        where, row = state[peerId]
+
+        if action == "update":
+            if where != "active":
+                return False, f"Peer {peerId} is restricted"
+            row = dict(row)
+            for key in editable:
+                if key in operation.keys():
+                    row[key] = operation[key]
+            if row['private_key'] and GenerateWireguardPublicKey(row['private_key'])[1] != peerId:
+                return False, "Private key does not match with the public key"
+            status, message = self.__validateBatchPeer(row)
+            if not status:
+                return False, message
+            state[peerId] = ("active", row)
+        elif action == "restrict":
+            if where != "active":
+                return False, f"Peer {peerId} is already restricted"
+            row = dict(row)
+            row['status'] = "stopped"
+            state[peerId] = ("restricted", row)
+        elif action == "allow":
+            if where != "restricted":
+                return False, f"Peer {peerId} is not restricted"
+            state[peerId] = ("active", row)
+        elif action == "delete":
+            del state[peerId]
+        else:
+            return False, f"Unknown action: {action}"
+        return True, peerId
+
+    def __validateBatchPeer(self, peer: dict) -> tuple[bool, str]:
+        if not ValidateIPAddressesWithRange(peer['allowed_ip']):
+            return False, f"Allowed IPs format is incorrect for peer {peer['id']}"
+        if not ValidateIPAddressesWithRange(peer['endpoint_allowed_ip']):
+            return False, f"Endpoint Allowed IPs format is incorrect for peer {peer['id']}"
+        if len(peer['DNS']) > 0 and not ValidateDNSAddress(peer['DNS'])[0]:
+            return False, f"DNS format is incorrect for peer {peer['id']}"
+        try:
+            peer['mtu'] = int(peer['mtu'])
+            peer['keepalive'] = int(peer['keepalive'])
+        except (TypeError, ValueError):
+            return False, f"MTU / Persistent Keepalive must be numbers for peer {peer['id']}"
+        if peer['mtu'] < 0 or peer['mtu'] > 1460:
+            return False, f"MTU format is not correct for peer {peer['id']}"
+        if peer['keepalive'] < 0:
+            return False, f"Persistent Keepalive format is not correct for peer {peer['id']}"
+        if self.Protocol == "awg" and peer['advanced_security'] not in ["on", "off"]:
+            return False, "Advanced Security can only be on or off"
+        return True, None
+
+    def __rollbackBatchPeerOperations(self, kernelSnapshot: bytes, originalConfiguration: str):
+        snapshot = str(uuid.UUID(int=random.Random().getrandbits(128), version=4))
+        try:
+            with open(snapshot, "wb") as f:
+                f.write(kernelSnapshot)
+            subprocess.check_output([self.Protocol, "syncconf", self.Name, snapshot],
+                                    stderr=subprocess.STDOUT)
+        except Exception as e:
+            print(f"[WGDashboard] {self.Name} Error: Failed to restore peers in kernel: {str(e)}")
+        finally:
+            if os.path.exists(snapshot):
+                os.remove(snapshot)
+        with open(self.configPath, 'w') as f:
+            f.write(originalConfiguration)
+
+    def requestSave(self):
+        """
+        Persist the running peers into the configuration file through the debounced save scheduler,
+        a burst of edits ends up as one `wg-quick save`
+        """
+        WireguardSaveScheduler.schedule(self.Name, self.__wgSave)
+
     def __wgSave(self) -> tuple[bool, str] | tuple[bool, None]:
         try:
             subprocess.check_output(f"{self.Protocol}-quick save {self.Name}", shell=True, stderr=subprocess.STDOUT)
@@ -857,11 +1159,11 @@ class WireguardConfiguration:
             else:
                 status = "stopped"
             if int(latestHandshake[count + 1]) > 0:
-                sqlUpdate("UPDATE '%s' SET latest_handshake = ?, status = ? WHERE id= ?" % self.Name
-                              , (str(minus).split(".", maxsplit=1)[0], status, latestHandshake[count],))
+                sqlUpdateAsync("UPDATE WireguardPeers SET latest_handshake = ?, status = ? WHERE configuration = ? AND id = ?"
+                              , (str(minus).split(".", maxsplit=1)[0], status, self.Name, latestHandshake[count],))
             else:
-                sqlUpdate("UPDATE '%s' SET latest_handshake = 'No Handshake', status = ? WHERE id= ?" % self.Name
-                              , (status, latestHandshake[count],))
+                sqlUpdateAsync("UPDATE WireguardPeers SET latest_handshake = 'No Handshake', status = ? WHERE configuration = ? AND id = ?"
+                              , (status, self.Name, latestHandshake[count],))
             count += 2
     
     def getPeersTransfer(self):
@@ -875,8 +1177,8 @@ class WireguardConfiguration:
             for i in range(len(data_usage)):
                 if len(data_usage[i]) == 3:
                     cur_i = sqlSelect(
-                        "SELECT total_receive, total_sent, cumu_receive, cumu_sent, status FROM '%s' WHERE id= ? "
-                        % self.Name, (data_usage[i][0],)).fetchone()
+                        "SELECT total_receive, total_sent, cumu_receive, cumu_sent, status FROM WireguardPeers "
+                        "WHERE configuration = ? AND id = ? AND state = 'active'", (self.Name, data_usage[i][0],)).fetchone()
                     if cur_i is not None:
                         cur_i = dict(cur_i)
                         total_sent = cur_i['total_sent']
@@ -889,19 +1191,20 @@ class WireguardConfiguration:
                             total_sent = cur_total_sent
                             total_receive = cur_total_receive
                         else:
-                            sqlUpdate(
-                                "UPDATE '%s' SET cumu_receive = ?, cumu_sent = ?, cumu_data = ? WHERE id = ?" %
-                                self.Name, (cumulative_receive, cumulative_sent,
-                                            cumulative_sent + cumulative_receive,
-                                            data_usage[i][0],))
+                            sqlUpdateAsync(
+                                "UPDATE WireguardPeers SET cumu_receive = ?, cumu_sent = ?, cumu_data = ? "
+                                "WHERE configuration = ? AND id = ?", (cumulative_receive, cumulative_sent,
+                                                                      cumulative_sent + cumulative_receive,
+                                                                      self.Name, data_usage[i][0],))
                             total_sent = 0
                             total_receive = 0
                         _, p = self.searchPeer(data_usage[i][0])
                         if p.total_receive != total_receive or p.total_sent != total_sent:
-                            sqlUpdate(
-                                "UPDATE '%s' SET total_receive = ?, total_sent = ?, total_data = ? WHERE id = ?"
-                                % self.Name, (total_receive, total_sent,
-                                              total_receive + total_sent, data_usage[i][0],))
+                            sqlUpdateAsync(
+                                "UPDATE WireguardPeers SET total_receive = ?, total_sent = ?, total_data = ? "
+                                "WHERE configuration = ? AND id = ?", (total_receive, total_sent,
+                                                                      total_receive + total_sent,
+                                                                      self.Name, data_usage[i][0],))
         except Exception as e:
             print(f"[WGDashboard] {self.Name} Error: {str(e)} {str(e.__traceback__)}")
 
@@ -916,11 +1219,12 @@ class WireguardConfiguration:
         data_usage = data_usage.decode("UTF-8").split()
         count = 0
         for _ in range(int(len(data_usage) / 2)):
-            sqlUpdate("UPDATE '%s' SET endpoint = ? WHERE id = ?" % self.Name
-                          , (data_usage[count + 1], data_usage[count],))
+            sqlUpdateAsync("UPDATE WireguardPeers SET endpoint = ? WHERE configuration = ? AND id = ?"
+                          , (data_usage[count + 1], self.Name, data_usage[count],))
             count += 2
 
     def toggleConfiguration(self) -> [bool, str]:
+        WireguardSaveScheduler.flush(self.Name)
         self.getStatus()
         if self.Status:
             try:
@@ -933,6 +1237,7 @@ class WireguardConfiguration:
                 check = subprocess.check_output(f"{self.Protocol}-quick up {self.Name}", shell=True, stderr=subprocess.STDOUT)
             except subprocess.CalledProcessError as exc:
                 return False, str(exc.output.strip().decode("utf-8"))
+            enhanced_rbac_manager.push_routes.apply_configuration(self.Name)
         self.__parseConfigurationFile()
         self.getStatus()
         return True, None
@@ -968,99 +1273,121 @@ class WireguardConfiguration:
             "TotalPeers": len(self.Peers),
             "Protocol": self.Protocol,
             "Table": self.Table,
+            "PendingSave": WireguardSaveScheduler.isPending(self.Name)
         }
     
-    def backupConfigurationFile(self) -> tuple[bool, dict[str, str]]:
-        if not os.path.exists(os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup')):
-            os.mkdir(os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup'))
+    def __getBackupPath(self):
+        return os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup')
+
+    def backupConfigurationFile(self, scheduled: bool = False) -> tuple[bool, dict[str, str]]:
+        WireguardSaveScheduler.flush(self.Name)
+        if not os.path.exists(self.__getBackupPath()):
+            os.mkdir(self.__getBackupPath())
         time = datetime.now().strftime("%Y%m%d%H%M%S")
-        shutil.copy(
-            self.configPath,
-            os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup', f'{self.Name}_{time}.conf')
-        )
-        with open(os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup', f'{self.Name}_{time}.sql'), 'w+') as f:
-            for l in self.__dumpDatabase():
-                f.write(l + "\n")
-        
-        return True, {
-            "filename": f'{self.Name}_{time}.conf',
-            "backupDate": datetime.now().strftime("%Y%m%d%H%M%S")
-        }
-                     
-    def getBackups(self, databaseContent: bool = False) -> list[dict[str: str, str: str, str: str]]:
-        backups = []
-        
-        directory = os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup')
-        files = [(file, os.path.getctime(os.path.join(directory, file)))
-                 for file in os.listdir(directory) if os.path.isfile(os.path.join(directory, file))]
-        files.sort(key=lambda x: x[1], reverse=True)
-        
-        for f, ct in files:
-            if RegexMatch(f"^({self.Name})_(.*)\\.(conf)$", f):
-                s = re.search(f"^({self.Name})_(.*)\\.(conf)$", f)
-                date = s.group(2)
-                d = {
-                    "filename": f,
-                    "backupDate": date,
-                    "content": open(os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup', f), 'r').read()
-                }
-                if f.replace(".conf", ".sql") in list(os.listdir(directory)):
-                    d['database'] = True
-                    if databaseContent:
-                        d['databaseContent'] = open(os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup', f.replace(".conf", ".sql")), 'r').read()
-                backups.append(d)
-        
-        return backups
+        with WireguardBackupStore.create(self.__getBackupPath(), f'{self.Name}_{time}') as backup:
+            with backup.open(".conf") as f, open(self.configPath, 'r') as conf:
+                f.writelines(conf)
+            with backup.open(".sql") as f:
+                self.__dumpDatabase(f)
+        backup = WireguardBackupCatalog.record(self.Protocol, self.__getBackupPath(), f'{self.Name}_{time}.conf', scheduled)
+        backup['written'] = WireguardBackupStore.written(os.path.join(self.__getBackupPath(), f'{self.Name}_{time}.conf'))
+        return True, backup
+
+    def getContentChecksum(self) -> str:
+        """
+        Checksum of the configuration file and the peers' settings, traffic and handshake columns are left out
+        so a busy interface does not look changed every time
+        """
+        WireguardSaveScheduler.flush(self.Name)
+        checksum = hashlib.sha256()
+        with open(self.configPath, 'rb') as f:
+            checksum.update(f.read())
+        columns = [c for c in self.getPeerColumns() if c not in PEER_VOLATILE_COLUMNS]
+        for row in sqlSelect(f"SELECT state, {', '.join(columns)} FROM WireguardPeers WHERE configuration = ? "
+                             f"AND state != 'deleted' ORDER BY state, id", (self.Name, )).fetchall():
+            checksum.update(repr(tuple(row)).encode())
+        return checksum.hexdigest()
+
+    def getBackups(self) -> list[dict]:
+        WireguardBackupCatalog.sync(self.Protocol, self.__getBackupPath())
+        return WireguardBackupCatalog.list(self.Protocol, self.Name)
+
+    def getBackup(self, backupFileName: str) -> dict | None:
+        WireguardBackupCatalog.sync(self.Protocol, self.__getBackupPath())
+        backup = WireguardBackupCatalog.get(self.Protocol, backupFileName)
+        return backup if backup is not None and backup['configuration'] == self.Name else None
     
     def restoreBackup(self, backupFileName: str) -> bool:
-        backups = list(map(lambda x : x['filename'], self.getBackups()))
-        if backupFileName not in backups:
+        if self.getBackup(backupFileName) is None:
             return False
+        WireguardSaveScheduler.discard(self.Name)
         if self.Status:
             self.toggleConfiguration()
-        target = os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup', backupFileName)
-        targetSQL = os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup', backupFileName.replace(".conf", ".sql"))
-        if not os.path.exists(target):
+        target = os.path.join(self.__getBackupPath(), backupFileName)
+        targetSQL = os.path.join(self.__getBackupPath(), backupFileName.replace(".conf", ".sql"))
+        if not WireguardBackupStore.exists(target):
             return False
-        targetContent = open(target, 'r').read()
+        statements = []
+        if WireguardBackupStore.exists(targetSQL):
+            status, statements = self.__readDatabaseBackup(targetSQL)
+            if not status:
+                print(f"[WGDashboard] Cannot restore {targetSQL}: {statements}", flush=True)
+                return False
+        # The configuration file is staged next to the current one and only moved into place once the
+        # peers' rows have been swapped, so a failed restore leaves both the file and the rows as they were
+        temporary = f'{self.configPath}.tmp'
         try:
-            with open(self.configPath, 'w') as f:
-                f.write(targetContent)
+            with open(temporary, 'w') as f:
+                f.write(WireguardBackupStore.read(target))
+            if os.path.exists(self.configPath):
+                shutil.copymode(self.configPath, temporary)
         except Exception as e:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return False
+        if not self.__importDatabase(targetSQL, statements):
+            os.remove(temporary)
             return False
+        os.replace(temporary, self.configPath)
         self.__parseConfigurationFile()
-        self.__dropDatabase()
-        self.__importDatabase(targetSQL)
         self.__initPeersList()
         return True
     
     def deleteBackup(self, backupFileName: str) -> bool:
-        backups = list(map(lambda x : x['filename'], self.getBackups()))
-        if backupFileName not in backups:
+        if self.getBackup(backupFileName) is None:
             return False
         try:
-            os.remove(os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup', backupFileName))
+            WireguardBackupStore.delete(os.path.join(self.__getBackupPath(), backupFileName))
         except Exception as e:
             return False
+        WireguardBackupCatalog.remove(self.Protocol, backupFileName)
         return True
     
-    def downloadBackup(self, backupFileName: str) -> tuple[bool, str] | tuple[bool, None]:
-        backup = list(filter(lambda x : x['filename'] == backupFileName, self.getBackups()))
-        if len(backup) == 0:
+    def downloadBackup(self, backupFileName: str) -> tuple[bool, Any] | tuple[bool, None]:
+        """
+        Backup as a ZIP generated while it is sent, nothing is written to disk
+        """
+        backup = self.getBackup(backupFileName)
+        if backup is None:
             return False, None
-        zip = f'{str(uuid.UUID(int=random.Random().getrandbits(128), version=4))}.zip'
-        with ZipFile(os.path.join('download', zip), 'w') as zipF:
-            zipF.write(
-                os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup', backup[0]['filename']),
-                os.path.basename(os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup', backup[0]['filename']))
-            )
-            if backup[0]['database']:
-                zipF.write(
-                    os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup', backup[0]['filename'].replace('.conf', '.sql')),
-                    os.path.basename(os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup', backup[0]['filename'].replace('.conf', '.sql')))
-                )
-        
-        return True, zip
+        files = [backup['filename']] + ([backup['filename'].replace('.conf', '.sql')] if backup['database'] else [])
+        return True, zipStream(
+            (f, WireguardBackupStore.readChunks(os.path.join(self.__getBackupPath(), f))) for f in files)
+
+    def downloadAllPeers(self) -> Any:
+        """
+        Every peer's client configuration as a streamed ZIP
+        """
+        def files():
+            names = set()
+            for peer in self.Peers:
+                file = peer.downloadPeer()
+                name, n = file['fileName'], 1
+                while name in names:
+                    name, n = f"{file['fileName']}_{n}", n + 1
+                names.add(name)
+                yield f'{name}.conf', file['file']
+        return zipStream(files())
 
     def updateConfigurationSettings(self, newData: dict) -> tuple[bool, str]:
         if self.Status:
@@ -1104,10 +1431,12 @@ class WireguardConfiguration:
         return True, ""
     
     def deleteConfiguration(self):
+        WireguardSaveScheduler.discard(self.Name)
         if self.getStatus():
             self.toggleConfiguration()
         os.remove(self.configPath)
         self.__dropDatabase()
+        WireguardBackupScheduler.deleteSchedule(self.Name)
         return True
     
     def renameConfiguration(self, newConfigurationName) -> tuple[bool, str]:
@@ -1117,11 +1446,13 @@ class WireguardConfiguration:
             if self.getStatus():
                 self.toggleConfiguration()
             self.createDatabase(newConfigurationName)
-            sqlUpdate(f'INSERT INTO "{newConfigurationName}" SELECT * FROM "{self.Name}"')
-            sqlUpdate(f'INSERT INTO "{newConfigurationName}_restrict_access" SELECT * FROM "{self.Name}_restrict_access"')
-            sqlUpdate(f'INSERT INTO "{newConfigurationName}_deleted" SELECT * FROM "{self.Name}_deleted"')
-            sqlUpdate(f'INSERT INTO "{newConfigurationName}_transfer" SELECT * FROM "{self.Name}_transfer"')
+            with sqlTransaction():
+                sqlUpdate("UPDATE WireguardPeers SET configuration = ? WHERE configuration = ?",
+                          (newConfigurationName, self.Name, ))
+                sqlUpdate("UPDATE WireguardPeerTransfer SET configuration = ? WHERE configuration = ?",
+                          (newConfigurationName, self.Name, ))
             AllPeerJobs.updateJobConfigurationName(self.Name, newConfigurationName)
+            WireguardBackupScheduler.renameSchedule(self.Name, newConfigurationName)
             shutil.copy(
                 self.configPath,
                 os.path.join(self.__getProtocolPath(), f'{newConfigurationName}.conf')
@@ -1261,6 +1592,7 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             "TotalPeers": len(self.Peers),
             "Table": self.Table,
             "Protocol": self.Protocol,
+            "PendingSave": WireguardSaveScheduler.isPending(self.Name),
             "Jc": self.Jc,
             "Jmin": self.Jmin,
             "Jmax": self.Jmax,
@@ -1272,66 +1604,6 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             "H4": self.H4
         }
 
-    def createDatabase(self, dbName = None):
-        if dbName is None:
-            dbName = self.Name
-
-        existingTables = sqlSelect("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
-        existingTables = [t['name'] for t in existingTables]
-        if dbName not in existingTables:
-            sqlUpdate(
-                """
-                CREATE TABLE '%s'(
-                    id VARCHAR NOT NULL, private_key VARCHAR NULL, DNS VARCHAR NULL, advanced_security VARCHAR NULL,
-                    endpoint_allowed_ip VARCHAR NULL, name VARCHAR NULL, total_receive FLOAT NULL, 
-                    total_sent FLOAT NULL, total_data FLOAT NULL, endpoint VARCHAR NULL, 
-                    status VARCHAR NULL, latest_handshake VARCHAR NULL, allowed_ip VARCHAR NULL, 
-                    cumu_receive FLOAT NULL, cumu_sent FLOAT NULL, cumu_data FLOAT NULL, mtu INT NULL, 
-                    keepalive INT NULL, remote_endpoint VARCHAR NULL, preshared_key VARCHAR NULL,
-                    PRIMARY KEY (id)
-                )
-                """ % dbName
-            )
-
-        if f'{dbName}_restrict_access' not in existingTables:
-            sqlUpdate(
-                """
-                CREATE TABLE '%s_restrict_access' (
-                    id VARCHAR NOT NULL, private_key VARCHAR NULL, DNS VARCHAR NULL, advanced_security VARCHAR NULL, 
-                    endpoint_allowed_ip VARCHAR NULL, name VARCHAR NULL, total_receive FLOAT NULL, 
-                    total_sent FLOAT NULL, total_data FLOAT NULL, endpoint VARCHAR NULL, 
-                    status VARCHAR NULL, latest_handshake VARCHAR NULL, allowed_ip VARCHAR NULL, 
-                    cumu_receive FLOAT NULL, cumu_sent FLOAT NULL, cumu_data FLOAT NULL, mtu INT NULL, 
-                    keepalive INT NULL, remote_endpoint VARCHAR NULL, preshared_key VARCHAR NULL,
-                    PRIMARY KEY (id)
-                )
-                """ % dbName
-            )
-        if f'{dbName}_transfer' not in existingTables:
-            sqlUpdate(
-                """
-                CREATE TABLE '%s_transfer' (
-                    id VARCHAR NOT NULL, total_receive FLOAT NULL,
-                    total_sent FLOAT NULL, total_data FLOAT NULL,
-                    cumu_receive FLOAT NULL, cumu_sent FLOAT NULL, cumu_data FLOAT NULL, time DATETIME
-                )
-                """ % dbName
-            )
-        if f'{dbName}_deleted' not in existingTables:
-            sqlUpdate(
-                """
-                CREATE TABLE '%s_deleted' (
-                    id VARCHAR NOT NULL, private_key VARCHAR NULL, DNS VARCHAR NULL, advanced_security VARCHAR NULL,
-                    endpoint_allowed_ip VARCHAR NULL, name VARCHAR NULL, total_receive FLOAT NULL, 
-                    total_sent FLOAT NULL, total_data FLOAT NULL, endpoint VARCHAR NULL, 
-                    status VARCHAR NULL, latest_handshake VARCHAR NULL, allowed_ip VARCHAR NULL, 
-                    cumu_receive FLOAT NULL, cumu_sent FLOAT NULL, cumu_data FLOAT NULL, mtu INT NULL, 
-                    keepalive INT NULL, remote_endpoint VARCHAR NULL, preshared_key VARCHAR NULL,
-                    PRIMARY KEY (id)
-                )
-                """ % dbName
-            )
-
     def getPeers(self):
         if self.configurationFileChanged():
             self.Peers = []
@@ -1359,48 +1631,49 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
                             if len(split) == 2:
                                 p[pCounter]["name"] = split[1]
 
-                    for i in p:
-                        if "PublicKey" in i.keys():
-                            checkIfExist = sqlSelect("SELECT * FROM '%s' WHERE id = ?" % self.Name,
-                                                     ((i['PublicKey']),)).fetchone()
-                            if checkIfExist is None:
-                                newPeer = {
-                                    "id": i['PublicKey'],
-                                    "advanced_security": i.get('AdvancedSecurity', 'off'),
-                                    "private_key": "",
-                                    "DNS": DashboardConfig.GetConfig("Peers", "peer_global_DNS")[1],
-                                    "endpoint_allowed_ip": DashboardConfig.GetConfig("Peers", "peer_endpoint_allowed_ip")[
-                                        1],
-                                    "name": i.get("name"),
-                                    "total_receive": 0,
-                                    "total_sent": 0,
-                                    "total_data": 0,
-                                    "endpoint": "N/A",
-                                    "status": "stopped",
-                                    "latest_handshake": "N/A",
-                                    "allowed_ip": i.get("AllowedIPs", "N/A"),
-                                    "cumu_receive": 0,
-                                    "cumu_sent": 0,
-                                    "cumu_data": 0,
-                                    "traffic": [],
-                                    "mtu": DashboardConfig.GetConfig("Peers", "peer_mtu")[1],
-                                    "keepalive": DashboardConfig.GetConfig("Peers", "peer_keep_alive")[1],
-                                    "remote_endpoint": DashboardConfig.GetConfig("Peers", "remote_endpoint")[1],
-                                    "preshared_key": i["PresharedKey"] if "PresharedKey" in i.keys() else ""
-                                }
-                                sqlUpdate(
-                                    """
-                                    INSERT INTO '%s'
-                                        VALUES (:id, :private_key, :DNS, :advanced_security, :endpoint_allowed_ip, :name, :total_receive, :total_sent, 
-                                        :total_data, :endpoint, :status, :latest_handshake, :allowed_ip, :cumu_receive, :cumu_sent, 
-                                        :cumu_data, :mtu, :keepalive, :remote_endpoint, :preshared_key);
-                                    """ % self.Name
-                                    , newPeer)
-                                self.Peers.append(AmneziaWGPeer(newPeer, self))
-                            else:
-                                sqlUpdate("UPDATE '%s' SET allowed_ip = ? WHERE id = ?" % self.Name,
-                                          (i.get("AllowedIPs", "N/A"), i['PublicKey'],))
-                                self.Peers.append(AmneziaWGPeer(checkIfExist, self))
+                    with sqlTransaction():
+                        for i in p:
+                            if "PublicKey" in i.keys():
+                                checkIfExist = sqlSelect("SELECT * FROM '%s' WHERE id = ?" % self.Name,
+                                                         ((i['PublicKey']),)).fetchone()
+                                if checkIfExist is None:
+                                    newPeer = {
+                                        "id": i['PublicKey'],
+                                        "advanced_security": i.get('AdvancedSecurity', 'off'),
+                                        "private_key": "",
+                                        "DNS": DashboardConfig.GetConfig("Peers", "peer_global_DNS")[1],
+                                        "endpoint_allowed_ip": DashboardConfig.GetConfig("Peers", "peer_endpoint_allowed_ip")[
+                                            1],
+                                        "name": i.get("name"),
+                                        "total_receive": 0,
+                                        "total_sent": 0,
+                                        "total_data": 0,
+                                        "endpoint": "N/A",
+                                        "status": "stopped",
+                                        "latest_handshake": "N/A",
+                                        "allowed_ip": i.get("AllowedIPs", "N/A"),
+                                        "cumu_receive": 0,
+                                        "cumu_sent": 0,
+                                        "cumu_data": 0,
+                                        "traffic": [],
+                                        "mtu": DashboardConfig.GetConfig("Peers", "peer_mtu")[1],
+                                        "keepalive": DashboardConfig.GetConfig("Peers", "peer_keep_alive")[1],
+                                        "remote_endpoint": DashboardConfig.GetConfig("Peers", "remote_endpoint")[1],
+                                        "preshared_key": i["PresharedKey"] if "PresharedKey" in i.keys() else ""
+                                    }
+                                    sqlUpdate(
+                                        """
+                                        INSERT INTO '%s'
+                                            VALUES (:id, :private_key, :DNS, :advanced_security, :endpoint_allowed_ip, :name, :total_receive, :total_sent, 
+                                            :total_data, :endpoint, :status, :latest_handshake, :allowed_ip, :cumu_receive, :cumu_sent, 
+                                            :cumu_data, :mtu, :keepalive, :remote_endpoint, :preshared_key);
+                                        """ % self.Name
+                                        , newPeer)
+                                    self.Peers.append(AmneziaWGPeer(newPeer, self))
+                                else:
+                                    sqlUpdate("UPDATE '%s' SET allowed_ip = ? WHERE id = ?" % self.Name,
+                                              (i.get("AllowedIPs", "N/A"), i['PublicKey'],))
+                                    self.Peers.append(AmneziaWGPeer(checkIfExist, self))
                 except Exception as e:
                     if __name__ == '__main__':
                         print(f"[WGDashboard] {self.Name} Error: {str(e)}")
@@ -1416,53 +1689,41 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             "peers": []
         }
         try:
-            for i in peers:
-                newPeer = {
-                    "id": i['id'],
-                    "private_key": i['private_key'],
-                    "DNS": i['DNS'],
-                    "endpoint_allowed_ip": i['endpoint_allowed_ip'],
-                    "name": i['name'],
-                    "total_receive": 0,
-                    "total_sent": 0,
-                    "total_data": 0,
-                    "endpoint": "N/A",
-                    "status": "stopped",
-                    "latest_handshake": "N/A",
-                    "allowed_ip": i.get("allowed_ip", "N/A"),
-                    "cumu_receive": 0,
-                    "cumu_sent": 0,
-                    "cumu_data": 0,
-                    "traffic": [],
-                    "mtu": i['mtu'],
-                    "keepalive": i['keepalive'],
-                    "remote_endpoint": DashboardConfig.GetConfig("Peers", "remote_endpoint")[1],
-                    "preshared_key": i["preshared_key"],
-                    "advanced_security": i['advanced_security']
-                }
-                sqlUpdate(
-                    """
-                    INSERT INTO '%s'
-                        VALUES (:id, :private_key, :DNS, :advanced_security, :endpoint_allowed_ip, :name, :total_receive, :total_sent, 
-                        :total_data, :endpoint, :status, :latest_handshake, :allowed_ip, :cumu_receive, :cumu_sent, 
-                        :cumu_data, :mtu, :keepalive, :remote_endpoint, :preshared_key);
-                    """ % self.Name
-                    , newPeer)
-            for p in peers:
-                presharedKeyExist = len(p['preshared_key']) > 0
-                rd = random.Random()
-                uid = str(uuid.UUID(int=rd.getrandbits(128), version=4))
-                if presharedKeyExist:
-                    with open(uid, "w+") as f:
-                        f.write(p['preshared_key'])
-
-                subprocess.check_output(
-                    f"{self.Protocol} set {self.Name} peer {p['id']} allowed-ips {p['allowed_ip'].replace(' ', '')}{f' preshared-key {uid}' if presharedKeyExist else ''}",
-                                        shell=True, stderr=subprocess.STDOUT)
-                if presharedKeyExist:
-                    os.remove(uid)
-            subprocess.check_output(
-                f"{self.Protocol}-quick save {self.Name}", shell=True, stderr=subprocess.STDOUT)
+            with sqlTransaction():
+                for i in peers:
+                    newPeer = {
+                        "id": i['id'],
+                        "private_key": i['private_key'],
+                        "DNS": i['DNS'],
+                        "endpoint_allowed_ip": i['endpoint_allowed_ip'],
+                        "name": i['name'],
+                        "total_receive": 0,
+                        "total_sent": 0,
+                        "total_data": 0,
+                        "endpoint": "N/A",
+                        "status": "stopped",
+                        "latest_handshake": "N/A",
+                        "allowed_ip": i.get("allowed_ip", "N/A"),
+                        "cumu_receive": 0,
+                        "cumu_sent": 0,
+                        "cumu_data": 0,
+                        "traffic": [],
+                        "mtu": i['mtu'],
+                        "keepalive": i['keepalive'],
+                        "remote_endpoint": DashboardConfig.GetConfig("Peers", "remote_endpoint")[1],
+                        "preshared_key": i["preshared_key"],
+                        "advanced_security": i['advanced_security']
+                    }
+                    sqlUpdate(
+                        """
+                        INSERT INTO '%s'
+                            VALUES (:id, :private_key, :DNS, :advanced_security, :endpoint_allowed_ip, :name, :total_receive, :total_sent, 
+                            :total_data, :endpoint, :status, :latest_handshake, :allowed_ip, :cumu_receive, :cumu_sent, 
+                            :cumu_data, :mtu, :keepalive, :remote_endpoint, :preshared_key);
+                        """ % self.Name
+                        , newPeer)
+            self.setPeers(peers)
+            self.requestSave()
             self.getPeersList()
             for p in peers:
                 p = self.searchPeer(p['id'])
@@ -1560,11 +1821,7 @@ class Peer:
             if len(updateAllowedIp.decode().strip("\n")) != 0:
                 return ResponseObject(False,
                                       "Update peer failed when updating Allowed IPs")
-            saveConfig = subprocess.check_output(f"{self.configuration.Protocol}-quick save {self.configuration.Name}",
-                                                 shell=True, stderr=subprocess.STDOUT)
-            if f"wg showconf {self.configuration.Name}" not in saveConfig.decode().strip('\n'):
-                return ResponseObject(False,
-                                      "Update peer failed when saving the configuration")
+            self.configuration.requestSave()
             sqlUpdate(
                 '''UPDATE '%s' SET name = ?, private_key = ?, DNS = ?, endpoint_allowed_ip = ?, mtu = ?, 
                 keepalive = ?, preshared_key = ? WHERE id = ?''' % self.configuration.Name,
@@ -1758,11 +2015,7 @@ Endpoint = {DashboardConfig.GetConfig("Peers", "remote_endpoint")[1]}:{self.conf
             if len(updateAllowedIp.decode().strip("\n")) != 0:
                 return ResponseObject(False,
                                       "Update peer failed when updating Allowed IPs")
-            saveConfig = subprocess.check_output(f"{self.configuration.Protocol}-quick save {self.configuration.Name}",
-                                                 shell=True, stderr=subprocess.STDOUT)
-            if f"wg showconf {self.configuration.Name}" not in saveConfig.decode().strip('\n'):
-                return ResponseObject(False,
-                                      "Update peer failed when saving the configuration")
+            self.configuration.requestSave()
             sqlUpdate(
                 '''UPDATE '%s' SET name = ?, private_key = ?, DNS = ?, endpoint_allowed_ip = ?, mtu = ?, 
                 keepalive = ?, preshared_key = ?, advanced_security = ?  WHERE id = ?''' % self.configuration.Name,
@@ -1817,7 +2070,9 @@ class DashboardConfig:
                 "dashboard_sort": "status",
                 "dashboard_theme": "dark",
                 "dashboard_api_key": "false",
-                "dashboard_language": "en"
+                "dashboard_language": "en",
+                "firewall_backend": "auto",
+                "firewall_accounting_interval": "60"
             },
             "Peers": {
                 "peer_global_DNS": "1.1.1.1",
@@ -2004,35 +2259,180 @@ class DashboardConfig:
 Database Connection Functions
 """
 
-sqldb = sqlite3.connect(os.path.join(CONFIGURATION_PATH, 'db', 'wgdashboard.db'), check_same_thread=False)
-sqldb.row_factory = sqlite3.Row
+Database = DashboardDatabase(os.path.join(CONFIGURATION_PATH, 'db', 'wgdashboard.db'))
+DatabaseWriteQueue = DatabaseWriter(Database)
+atexit.register(DatabaseWriteQueue.flush, 10)
+WireguardBackupStore = BackupStore()
+WireguardBackupCatalog = BackupCatalog(Database, WireguardBackupStore)
+WireguardBackupScheduler = BackupScheduler(Database, lambda name: WireguardConfigurations.get(name))
 
 def sqlSelect(statement: str, paramters: tuple = ()) -> sqlite3.Cursor:
     result = []
     try:
-        cursor = sqldb.cursor()
-        result = cursor.execute(statement, paramters)
+        result = Database.select(statement, paramters)
     except Exception as error:
         print("[WGDashboard] SQLite Error:" + str(error) + " | Statement: " + statement)
     return result
 
-def sqlUpdate(statement: str, paramters: tuple = ()) -> sqlite3.Cursor:
-    sqldb = sqlite3.connect(os.path.join(CONFIGURATION_PATH, 'db', 'wgdashboard.db'))
-    sqldb.row_factory = sqlite3.Row
-    cursor = sqldb.cursor()
-    with sqldb:
-        cursor = sqldb.cursor()
-        try:
-            statement = statement.rstrip(';')
-            s = f'BEGIN TRANSACTION;{statement};END TRANSACTION;'
-            cursor.execute(statement, paramters)
-            # sqldb.commit()
-        except Exception as error:
-            print("[WGDashboard] SQLite Error:" + str(error) + " | Statement: " + statement)
-    sqldb.close()
+def sqlUpdate(statement: str, paramters: tuple = ()):
+    """
+    Inside a sqlTransaction() scope the statement joins that transaction,
+    otherwise it goes through the single writer and returns once committed.
+    Errors inside a transaction are raised so the whole transaction rolls back
+    """
+    if Database.inTransaction():
+        return Database.update(statement, paramters)
+    try:
+        return DatabaseWriteQueue.execute(statement, paramters)
+    except Exception as error:
+        print("[WGDashboard] SQLite Error:" + str(error) + " | Statement: " + statement)
+
+def sqlUpdateAsync(statement: str, paramters: tuple = ()) -> Future:
+    """
+    Queue a write without waiting for it, used by the background threads
+    """
+    def report(f: Future):
+        if f.exception() is not None:
+            print("[WGDashboard] SQLite Error:" + str(f.exception()) + " | Statement: " + statement)
+    future = DatabaseWriteQueue.submit(statement, paramters)
+    future.add_done_callback(report)
+    return future
+
+def sqlTransaction():
+    """
+    Run several statements in one transaction, rollback everything if any of them fail.
+    sqlSelect / sqlUpdate called inside the scope on the same thread join the transaction
+    """
+    return Database.transaction()
+
+"""
+Peers Schema
+All peers of every configuration live in WireguardPeers, keyed by (configuration, id) with a state column.
+Every configuration still gets `<name>`, `<name>_restrict_access`, `<name>_deleted` and `<name>_transfer`
+as views with INSTEAD OF triggers, so old backups and existing statements keep working.
+"""
+
+PEER_COLUMNS = ["id", "private_key", "DNS", "endpoint_allowed_ip", "name", "total_receive", "total_sent",
+                "total_data", "endpoint", "status", "latest_handshake", "allowed_ip", "cumu_receive", "cumu_sent",
+                "cumu_data", "mtu", "keepalive", "remote_endpoint", "preshared_key"]
+AWG_PEER_COLUMNS = PEER_COLUMNS[:3] + ["advanced_security"] + PEER_COLUMNS[3:]
+PEER_TRANSFER_COLUMNS = ["id", "total_receive", "total_sent", "total_data", "cumu_receive", "cumu_sent",
+                         "cumu_data", "time"]
+PEER_STATES = {"": "active", "_restrict_access": "restricted", "_deleted": "deleted"}
+PEER_VOLATILE_COLUMNS = ["total_receive", "total_sent", "total_data", "endpoint", "status", "latest_handshake",
+                         "cumu_receive", "cumu_sent", "cumu_data"]
+
+def createPeersSchema():
+    with sqlTransaction():
+        sqlUpdate(
+            """
+            CREATE TABLE IF NOT EXISTS WireguardPeers (
+                configuration VARCHAR NOT NULL, id VARCHAR NOT NULL, state VARCHAR NOT NULL DEFAULT 'active',
+                private_key VARCHAR NULL, DNS VARCHAR NULL, advanced_security VARCHAR NULL,
+                endpoint_allowed_ip VARCHAR NULL, name VARCHAR NULL, total_receive FLOAT NULL,
+                total_sent FLOAT NULL, total_data FLOAT NULL, endpoint VARCHAR NULL,
+                status VARCHAR NULL, latest_handshake VARCHAR NULL, allowed_ip VARCHAR NULL,
+                cumu_receive FLOAT NULL, cumu_sent FLOAT NULL, cumu_data FLOAT NULL, mtu INT NULL,
+                keepalive INT NULL, remote_endpoint VARCHAR NULL, preshared_key VARCHAR NULL,
+                PRIMARY KEY (configuration, id)
+            )
+            """
+        )
+        sqlUpdate("CREATE INDEX IF NOT EXISTS WireguardPeers_configuration_state ON WireguardPeers (configuration, state)")
+        sqlUpdate("CREATE INDEX IF NOT EXISTS WireguardPeers_id ON WireguardPeers (id)")
+        sqlUpdate(
+            """
+            CREATE TABLE IF NOT EXISTS WireguardPeerTransfer (
+                configuration VARCHAR NOT NULL, id VARCHAR NOT NULL, time DATETIME NOT NULL,
+                total_receive FLOAT NULL, total_sent FLOAT NULL, total_data FLOAT NULL,
+                cumu_receive FLOAT NULL, cumu_sent FLOAT NULL, cumu_data FLOAT NULL,
+                PRIMARY KEY (configuration, id, time)
+            )
+            """
+        )
+
+def createPeerViews(name: str, columns: list[str]):
+    identifier = name.replace('"', '""')
+    literal = name.replace("'", "''")
+    with sqlTransaction():
+        for suffix, state in PEER_STATES.items():
+            view = f'"{identifier}{suffix}"'
+            sqlUpdate(f"""CREATE VIEW IF NOT EXISTS {view} AS SELECT {', '.join(columns)} FROM WireguardPeers
+                          WHERE configuration = '{literal}' AND state = '{state}'""")
+            sqlUpdate(f"""CREATE TRIGGER IF NOT EXISTS "{identifier}{suffix}_insert" INSTEAD OF INSERT ON {view}
+                          BEGIN
+                            INSERT INTO WireguardPeers (configuration, state, {', '.join(columns)})
+                            VALUES ('{literal}', '{state}', {', '.join(f'NEW.{c}' for c in columns)})
+                            ON CONFLICT (configuration, id) DO UPDATE SET state = excluded.state,
+                            {', '.join(f'{c} = excluded.{c}' for c in columns if c != 'id')};
+                          END""")
+            sqlUpdate(f"""CREATE TRIGGER IF NOT EXISTS "{identifier}{suffix}_update" INSTEAD OF UPDATE ON {view}
+                          BEGIN
+                            UPDATE WireguardPeers SET {', '.join(f'{c} = NEW.{c}' for c in columns)}
+                            WHERE configuration = '{literal}' AND id = OLD.id AND state = '{state}';
+                          END""")
+            sqlUpdate(f"""CREATE TRIGGER IF NOT EXISTS "{identifier}{suffix}_delete" INSTEAD OF DELETE ON {view}
+                          BEGIN
+                            DELETE FROM WireguardPeers
+                            WHERE configuration = '{literal}' AND id = OLD.id AND state = '{state}';
+                          END""")
+        view = f'"{identifier}_transfer"'
+        sqlUpdate(f"""CREATE VIEW IF NOT EXISTS {view} AS SELECT {', '.join(PEER_TRANSFER_COLUMNS)}
+                      FROM WireguardPeerTransfer WHERE configuration = '{literal}'""")
+        sqlUpdate(f"""CREATE TRIGGER IF NOT EXISTS "{identifier}_transfer_insert" INSTEAD OF INSERT ON {view}
+                      BEGIN
+                        INSERT OR REPLACE INTO WireguardPeerTransfer (configuration, {', '.join(PEER_TRANSFER_COLUMNS)})
+                        VALUES ('{literal}', {', '.join(f'NEW.{c}' for c in PEER_TRANSFER_COLUMNS)});
+                      END""")
+        sqlUpdate(f"""CREATE TRIGGER IF NOT EXISTS "{identifier}_transfer_delete" INSTEAD OF DELETE ON {view}
+                      BEGIN
+                        DELETE FROM WireguardPeerTransfer
+                        WHERE configuration = '{literal}' AND id = OLD.id AND time = OLD.time;
+                      END""")
+
+def dropPeerViews(name: str):
+    identifier = name.replace('"', '""')
+    with sqlTransaction():
+        for suffix in list(PEER_STATES.keys()) + ["_transfer"]:
+            sqlUpdate(f'DROP VIEW IF EXISTS "{identifier}{suffix}"')
+
+def migrateLegacyPeerTables():
+    """
+    One-shot migration from the old four-tables-per-configuration layout into WireguardPeers / WireguardPeerTransfer
+    """
+    tables = [t['name'] for t in sqlSelect("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()]
+    legacy = [t for t in tables if f'{t}_restrict_access' in tables and f'{t}_deleted' in tables]
+    if len(legacy) == 0:
+        return
+    migrated = 0
+    with sqlTransaction():
+        for name in legacy:
+            for suffix, state in PEER_STATES.items():
+                table = f'{name}{suffix}'
+                existing = [c['name'] for c in sqlSelect(f"PRAGMA table_info(\"{table}\")").fetchall()]
+                columns = [c for c in AWG_PEER_COLUMNS if c in existing]
+                Database.update(f"""INSERT OR IGNORE INTO WireguardPeers (configuration, state, {', '.join(columns)})
+                                    SELECT ?, ?, {', '.join(columns)} FROM "{table}" """, (name, state))
+                migrated += Database.select(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                Database.update(f'DROP TABLE "{table}"')
+            if f'{name}_transfer' in tables:
+                Database.update(f"""INSERT OR IGNORE INTO WireguardPeerTransfer (configuration, {', '.join(PEER_TRANSFER_COLUMNS)})
+                                    SELECT ?, {', '.join(PEER_TRANSFER_COLUMNS)} FROM "{name}_transfer"
+                                    WHERE time IS NOT NULL""", (name, ))
+                Database.update(f'DROP TABLE "{name}_transfer"')
+    print(f"[WGDashboard] Migrated {migrated} peer(s) of {len(legacy)} configuration(s) into WireguardPeers")
+
+createPeersSchema()
+migrateLegacyPeerTables()
 
 DashboardConfig = DashboardConfig()
 EmailSender = EmailSender(DashboardConfig)
+FirewallBackend = get_firewall_backend(DashboardConfig.GetConfig("Server", "firewall_backend")[1])
+FirewallManager.set_backend(FirewallBackend)
+RBACManager.set_backend(FirewallBackend)
+FirewallManager.reconciler.set_rbac_manager(RBACManager)
+FirewallTrafficAccounting = FirewallAccounting(Database, FirewallManager,
+                                               int(DashboardConfig.GetConfig("Server", "firewall_accounting_interval")[1]))
 _, APP_PREFIX = DashboardConfig.GetConfig("Server", "app_prefix")
 cors = CORS(app, resources={rf"{APP_PREFIX}/api/*": {
     "origins": "*",
@@ -2106,6 +2506,16 @@ def auth_req():
                 response.status_code = 401
                 return response
 
+def sessionRequired():
+    """
+    Session check for endpoints under a whitelisted path prefix that must not be public,
+    returns the 401 response to send or None
+    """
+    if (not DashboardConfig.GetConfig("Server", "auth_req")[1]
+            or DashboardConfig.APIAccessed or "username" in session):
+        return None
+    return ResponseObject(False, "Unauthorized access.", status_code=401)
+
 @app.route(f'{APP_PREFIX}/api/handshake', methods=["GET", "OPTIONS"])
 def API_Handshake():
     return ResponseObject(True)
@@ -2232,19 +2642,17 @@ def API_addWireguardConfiguration():
             "awg": DashboardConfig.GetConfig("Server", "awg_conf_path")[1]
         }
      
-        if (os.path.exists(os.path.join(path['wg'], 'WGDashboard_Backup', data["Backup"])) and
-                os.path.exists(os.path.join(path['wg'], 'WGDashboard_Backup', data["Backup"].replace('.conf', '.sql')))):
+        if (WireguardBackupStore.exists(os.path.join(path['wg'], 'WGDashboard_Backup', data["Backup"])) and
+                WireguardBackupStore.exists(os.path.join(path['wg'], 'WGDashboard_Backup', data["Backup"].replace('.conf', '.sql')))):
             protocol = "wg"
-        elif (os.path.exists(os.path.join(path['awg'], 'WGDashboard_Backup', data["Backup"])) and
-              os.path.exists(os.path.join(path['awg'], 'WGDashboard_Backup', data["Backup"].replace('.conf', '.sql')))):
+        elif (WireguardBackupStore.exists(os.path.join(path['awg'], 'WGDashboard_Backup', data["Backup"])) and
+              WireguardBackupStore.exists(os.path.join(path['awg'], 'WGDashboard_Backup', data["Backup"].replace('.conf', '.sql')))):
             protocol = "awg"
         else:
             return ResponseObject(False, "Backup does not exist")
         
-        shutil.copy(
-            os.path.join(path[protocol], 'WGDashboard_Backup', data["Backup"]),
-            os.path.join(path[protocol], f'{data["ConfigurationName"]}.conf')
-        )
+        with open(os.path.join(path[protocol], f'{data["ConfigurationName"]}.conf'), 'w') as f:
+            f.write(WireguardBackupStore.read(os.path.join(path[protocol], 'WGDashboard_Backup', data["Backup"])))
         WireguardConfigurations[data['ConfigurationName']] = WireguardConfiguration(data=data, name=data['ConfigurationName']) if protocol == 'wg' else AmneziaWireguardConfiguration(data=data, name=data['ConfigurationName'])
     else:
         WireguardConfigurations[data['ConfigurationName']] = WireguardConfiguration(data=data) if data.get('Protocol') == 'wg' else AmneziaWireguardConfiguration(data=data)
@@ -2352,12 +2760,39 @@ def API_getWireguardConfigurationRealtimeTraffic():
         return ResponseObject(False, "Configuration does not exist", status_code=404)
     return ResponseObject(data=WireguardConfigurations[configurationName].getRealtimeTrafficUsage())
 
+@app.get(f'{APP_PREFIX}/api/getWireguardConfigurationSaveStatus')
+def API_getWireguardConfigurationSaveStatus():
+    return ResponseObject(data=WireguardSaveScheduler)
+
+@app.get(f'{APP_PREFIX}/api/getDatabaseStatus')
+def API_getDatabaseStatus():
+    return ResponseObject(data={
+        "Database": Database,
+        "Writer": DatabaseWriteQueue
+    })
+
+def BackupListing(backups: list[dict], databaseContent: bool = False) -> list[dict]:
+    """
+    Backup listings carry the backups' file content unless the request asks for ?content=false,
+    which is the response shape the bundled dist/ still reads. Metadata only listings are used by
+    the Vue sources, which fetch content through getWireguardConfigurationBackupContent
+    """
+    if request.args.get('content', 'true') == 'false':
+        return backups
+    for b in backups:
+        directory = os.path.join(DashboardConfig.GetConfig("Server", f"{b['protocol']}_conf_path")[1], 'WGDashboard_Backup')
+        b['content'] = WireguardBackupStore.read(os.path.join(directory, b['filename']))
+        if b['database'] and databaseContent:
+            b['databaseContent'] = WireguardBackupStore.read(
+                os.path.join(directory, b['filename'].replace('.conf', '.sql')))
+    return backups
+
 @app.get(f'{APP_PREFIX}/api/getWireguardConfigurationBackup')
 def API_getWireguardConfigurationBackup():
     configurationName = request.args.get('configurationName')
     if configurationName is None or configurationName not in WireguardConfigurations.keys():
         return ResponseObject(False, "Configuration does not exist",  status_code=404)
-    return ResponseObject(data=WireguardConfigurations[configurationName].getBackups())
+    return ResponseObject(data=BackupListing(WireguardConfigurations[configurationName].getBackups()))
 
 @app.get(f'{APP_PREFIX}/api/getAllWireguardConfigurationBackup')
 def API_getAllWireguardConfigurationBackup():
@@ -2365,46 +2800,92 @@ def API_getAllWireguardConfigurationBackup():
         "ExistingConfigurations": {},
         "NonExistingConfigurations": {}
     }
-    existingConfiguration = WireguardConfigurations.keys()
-    for i in existingConfiguration:
-        b = WireguardConfigurations[i].getBackups(True)
-        if len(b) > 0:
-            data['ExistingConfigurations'][i] = WireguardConfigurations[i].getBackups(True)
-            
     for protocol in ProtocolsEnabled():
-        directory = os.path.join(DashboardConfig.GetConfig("Server", f"{protocol}_conf_path")[1], 'WGDashboard_Backup')
-        files = [(file, os.path.getctime(os.path.join(directory, file)))
-                 for file in os.listdir(directory) if os.path.isfile(os.path.join(directory, file))]
-        files.sort(key=lambda x: x[1], reverse=True)
-    
-        for f, ct in files:
-            if RegexMatch(r"^(.*)_(.*)\.(conf)$", f):
-                s = re.search(r"^(.*)_(.*)\.(conf)$", f)
-                name = s.group(1)
-                if name not in existingConfiguration:
-                    if name not in data['NonExistingConfigurations'].keys():
-                        data['NonExistingConfigurations'][name] = []
-                    
-                    date = s.group(2)
-                    d = {
-                        "protocol": protocol,
-                        "filename": f,
-                        "backupDate": date,
-                        "content": open(os.path.join(DashboardConfig.GetConfig("Server", f"{protocol}_conf_path")[1], 'WGDashboard_Backup', f), 'r').read()
-                    }
-                    if f.replace(".conf", ".sql") in list(os.listdir(directory)):
-                        d['database'] = True
-                        d['databaseContent'] = open(os.path.join(DashboardConfig.GetConfig("Server", f"{protocol}_conf_path")[1], 'WGDashboard_Backup', f.replace(".conf", ".sql")), 'r').read()
-                    data['NonExistingConfigurations'][name].append(d)
+        WireguardBackupCatalog.sync(protocol, os.path.join(
+            DashboardConfig.GetConfig("Server", f"{protocol}_conf_path")[1], 'WGDashboard_Backup'))
+        for b in WireguardBackupCatalog.list(protocol):
+            name = b['configuration']
+            if name not in WireguardConfigurations.keys():
+                data['NonExistingConfigurations'].setdefault(name, []).append(b)
+            elif WireguardConfigurations[name].Protocol == protocol:
+                data['ExistingConfigurations'].setdefault(name, []).append(b)
+    for backups in list(data['ExistingConfigurations'].values()) + list(data['NonExistingConfigurations'].values()):
+        BackupListing(backups, databaseContent=True)
     return ResponseObject(data=data)
 
+@app.get(f'{APP_PREFIX}/api/getWireguardConfigurationBackupContent')
+def API_getWireguardConfigurationBackupContent():
+    protocol = request.args.get('protocol')
+    backupFileName = request.args.get('backupFileName')
+    if protocol not in ProtocolsEnabled() or backupFileName is None:
+        return ResponseObject(False, "Please provide protocol and backupFileName", status_code=400)
+    directory = os.path.join(DashboardConfig.GetConfig("Server", f"{protocol}_conf_path")[1], 'WGDashboard_Backup')
+    WireguardBackupCatalog.sync(protocol, directory)
+    backup = WireguardBackupCatalog.get(protocol, backupFileName)
+    if backup is None:
+        return ResponseObject(False, "Backup does not exist", status_code=404)
+    backup['content'] = WireguardBackupStore.read(os.path.join(directory, backup['filename']))
+    if backup['database'] and request.args.get('database', 'false') == 'true':
+        backup['databaseContent'] = WireguardBackupStore.read(
+            os.path.join(directory, backup['filename'].replace('.conf', '.sql')))
+    return ResponseObject(data=backup)
+
+@app.get(f'{APP_PREFIX}/api/getWireguardConfigurationBackupStoreStatus')
+def API_getWireguardConfigurationBackupStoreStatus():
+    return ResponseObject(data={
+        protocol: WireguardBackupStore.toJson(os.path.join(
+            DashboardConfig.GetConfig("Server", f"{protocol}_conf_path")[1], 'WGDashboard_Backup'))
+        for protocol in ProtocolsEnabled()
+    })
+
+@app.get(f'{APP_PREFIX}/api/getWireguardConfigurationBackupSchedules')
+def API_getWireguardConfigurationBackupSchedules():
+    return ResponseObject(data=WireguardBackupScheduler)
+
+@app.get(f'{APP_PREFIX}/api/getWireguardConfigurationBackupSchedule')
+def API_getWireguardConfigurationBackupSchedule():
+    configurationName = request.args.get('configurationName')
+    if configurationName is None or configurationName not in WireguardConfigurations.keys():
+        return ResponseObject(False, "Configuration does not exist", status_code=404)
+    return ResponseObject(data=WireguardBackupScheduler.getSchedule(configurationName))
+
+@app.post(f'{APP_PREFIX}/api/updateWireguardConfigurationBackupSchedule')
+def API_updateWireguardConfigurationBackupSchedule():
+    data = request.get_json()
+    configurationName = data.get('ConfigurationName')
+    if configurationName is None or configurationName not in WireguardConfigurations.keys():
+        return ResponseObject(False, "Configuration does not exist", status_code=404)
+    status, message = WireguardBackupScheduler.setSchedule(
+        configurationName, data.get('Interval'), data.get('Cron'), data.get('KeepCount'), data.get('KeepDays'),
+        bool(data.get('Enabled', True)))
+    if not status:
+        return ResponseObject(False, message, status_code=400)
+    return ResponseObject(data=WireguardBackupScheduler.getSchedule(configurationName))
+
+@app.post(f'{APP_PREFIX}/api/deleteWireguardConfigurationBackupSchedule')
+def API_deleteWireguardConfigurationBackupSchedule():
+    data = request.get_json()
+    configurationName = data.get('ConfigurationName')
+    if configurationName is None or WireguardBackupScheduler.getSchedule(configurationName) is None:
+        return ResponseObject(False, "Backup schedule does not exist", status_code=404)
+    WireguardBackupScheduler.deleteSchedule(configurationName)
+    return ResponseObject()
+
+@app.post(f'{APP_PREFIX}/api/runWireguardConfigurationBackupSchedule')
+def API_runWireguardConfigurationBackupSchedule():
+    data = request.get_json()
+    configurationName = data.get('ConfigurationName')
+    if configurationName is None or not WireguardBackupScheduler.runNow(configurationName):
+        return ResponseObject(False, "Backup schedule does not exist", status_code=404)
+    return ResponseObject(message="Backup scheduled")
+
 @app.get(f'{APP_PREFIX}/api/createWireguardConfigurationBackup')
 def API_createWireguardConfigurationBackup():
     configurationName = request.args.get('configurationName')
     if configurationName is None or configurationName not in WireguardConfigurations.keys():
         return ResponseObject(False, "Configuration does not exist",  status_code=404)
     return ResponseObject(status=WireguardConfigurations[configurationName].backupConfigurationFile()[0], 
-                          data=WireguardConfigurations[configurationName].getBackups())
+                          data=BackupListing(WireguardConfigurations[configurationName].getBackups()))
 
 @app.post(f'{APP_PREFIX}/api/deleteWireguardConfigurationBackup')
 def API_deleteWireguardConfigurationBackup():
@@ -2426,12 +2907,29 @@ def API_deleteWireguardConfigurationBackup():
 
 @app.get(f'{APP_PREFIX}/api/downloadWireguardConfigurationBackup')
 def API_downloadWireguardConfigurationBackup():
+    """
+    Keeps the backup's ZIP in memory and answers with its name for /fileDownload, which hands it out once.
+    Kept for the bundled UI; downloadWireguardConfigurationBackupArchive streams it instead
+    """
     configurationName = request.args.get('configurationName')
     backupFileName = request.args.get('backupFileName')
     if configurationName is None or configurationName not in WireguardConfigurations.keys():
         return ResponseObject(False, "Configuration does not exist", status_code=404)
-    status, zip = WireguardConfigurations[configurationName].downloadBackup(backupFileName)
-    return ResponseObject(status, data=zip, status_code=(200 if status else 404))
+    status, archive = WireguardConfigurations[configurationName].downloadBackup(backupFileName)
+    if not status:
+        return ResponseObject(False, "Backup does not exist", status_code=404)
+    return ResponseObject(data=AllPendingDownloads.add(b''.join(archive), '.zip'))
+
+@app.get(f'{APP_PREFIX}/api/downloadWireguardConfigurationBackupArchive')
+def API_downloadWireguardConfigurationBackupArchive():
+    configurationName = request.args.get('configurationName')
+    backupFileName = request.args.get('backupFileName')
+    if configurationName is None or configurationName not in WireguardConfigurations.keys():
+        return ResponseObject(False, "Configuration does not exist", status_code=404)
+    status, archive = WireguardConfigurations[configurationName].downloadBackup(backupFileName)
+    if not status:
+        return ResponseObject(False, "Backup does not exist", status_code=404)
+    return ZipResponse(archive, backupFileName.replace('.conf', '.zip'))
 
 @app.post(f'{APP_PREFIX}/api/restoreWireguardConfigurationBackup')
 def API_restoreWireguardConfigurationBackup():
@@ -2448,7 +2946,8 @@ def API_restoreWireguardConfigurationBackup():
         return ResponseObject(False, "Configuration does not exist", status_code=404)
     
     status = WireguardConfigurations[configurationName].restoreBackup(backupFileName)
-    return ResponseObject(status=status, message=(None if status else 'Restore backup failed'))
+    return ResponseObject(status=status, message=(None if status else 'Restore backup failed'),
+                          data=(WireguardConfigurations[configurationName].LastImport if status else None))
     
 @app.get(f'{APP_PREFIX}/api/getDashboardConfiguration')
 def API_getDashboardConfiguration():
@@ -2635,6 +3134,20 @@ def API_allowAccessPeers(configName: str) -> ResponseObject:
         return configuration.allowAccessPeers(peers)
     return ResponseObject(False, "Configuration does not exist")
 
+@app.post(f'{APP_PREFIX}/api/batchPeerOperations/<configName>')
+def API_batchPeerOperations(configName: str) -> ResponseObject:
+    data = request.get_json()
+    operations = data.get('operations', [])
+    if configName not in WireguardConfigurations.keys():
+        return ResponseObject(False, "Configuration does not exist", status_code=404)
+    if type(operations) is not list or len(operations) == 0:
+        return ResponseObject(False, "Please specify one or more operations", status_code=400)
+    if len(list(filter(lambda x: type(x) is not dict, operations))) > 0:
+        return ResponseObject(False, "Each operation must be an object", status_code=400)
+    status, result = WireguardConfigurations.get(configName).batchPeerOperations(operations)
+    return ResponseObject(status=status, message=result['message'], data=result,
+                          status_code=(200 if status else 400))
+
 @app.post(f'{APP_PREFIX}/api/addPeers/<configName>')
 def API_addPeers(configName):
     if configName in WireguardConfigurations.keys():
@@ -2799,6 +3312,12 @@ def API_downloadAllPeers(configName):
         peerData.append(file)
     return ResponseObject(data=peerData)
 
+@app.get(f"{APP_PREFIX}/api/peerConfigurationsArchive/<configName>")
+def API_peerConfigurationsArchive(configName):
+    if configName not in WireguardConfigurations.keys():
+        return ResponseObject(False, "Configuration does not exist", status_code=404)
+    return ZipResponse(WireguardConfigurations[configName].downloadAllPeers(), f'{configName}.zip')
+
 @app.get(f"{APP_PREFIX}/api/getAvailableIPs/<configName>")
 def API_getAvailableIPs(configName):
     if configName not in WireguardConfigurations.keys():
@@ -2813,6 +3332,20 @@ def API_getNumberOfAvailableIPs(configName):
     status, ips = WireguardConfigurations.get(configName).getNumberOfAvailableIP()
     return ResponseObject(status=status, data=ips)
 
+@app.get(f"{APP_PREFIX}/api/searchPeers")
+def API_searchPeers():
+    query = request.args.get("query", "")
+    if len(query) == 0:
+        return ResponseObject(False, "Please provide a search query", status_code=400)
+    pattern = f"%{query}%"
+    peers = sqlSelect(
+        """
+        SELECT configuration, id, name, allowed_ip, state, status, latest_handshake FROM WireguardPeers
+        WHERE state != 'deleted' AND (id = ? OR name LIKE ? OR allowed_ip LIKE ?)
+        ORDER BY configuration, name LIMIT 200
+        """, (query, pattern, pattern)).fetchall()
+    return ResponseObject(data=[dict(p) for p in peers if p['configuration'] in WireguardConfigurations.keys()])
+
 @app.get(f'{APP_PREFIX}/api/getWireguardConfigurationInfo')
 def API_getConfigurationInfo():
     configurationName = request.args.get("configurationName")
@@ -2895,6 +3428,9 @@ def API_download():
     file = request.args.get('file')
     if file is None or len(file) == 0:
         return ResponseObject(False, "Please specify a file")
+    data = AllPendingDownloads.take(file)
+    if data is not None:
+        return send_file(io.BytesIO(data), as_attachment=True, download_name=file)
     if os.path.exists(os.path.join('download', file)):
         return send_file(os.path.join('download', file), as_attachment=True)
     else:
@@ -3204,6 +3740,7 @@ def peerInformationBackgroundThread():
                             c.getPeersTransfer()
                             c.getPeersLatestHandshake()
                             c.getPeersEndpoint()
+                            DatabaseWriteQueue.flush()
                             c.getPeersList()
                             c.getRestrictedPeersList()
             except Exception as e:
@@ -3274,6 +3811,13 @@ _, WG_CONF_PATH = DashboardConfig.GetConfig("Server", "wg_conf_path")
 WireguardConfigurations: dict[str, WireguardConfiguration] = {}
 AmneziaWireguardConfigurations: dict[str, AmneziaWireguardConfiguration] = {}
 InitWireguardConfigurationsList(startup=True)
+for protocol in ProtocolsEnabled():
+    try:
+        WireguardBackupCatalog.migrate(protocol, os.path.join(
+            DashboardConfig.GetConfig("Server", f"{protocol}_conf_path")[1], 'WGDashboard_Backup'))
+    except Exception as e:
+        print(f"[WGDashboard] Cannot move {protocol} backups into the backup store: {e}")
+enhanced_rbac_manager.set_wireguard_configurations(WireguardConfigurations)
 
 # =============================================================================
 # FIREWALL MANAGEMENT API ENDPOINTS
@@ -3281,9 +3825,9 @@ InitWireguardConfigurationsList(startup=True)
 
 @app.route(f'{APP_PREFIX}/api/firewall/rules', methods=["GET"])
 def API_getFirewallRules():
-    """Get current firewall rules"""
+    """Get current firewall rules with their packet / byte counters, ?refresh=true skips the cache"""
     try:
-        rules = FirewallManager.get_firewall_rules()
+        rules = FirewallManager.get_firewall_rules(force=request.args.get('refresh') == 'true')
         return ResponseObject(True, "Firewall rules retrieved successfully", rules)
     except Exception as e:
         return ResponseObject(False, f"Error retrieving firewall rules: {str(e)}", status_code=500)
@@ -3378,15 +3922,76 @@ def API_reloadFirewallRules():
     except Exception as e:
         return ResponseObject(False, f"Error reloading firewall rules: {str(e)}", status_code=500)
 
+@app.route(f'{APP_PREFIX}/api/firewall/reconcile', methods=["POST"])
+def API_reconcileFirewallRules():
+    """Bring filter, NAT and RBAC rules to their desired state; {"dryRun": true} only returns the plan"""
+    try:
+        data = request.get_json(silent=True) or {}
+        dry_run = bool(data.get('dryRun', False))
+        source = data.get('source', 'saved')
+        if source not in ('saved', 'live'):
+            return ResponseObject(False, "source must be 'saved' or 'live'", status_code=400)
+        result = FirewallManager.reconcile_firewall_rules(dry_run, source)
+        if not result['status']:
+            return ResponseObject(False, result['message'], status_code=400)
+        if not dry_run:
+            LoggingManager.log_activity(
+                level='info',
+                category='firewall',
+                message=f'Firewall reconciled: {result["message"]}',
+                user=request.remote_addr,
+                ip_address=request.remote_addr
+            )
+        return ResponseObject(True, result['message'], result['data'])
+    except Exception as e:
+        return ResponseObject(False, f"Error reconciling firewall rules: {str(e)}", status_code=500)
+
+@app.route(f'{APP_PREFIX}/api/firewall/cache', methods=["GET"])
+def API_getFirewallCacheStatus():
+    """Get the firewall ruleset cache status"""
+    return ResponseObject(True, "Firewall cache status retrieved successfully", FirewallManager.get_cache_status())
+
+@app.route(f'{APP_PREFIX}/api/firewall/accounting', methods=["GET"])
+def API_getFirewallAccounting():
+    """Sampler status and every tracked rule with its traffic over the last ?hours="""
+    try:
+        hours = float(request.args.get('hours', 1))
+        return ResponseObject(data={**FirewallTrafficAccounting.toJson(), "Rules": FirewallTrafficAccounting.getSeries(hours)})
+    except ValueError as e:
+        return ResponseObject(False, str(e), status_code=400)
+
+@app.route(f'{APP_PREFIX}/api/firewall/accounting/rules/<int:series_id>', methods=["GET"])
+def API_getFirewallRuleRates(series_id):
+    """Packet / byte rates of one rule, ?resolution=<seconds>&hours="""
+    try:
+        resolution = request.args.get('resolution')
+        rates = FirewallTrafficAccounting.getRuleRates(series_id, None if resolution is None else int(resolution),
+                                                       float(request.args.get('hours', 1)))
+    except ValueError as e:
+        return ResponseObject(False, str(e), status_code=400)
+    if rates is None:
+        return ResponseObject(False, "Rule is not tracked", status_code=404)
+    return ResponseObject(data=rates)
+
+@app.route(f'{APP_PREFIX}/api/firewall/accounting/groups/<int:group_id>', methods=["GET"])
+def API_getFirewallGroupRates(group_id):
+    """Packet / byte rates of every policy rule of an RBAC group, ?resolution=<seconds>&hours="""
+    try:
+        resolution = request.args.get('resolution')
+        return ResponseObject(data=FirewallTrafficAccounting.getGroupRates(
+            group_id, None if resolution is None else int(resolution), float(request.args.get('hours', 1))))
+    except ValueError as e:
+        return ResponseObject(False, str(e), status_code=400)
+
 # =============================================================================
 # NAT MANAGEMENT API ENDPOINTS
 # =============================================================================
 
 @app.route(f'{APP_PREFIX}/api/firewall/nat', methods=["GET"])
 def API_getNatRules():
-    """Get current NAT rules"""
+    """Get current NAT rules with their packet / byte counters, ?refresh=true skips the cache"""
     try:
-        rules = FirewallManager.get_nat_rules()
+        rules = FirewallManager.get_nat_rules(force=request.args.get('refresh') == 'true')
         return ResponseObject(True, "NAT rules retrieved successfully", rules)
     except Exception as e:
         return ResponseObject(False, f"Error retrieving NAT rules: {str(e)}", status_code=500)
@@ -3486,9 +4091,9 @@ def API_reloadNatRules():
 
 @app.route(f'{APP_PREFIX}/api/routes', methods=["GET"])
 def API_getRoutes():
-    """Get current routing table"""
+    """Get current routing table, ?refresh=true skips the cache"""
     try:
-        routes = RouteManager.get_routes()
+        routes = RouteManager.get_routes(force=request.args.get('refresh') == 'true')
         return ResponseObject(True, "Routes retrieved successfully", routes)
     except Exception as e:
         return ResponseObject(False, f"Error retrieving routes: {str(e)}", status_code=500)
@@ -3518,7 +4123,31 @@ def API_addRoute():
     except Exception as e:
         return ResponseObject(False, f"Error adding route: {str(e)}", status_code=500)
 
-@app.route(f'{APP_PREFIX}/api/routes/<int:route_id>', methods=["DELETE"])
+@app.route(f'{APP_PREFIX}/api/routes/batch', methods=["POST"])
+def API_batchRoutes():
+    """Delete routes by ID and add new ones in one batch: {"add": [...], "delete": [route ids]}"""
+    try:
+        data = request.get_json()
+        if not data:
+            return ResponseObject(False, "No data provided", status_code=400)
+
+        result = RouteManager.apply_routes(add=data.get('add', []), delete=data.get('delete', []))
+        if result['status']:
+            LoggingManager.log_activity(
+                level='info',
+                category='routing',
+                message=f'Routes changed: {result["message"]}',
+                user=request.remote_addr,
+                ip_address=request.remote_addr,
+                details=json.dumps(result['commands'])
+            )
+            return ResponseObject(True, result['message'], result)
+        else:
+            return ResponseObject(False, result['message'], status_code=400)
+    except Exception as e:
+        return ResponseObject(False, f"Error applying routes: {str(e)}", status_code=500)
+
+@app.route(f'{APP_PREFIX}/api/routes/<route_id>', methods=["DELETE"])
 def API_deleteRoute(route_id):
     """Delete a route by ID"""
     try:
@@ -3961,6 +4590,8 @@ def API_updateRBACGroup(group_id):
             return ResponseObject(False, "Group name is required", status_code=400)
         
         result = RBACManager.update_group(group_id, name, description, color)
+        if result['status']:
+            enhanced_rbac_manager.refresh_effective_access(group_ids=[group_id])
         return ResponseObject(result['status'], result['message'], result)
         
     except Exception as e:
@@ -3999,6 +4630,8 @@ def API_assignPeerToGroup(group_id):
             return ResponseObject(False, "Peer name is required", status_code=400)
         
         result = RBACManager.assign_peer_to_group(group_id, peer_name, peer_ip)
+        if result['status']:
+            enhanced_rbac_manager.refresh_effective_access(peer_names=[peer_name])
         return ResponseObject(result['status'], result['message'], result)
         
     except Exception as e:
@@ -4009,6 +4642,8 @@ def API_removePeerFromGroup(group_id, peer_name):
     """Remove peer from group"""
     try:
         result = RBACManager.remove_peer_from_group(group_id, peer_name)
+        if result['status']:
+            enhanced_rbac_manager.refresh_effective_access(peer_names=[peer_name])
         return ResponseObject(result['status'], result['message'], result)
     except Exception as e:
         return ResponseObject(False, f"Error removing peer from group: {str(e)}", status_code=500)
@@ -4114,8 +4749,11 @@ def API_getAvailablePeers():
 def API_regenerateRBACRules():
     """Regenerate all RBAC firewall rules"""
     try:
-        RBACManager.regenerate_all_rules()
-        return ResponseObject(True, "RBAC rules regenerated successfully", None)
+        result = RBACManager.regenerate_all_rules()
+        if not result['status']:
+            return ResponseObject(False, result['message'], result, status_code=500)
+        FirewallManager.invalidate_cache()
+        return ResponseObject(True, "RBAC rules regenerated successfully", result)
     except Exception as e:
         return ResponseObject(False, f"Error regenerating RBAC rules: {str(e)}", status_code=500)
 
@@ -4167,6 +4805,8 @@ def API_updateOrganization(org_id):
             description=data.get('description'),
             color=data.get('color')
         )
+        if result['status']:
+            enhanced_rbac_manager.refresh_effective_access(organization_ids=[org_id])
         return ResponseObject(result['status'], result['message'])
     except Exception as e:
         return ResponseObject(False, f"Error updating organization: {str(e)}", status_code=500)
@@ -4176,6 +4816,8 @@ def API_deleteOrganization(org_id):
     """Delete organization"""
     try:
         result = OrganizationManager.delete_organization(org_id)
+        if result['status']:
+            enhanced_rbac_manager.refresh_effective_access(organization_ids=[org_id])
         return ResponseObject(result['status'], result['message'])
     except Exception as e:
         return ResponseObject(False, f"Error deleting organization: {str(e)}", status_code=500)
@@ -4195,6 +4837,8 @@ def API_addSubnetToOrganization(org_id):
             return ResponseObject(False, "Subnet CIDR is required", status_code=400)
         
         result = OrganizationManager.add_subnet_to_organization(org_id, subnet_cidr, description, is_primary)
+        if result['status']:
+            enhanced_rbac_manager.refresh_effective_access(organization_ids=[org_id])
         return ResponseObject(result['status'], result['message'])
     except Exception as e:
         return ResponseObject(False, f"Error adding subnet: {str(e)}", status_code=500)
@@ -4204,12 +4848,15 @@ def API_updateSubnet(subnet_id):
     """Update subnet details"""
     try:
         data = request.get_json()
+        org_id = OrganizationManager.get_subnet_organization_id(subnet_id)
         result = OrganizationManager.update_subnet(
             subnet_id,
             subnet_cidr=data.get('subnet_cidr'),
             description=data.get('description'),
             is_primary=data.get('is_primary')
         )
+        if result['status'] and org_id is not None:
+            enhanced_rbac_manager.refresh_effective_access(organization_ids=[org_id])
         return ResponseObject(result['status'], result['message'])
     except Exception as e:
         return ResponseObject(False, f"Error updating subnet: {str(e)}", status_code=500)
@@ -4218,7 +4865,10 @@ def API_updateSubnet(subnet_id):
 def API_deleteSubnet(subnet_id):
     """Delete a subnet"""
     try:
+        org_id = OrganizationManager.get_subnet_organization_id(subnet_id)
         result = OrganizationManager.delete_subnet(subnet_id)
+        if result['status'] and org_id is not None:
+            enhanced_rbac_manager.refresh_effective_access(organization_ids=[org_id])
         return ResponseObject(result['status'], result['message'])
     except Exception as e:
         return ResponseObject(False, f"Error deleting subnet: {str(e)}", status_code=500)
@@ -4387,6 +5037,24 @@ def API_addGroupNatPolicy(group_id):
     except Exception as e:
         return ResponseObject(False, f"Error adding NAT policy: {str(e)}", status_code=500)
 
+@app.route(f'{APP_PREFIX}/api/enhanced-rbac/hierarchy', methods=["GET"])
+def API_getHierarchySnapshot():
+    """Get organizations, groups and users with their relations, counts and VPN assignments in one response"""
+    try:
+        result = enhanced_rbac_manager.hierarchy.snapshot()
+        return ResponseObject(result['status'], result['message'], result.get('data'))
+    except Exception as e:
+        return ResponseObject(False, f"Error fetching hierarchy: {str(e)}", status_code=500)
+
+@app.route(f'{APP_PREFIX}/api/enhanced-rbac/effective-access', methods=["GET"])
+def API_getAllEffectiveAccess():
+    """Get effective access for every peer in a group, computed in one pass"""
+    try:
+        result = enhanced_rbac_manager.calculate_all_effective_access()
+        return ResponseObject(result['status'], result['message'], result.get('data'))
+    except Exception as e:
+        return ResponseObject(False, f"Error calculating effective access: {str(e)}", status_code=500)
+
 @app.route(f'{APP_PREFIX}/api/enhanced-rbac/peers/<string:peer_name>/effective-access', methods=["GET"])
 def API_getPeerEffectiveAccess(peer_name):
     """Get effective access for a peer"""
@@ -4455,6 +5123,24 @@ def API_getGroupVpnSubnets(group_id):
     except Exception as e:
         return ResponseObject(False, f"Error fetching group VPN subnets: {str(e)}", status_code=500)
 
+@app.route(f'{APP_PREFIX}/api/enhanced-rbac/push-routes/<configuration_name>', methods=["GET"])
+def API_getPushRoutes(configuration_name):
+    """Get the collapsed push routes of a configuration"""
+    try:
+        result = enhanced_rbac_manager.push_routes.get_routes(configuration_name)
+        return ResponseObject(result['status'], result['message'], result.get('data'))
+    except Exception as e:
+        return ResponseObject(False, f"Error fetching push routes: {str(e)}", status_code=500)
+
+@app.route(f'{APP_PREFIX}/api/enhanced-rbac/push-routes/<configuration_name>/apply', methods=["POST"])
+def API_applyPushRoutes(configuration_name):
+    """Install every active push route of a configuration with one ip -batch"""
+    try:
+        result = enhanced_rbac_manager.push_routes.apply_configuration(configuration_name)
+        return ResponseObject(result['status'], result['message'], result.get('commands'))
+    except Exception as e:
+        return ResponseObject(False, f"Error applying push routes: {str(e)}", status_code=500)
+
 @app.route(f'{APP_PREFIX}/api/enhanced-rbac/groups/vpn-servers/<server_name>', methods=["GET"])
 def API_getGroupsByVpnServer(server_name):
     """Get all groups assigned to a specific VPN server"""
@@ -4524,6 +5210,18 @@ def API_generateVpnPeer(user_id):
     except Exception as e:
         return ResponseObject(False, f"Error generating VPN peer: {str(e)}", status_code=500)
 
+@app.route(f'{APP_PREFIX}/api/enhanced-rbac/groups/<int:group_id>/provision', methods=["POST"])
+def API_provisionGroupPeers(group_id):
+    """Generate VPN peers for all group members that do not have one yet"""
+    unauthorized = sessionRequired()
+    if unauthorized:
+        return unauthorized
+    try:
+        result = enhanced_rbac_manager.provision_group_peers(group_id)
+        return ResponseObject(result['status'], result['message'], result.get('data'))
+    except Exception as e:
+        return ResponseObject(False, f"Error provisioning group peers: {str(e)}", status_code=500)
+
 @app.route(f'{APP_PREFIX}/api/users/<int:user_id>/vpn-config', methods=["GET"])
 def API_downloadVpnConfig(user_id):
     """Download VPN configuration file for user"""
@@ -4554,6 +5252,23 @@ def API_getUserVpnPeers(user_id):
     except Exception as e:
         return ResponseObject(False, f"Error fetching user VPN peers: {str(e)}", status_code=500)
 
+@app.route(f'{APP_PREFIX}/api/enhanced-rbac/groups/peers-summary', methods=["GET"])
+def API_getGroupsPeersSummary():
+    """Get VPN peers summaries of all groups, or of ?group_ids=1,2,3"""
+    unauthorized = sessionRequired()
+    if unauthorized:
+        return unauthorized
+    try:
+        group_ids = request.args.get('group_ids')
+        if group_ids is not None:
+            group_ids = [int(group_id) for group_id in group_ids.split(',') if group_id.strip()]
+        result = enhanced_rbac_manager.get_groups_peers_summary(group_ids)
+        return ResponseObject(result['status'], result['message'], result.get('data'))
+    except ValueError:
+        return ResponseObject(False, "group_ids must be a comma separated list of group IDs", status_code=400)
+    except Exception as e:
+        return ResponseObject(False, f"Error fetching groups peers summary: {str(e)}", status_code=500)
+
 @app.route(f'{APP_PREFIX}/api/enhanced-rbac/groups/<int:group_id>/peers-summary', methods=["GET"])
 def API_getGroupPeersSummary(group_id):
     """Get VPN peers summary for a group"""
@@ -4588,6 +5303,8 @@ def startThreads():
     bgThread.start()
     scheduleJobThread = threading.Thread(target=peerJobScheduleBackgroundThread, daemon=True)
     scheduleJobThread.start()
+    WireguardBackupScheduler.start()
+    FirewallTrafficAccounting.start()
 
 if __name__ == "__main__":
     startThreads()
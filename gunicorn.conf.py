@@ -1,13 +1,16 @@
 import os.path
 import dashboard, configparser
 from datetime import datetime
-global sqldb, cursor, DashboardConfig, WireguardConfigurations, AllPeerJobs, JobLogger
+global Database, DashboardConfig, WireguardConfigurations, AllPeerJobs, JobLogger
 app_host, app_port = dashboard.gunicornConfig()
 date = datetime.today().strftime('%Y_%m_%d_%H_%M_%S')
 
 def post_worker_init(worker):
     dashboard.startThreads()
 
+def worker_exit(server, worker):
+    dashboard.WireguardSaveScheduler.flushAll()
+
 worker_class = 'gthread'
 workers = 1
 threads = 1
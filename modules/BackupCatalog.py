@@ -0,0 +1,159 @@
+"""
+Backup Catalog
+"""
+import os, re, threading
+from datetime import datetime
+from .DashboardDatabase import DashboardDatabase
+from .BackupStore import BackupStore
+
+
+class BackupCatalog:
+    """
+    Metadata index of configuration backups in every WGDashboard_Backup directory.
+    Listings are answered from the catalog; backup content is only read when it is asked for.
+    Entries are written when a backup is created or deleted, backups added or removed by hand are
+    picked up the next time the directory's modification time changes. Plain backups are moved into
+    the backup store once at startup by `migrate`, never while listing.
+    Backups made by a backup schedule are flagged, retention only ever prunes those.
+    """
+    FileName = re.compile(r"^(.+)_(\d{14})\.conf$")
+
+    def __init__(self, database: DashboardDatabase, store: BackupStore):
+        self.database = database
+        self.store = store
+        self.__lock = threading.Lock()
+        self.__directoryModified: dict[str, int] = {}
+        self.__createTable()
+
+    def __createTable(self):
+        with self.database.transaction():
+            self.database.update("""
+                CREATE TABLE IF NOT EXISTS WireguardConfigurationBackups (
+                    protocol VARCHAR NOT NULL, filename VARCHAR NOT NULL, configuration VARCHAR NOT NULL,
+                    backup_date VARCHAR NOT NULL, conf_size INTEGER NOT NULL, sql_size INTEGER,
+                    checksum VARCHAR NOT NULL, peers INTEGER DEFAULT 0, restricted_peers INTEGER DEFAULT 0,
+                    created DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%S','now', 'localtime')),
+                    scheduled INTEGER DEFAULT 0,
+                    PRIMARY KEY (protocol, filename)
+                )
+            """)
+            columns = [c['name'] for c in self.database.select("PRAGMA table_info(WireguardConfigurationBackups)").fetchall()]
+            if 'scheduled' not in columns:
+                self.database.update("ALTER TABLE WireguardConfigurationBackups ADD COLUMN scheduled INTEGER DEFAULT 0")
+            self.database.update("""
+                CREATE INDEX IF NOT EXISTS WireguardConfigurationBackups_configuration
+                ON WireguardConfigurationBackups (protocol, configuration, backup_date)
+            """)
+
+    def __inspect(self, directory: str, filename: str) -> dict | None:
+        s = self.FileName.match(filename)
+        if s is None:
+            return None
+        configuration = s.group(1)
+        confPath = os.path.join(directory, filename)
+        sqlPath = os.path.join(directory, filename.replace(".conf", ".sql"))
+        checksum = self.store.checksum(confPath)
+        sqlSize = None
+        peers = restrictedPeers = 0
+        if self.store.exists(sqlPath):
+            sqlSize = self.store.size(sqlPath)
+            checksum = f'{checksum}:{self.store.checksum(sqlPath)}'
+            identifier = configuration.replace('"', '""')
+            peer, restricted = f'INSERT INTO "{identifier}" VALUES(', f'INSERT INTO "{identifier}_restrict_access" VALUES('
+            for line in self.store.readLines(sqlPath):
+                if line.startswith(peer):
+                    peers += 1
+                elif line.startswith(restricted):
+                    restrictedPeers += 1
+        return {
+            "filename": filename,
+            "configuration": configuration,
+            "backup_date": s.group(2),
+            "conf_size": self.store.size(confPath),
+            "sql_size": sqlSize,
+            "checksum": checksum,
+            "peers": peers,
+            "restricted_peers": restrictedPeers
+        }
+
+    @staticmethod
+    def __toJson(row, protocol: str) -> dict:
+        return {
+            "protocol": protocol,
+            "filename": row['filename'],
+            "configuration": row['configuration'],
+            "backupDate": row['backup_date'],
+            "database": row['sql_size'] is not None,
+            "confSize": row['conf_size'],
+            "sqlSize": row['sql_size'],
+            "checksum": row['checksum'],
+            "peers": row['peers'],
+            "restrictedPeers": row['restricted_peers'],
+            "created": row['created'],
+            "scheduled": bool(row['scheduled'])
+        }
+
+    def record(self, protocol: str, directory: str, filename: str, scheduled: bool = False) -> dict | None:
+        entry = self.__inspect(directory, filename)
+        if entry is None:
+            return None
+        entry['protocol'] = protocol
+        entry['created'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        entry['scheduled'] = int(scheduled)
+        with self.database.transaction():
+            self.database.update("""
+                INSERT OR REPLACE INTO WireguardConfigurationBackups
+                (protocol, filename, configuration, backup_date, conf_size, sql_size, checksum, peers, restricted_peers, created, scheduled)
+                VALUES (:protocol, :filename, :configuration, :backup_date, :conf_size, :sql_size, :checksum, :peers, :restricted_peers, :created, :scheduled)
+            """, entry)
+        return self.__toJson(entry, protocol)
+
+    def remove(self, protocol: str, filename: str):
+        with self.database.transaction():
+            self.database.update("DELETE FROM WireguardConfigurationBackups WHERE protocol = ? AND filename = ?",
+                                 (protocol, filename, ))
+
+    def sync(self, protocol: str, directory: str):
+        """
+        Reconcile the catalog with the directory, only files the catalog does not know yet are read
+        """
+        if not os.path.isdir(directory):
+            return
+        with self.__lock:
+            if self.__directoryModified.get(protocol) == os.stat(directory).st_mtime_ns:
+                return
+            modified = os.stat(directory).st_mtime_ns
+            files = {f for f in self.store.list(directory) if self.FileName.match(f)}
+            catalogued = {r['filename'] for r in self.database.select(
+                "SELECT filename FROM WireguardConfigurationBackups WHERE protocol = ?", (protocol, )).fetchall()}
+            for f in catalogued - files:
+                self.remove(protocol, f)
+            for f in files - catalogued:
+                self.record(protocol, directory, f)
+            self.__directoryModified[protocol] = modified
+
+    def migrate(self, protocol: str, directory: str) -> int:
+        """
+        Move plain backups in the directory into the backup store, the catalog re-reads the directory afterwards
+        """
+        with self.__lock:
+            migrated = self.store.migrate(directory)
+            self.__directoryModified.pop(protocol, None)
+        return migrated
+
+    def list(self, protocol: str, configuration: str = None) -> list[dict]:
+        if configuration is None:
+            rows = self.database.select(
+                "SELECT * FROM WireguardConfigurationBackups WHERE protocol = ? ORDER BY backup_date DESC",
+                (protocol, )).fetchall()
+        else:
+            rows = self.database.select(
+                "SELECT * FROM WireguardConfigurationBackups WHERE protocol = ? AND configuration = ? ORDER BY backup_date DESC",
+                (protocol, configuration, )).fetchall()
+        return [self.__toJson(r, protocol) for r in rows]
+
+    def get(self, protocol: str, filename: str) -> dict | None:
+        row = self.database.select(
+            "SELECT * FROM WireguardConfigurationBackups WHERE protocol = ? AND filename = ?",
+            (protocol, filename, )).fetchone()
+        return None if row is None else self.__toJson(row, protocol)
@@ -0,0 +1,285 @@
+"""
+Backup Scheduler
+"""
+import os, threading, time
+from datetime import datetime, timedelta
+from typing import Any, Callable
+from .DashboardDatabase import DashboardDatabase
+
+
+class CronExpression:
+    """
+    Five field cron expression (minute hour day-of-month month day-of-week) supporting *, lists, ranges and steps
+    """
+    Ranges = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("Cron expression needs 5 fields: minute hour day month weekday")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = \
+            [self.__parse(f, lo, hi) for f, (lo, hi) in zip(fields, self.Ranges)]
+        self.weekdays = {0 if d == 7 else d for d in self.weekdays}
+        self.anyDay, self.anyWeekday = fields[2] == "*", fields[4] == "*"
+
+    @staticmethod
+    def __parse(field: str, lo: int, hi: int) -> set[int]:
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step = part.split("/", 1)
+                step = int(step)
+                if step < 1:
+                    raise ValueError(f"Invalid step in {field}")
+            if part == "*":
+                start, end = lo, hi
+            elif "-" in part:
+                start, end = map(int, part.split("-", 1))
+            else:
+                start = int(part)
+                end = hi if step > 1 else start
+            if start < lo or end > hi or start > end:
+                raise ValueError(f"{field} is out of range {lo}-{hi}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def __dayMatches(self, t: datetime) -> bool:
+        day, weekday = t.day in self.days, (t.weekday() + 1) % 7 in self.weekdays
+        if self.anyDay or self.anyWeekday:
+            return day and weekday
+        return day or weekday
+
+    def next(self, after: datetime) -> datetime:
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 4)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self.__dayMatches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"{self.expression} never matches")
+
+
+class BackupScheduler:
+    """
+    Per-configuration scheduled backups on one background thread.
+    A schedule runs every `interval` seconds or on a cron expression; the backup is skipped when the
+    configuration's content checksum is the same as at the last scheduled backup. After each run the
+    configuration's backups are pruned to `keep_count` and / or `keep_days`, the newest one is always kept
+    """
+    MinimumInterval = 60
+
+    def __init__(self, database: DashboardDatabase, resolve: Callable[[str], Any]):
+        self.database = database
+        self.resolve = resolve
+        self.__lock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__thread: threading.Thread | None = None
+        self.__pid = None
+        self.__createTable()
+
+    def __createTable(self):
+        with self.database.transaction():
+            self.database.update("""
+                CREATE TABLE IF NOT EXISTS WireguardBackupSchedules (
+                    configuration VARCHAR NOT NULL PRIMARY KEY, enabled INTEGER NOT NULL DEFAULT 1,
+                    interval INTEGER, cron VARCHAR, keep_count INTEGER, keep_days INTEGER,
+                    next_run DATETIME, last_run DATETIME, last_status VARCHAR, last_message VARCHAR,
+                    last_duration FLOAT, last_bytes INTEGER, last_backup VARCHAR, last_checksum VARCHAR,
+                    runs INTEGER NOT NULL DEFAULT 0, skipped INTEGER NOT NULL DEFAULT 0,
+                    pruned INTEGER NOT NULL DEFAULT 0, bytes_written INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+
+    @staticmethod
+    def __nextRun(schedule, after: datetime) -> datetime:
+        if schedule['cron']:
+            return CronExpression(schedule['cron']).next(after)
+        return after + timedelta(seconds=schedule['interval'])
+
+    @staticmethod
+    def __toJson(row) -> dict:
+        return {
+            "Configuration": row['configuration'],
+            "Enabled": bool(row['enabled']),
+            "Interval": row['interval'],
+            "Cron": row['cron'],
+            "KeepCount": row['keep_count'],
+            "KeepDays": row['keep_days'],
+            "NextRun": row['next_run'],
+            "LastRun": row['last_run'],
+            "LastStatus": row['last_status'],
+            "LastMessage": row['last_message'],
+            "LastDuration": row['last_duration'],
+            "LastBytesWritten": row['last_bytes'],
+            "LastBackup": row['last_backup'],
+            "Runs": row['runs'],
+            "Skipped": row['skipped'],
+            "Pruned": row['pruned'],
+            "BytesWritten": row['bytes_written']
+        }
+
+    def getSchedule(self, configuration: str) -> dict | None:
+        row = self.database.select("SELECT * FROM WireguardBackupSchedules WHERE configuration = ?",
+                                   (configuration, )).fetchone()
+        return None if row is None else self.__toJson(row)
+
+    def getSchedules(self) -> list[dict]:
+        return [self.__toJson(r) for r in self.database.select(
+            "SELECT * FROM WireguardBackupSchedules ORDER BY configuration").fetchall()]
+
+    def setSchedule(self, configuration: str, interval: int = None, cron: str = None,
+                    keepCount: int = None, keepDays: int = None, enabled: bool = True) -> tuple[bool, str | None]:
+        if (interval is None) == (cron is None or len(cron) == 0):
+            return False, "Please provide either an interval or a cron expression"
+        try:
+            if interval is not None:
+                interval = int(interval)
+                if interval < self.MinimumInterval:
+                    return False, f"Interval must be at least {self.MinimumInterval} seconds"
+                cron = None
+            else:
+                CronExpression(cron)
+            keepCount = None if keepCount in (None, "") else int(keepCount)
+            keepDays = None if keepDays in (None, "") else int(keepDays)
+        except ValueError as e:
+            return False, str(e)
+        if (keepCount is not None and keepCount < 1) or (keepDays is not None and keepDays < 1):
+            return False, "Retention must keep at least 1 backup / 1 day"
+        schedule = {"configuration": configuration, "enabled": int(enabled), "interval": interval, "cron": cron,
+                    "keep_count": keepCount, "keep_days": keepDays}
+        schedule['next_run'] = self.__nextRun(schedule, datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+        with self.database.transaction():
+            self.database.update("""
+                INSERT INTO WireguardBackupSchedules (configuration, enabled, interval, cron, keep_count, keep_days, next_run)
+                VALUES (:configuration, :enabled, :interval, :cron, :keep_count, :keep_days, :next_run)
+                ON CONFLICT (configuration) DO UPDATE SET enabled = excluded.enabled, interval = excluded.interval,
+                cron = excluded.cron, keep_count = excluded.keep_count, keep_days = excluded.keep_days,
+                next_run = excluded.next_run
+            """, schedule)
+        self.__wake.set()
+        return True, None
+
+    def deleteSchedule(self, configuration: str):
+        with self.database.transaction():
+            self.database.update("DELETE FROM WireguardBackupSchedules WHERE configuration = ?", (configuration, ))
+
+    def renameSchedule(self, configuration: str, newConfiguration: str):
+        with self.database.transaction():
+            self.database.update("UPDATE WireguardBackupSchedules SET configuration = ? WHERE configuration = ?",
+                                 (newConfiguration, configuration, ))
+
+    def runNow(self, configuration: str) -> bool:
+        """
+        Make a schedule due right away, the backup itself still runs on the scheduler thread
+        """
+        with self.database.transaction():
+            updated = self.database.update(
+                "UPDATE WireguardBackupSchedules SET next_run = ?, last_checksum = NULL WHERE configuration = ?",
+                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), configuration, )).rowcount
+        self.start()
+        self.__wake.set()
+        return updated > 0
+
+    def __prune(self, configuration, schedule) -> int:
+        if schedule['keep_count'] is None and schedule['keep_days'] is None:
+            return 0
+        # Manual backups and the safety backups taken before edits are never pruned
+        backups = [b for b in configuration.getBackups() if b['scheduled']]
+        pruned = 0
+        for i, b in enumerate(backups):
+            if i == 0:
+                continue
+            expired = schedule['keep_days'] is not None and \
+                datetime.strptime(b['backupDate'], "%Y%m%d%H%M%S") < datetime.now() - timedelta(days=schedule['keep_days'])
+            if (schedule['keep_count'] is not None and i >= schedule['keep_count']) or expired:
+                if configuration.deleteBackup(b['filename']):
+                    pruned += 1
+        return pruned
+
+    def runSchedule(self, schedule) -> dict:
+        start = time.perf_counter()
+        result = {"last_status": "Success", "last_message": None, "last_bytes": 0, "last_backup": schedule['last_backup'],
+                  "last_checksum": schedule['last_checksum'], "skipped": 0, "pruned": 0}
+        configuration = self.resolve(schedule['configuration'])
+        try:
+            if configuration is None:
+                result.update(last_status="Failed", last_message="Configuration does not exist")
+            else:
+                checksum = configuration.getContentChecksum()
+                if checksum == schedule['last_checksum']:
+                    result.update(last_status="Skipped", last_message="Nothing changed since the last backup", skipped=1)
+                else:
+                    status, backup = configuration.backupConfigurationFile(scheduled=True)
+                    if status:
+                        result.update(last_bytes=backup['written'], last_backup=backup['filename'], last_checksum=checksum)
+                    else:
+                        result.update(last_status="Failed", last_message="Cannot create backup")
+                result['pruned'] = self.__prune(configuration, schedule)
+        except Exception as e:
+            result.update(last_status="Failed", last_message=str(e))
+        now = datetime.now()
+        result.update(
+            configuration=schedule['configuration'],
+            last_run=now.strftime("%Y-%m-%d %H:%M:%S"),
+            last_duration=round(time.perf_counter() - start, 3),
+            next_run=self.__nextRun(schedule, now).strftime("%Y-%m-%d %H:%M:%S")
+        )
+        with self.database.transaction():
+            self.database.update("""
+                UPDATE WireguardBackupSchedules SET next_run = :next_run, last_run = :last_run, last_status = :last_status,
+                last_message = :last_message, last_duration = :last_duration, last_bytes = :last_bytes,
+                last_backup = :last_backup, last_checksum = :last_checksum, runs = runs + 1,
+                skipped = skipped + :skipped, pruned = pruned + :pruned, bytes_written = bytes_written + :last_bytes
+                WHERE configuration = :configuration
+            """, result)
+        if result['last_status'] == "Failed":
+            print(f"[WGDashboard] Scheduled backup of {schedule['configuration']} failed: {result['last_message']}", flush=True)
+        return result
+
+    def runDue(self) -> float:
+        """
+        Run every due schedule, returns the seconds until the next one is due
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for schedule in self.database.select(
+                "SELECT * FROM WireguardBackupSchedules WHERE enabled = 1 AND next_run <= ? ORDER BY next_run",
+                (now, )).fetchall():
+            self.runSchedule(schedule)
+        upcoming = self.database.select(
+            "SELECT MIN(next_run) AS next_run FROM WireguardBackupSchedules WHERE enabled = 1").fetchone()
+        if upcoming is None or upcoming['next_run'] is None:
+            return 300
+        return max(1.0, (datetime.strptime(upcoming['next_run'], "%Y-%m-%d %H:%M:%S") - datetime.now()).total_seconds())
+
+    def __run(self):
+        print(f"[WGDashboard] Backup Scheduler Started", flush=True)
+        while True:
+            try:
+                wait = self.runDue()
+            except Exception as e:
+                print(f"[WGDashboard] Backup Scheduler Error: {str(e)}", flush=True)
+                wait = 60
+            self.__wake.wait(min(wait, 300))
+            self.__wake.clear()
+
+    def start(self):
+        with self.__lock:
+            if self.__thread is None or not self.__thread.is_alive() or self.__pid != os.getpid():
+                self.__pid = os.getpid()
+                self.__thread = threading.Thread(target=self.__run, name="BackupScheduler", daemon=True)
+                self.__thread.start()
+
+    def toJson(self):
+        return {
+            "Running": self.__thread is not None and self.__thread.is_alive() and self.__pid == os.getpid(),
+            "Schedules": self.getSchedules()
+        }
@@ -0,0 +1,316 @@
+"""
+Backup Store
+"""
+import gzip, hashlib, json, os, re, threading, uuid, zlib
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class BackupChunkWriter:
+    """
+    File-like writer that cuts the text written to it into content-defined chunks at line boundaries.
+    A chunk ends after a line whose CRC matches the mask (or once it reaches `maxChunkSize`), so an edit
+    to one peer only changes the chunk around it and every other chunk is shared with older backups
+    """
+    def __init__(self, store: "BackupStore", directory: str):
+        self.store = store
+        self.directory = directory
+        self.chunks: list[str] = []
+        self.size = 0
+        self.written = 0
+        self.checksum = hashlib.sha256()
+        self.__pending = ""
+        self.__chunk: list[bytes] = []
+        self.__chunkSize = 0
+
+    def write(self, text: str):
+        self.__pending += text
+        if "\n" not in self.__pending:
+            return
+        lines = self.__pending.split("\n")
+        self.__pending = lines.pop()
+        for line in lines:
+            self.__addLine(f"{line}\n".encode())
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def __addLine(self, line: bytes):
+        self.__chunk.append(line)
+        self.__chunkSize += len(line)
+        if zlib.crc32(line) & self.store.boundaryMask == 0 or self.__chunkSize >= self.store.maxChunkSize:
+            self.__cut()
+
+    def __cut(self):
+        if self.__chunkSize == 0:
+            return
+        data = b"".join(self.__chunk)
+        chunk, written = self.store.putChunk(self.directory, data)
+        self.chunks.append(chunk)
+        self.written += written
+        self.size += len(data)
+        self.checksum.update(data)
+        self.__chunk = []
+        self.__chunkSize = 0
+
+    def close(self):
+        if len(self.__pending) > 0:
+            self.__addLine(self.__pending.encode())
+            self.__pending = ""
+        self.__cut()
+
+    def toJson(self):
+        return {
+            "size": self.size,
+            "sha256": self.checksum.hexdigest(),
+            "written": self.written,
+            "chunks": self.chunks
+        }
+
+
+class BackupWriter:
+    """
+    One backup being written, its files are opened with `open(".conf")` / `open(".sql")`
+    """
+    def __init__(self, store: "BackupStore", directory: str):
+        self.store = store
+        self.directory = directory
+        self.files: dict[str, BackupChunkWriter] = {}
+
+    @contextmanager
+    def open(self, extension: str):
+        writer = BackupChunkWriter(self.store, self.directory)
+        yield writer
+        writer.close()
+        self.files[BackupStore.FileKinds[extension]] = writer
+
+
+class BackupStore:
+    """
+    Compressed, chunk-deduplicated storage for configuration backups.
+    A backup `<name>_<date>` is a manifest `<name>_<date>.manifest` in the backup directory listing the
+    chunks of its .conf and .sql files; chunks are gzip-compressed and stored once under `chunks/` by their
+    SHA-256. Callers keep using the logical `<name>_<date>.conf` / `.sql` paths, plain files written by
+    older releases are still read as they are
+    """
+    ManifestVersion = 1
+    ManifestSuffix = ".manifest"
+    ChunkDirectory = "chunks"
+    FileKinds = {".conf": "conf", ".sql": "sql"}
+    BackupName = re.compile(r"^.+_\d{14}$")
+
+    def __init__(self, averageChunkLines: int = 32, maxChunkSize: int = 256 * 1024, compressLevel: int = 6):
+        self.boundaryMask = averageChunkLines - 1
+        self.maxChunkSize = maxChunkSize
+        self.compressLevel = compressLevel
+        self.__lock = threading.RLock()
+
+    @staticmethod
+    def __split(path: str) -> tuple[str, str, str]:
+        directory, filename = os.path.split(path)
+        base, extension = os.path.splitext(filename)
+        return directory, base, extension
+
+    def __manifestPath(self, directory: str, base: str) -> str:
+        return os.path.join(directory, f'{base}{self.ManifestSuffix}')
+
+    def __chunkPath(self, directory: str, chunk: str) -> str:
+        return os.path.join(directory, self.ChunkDirectory, chunk[:2], f'{chunk}.gz')
+
+    def __readManifest(self, directory: str, base: str) -> dict | None:
+        try:
+            with open(self.__manifestPath(directory, base), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def __fileEntry(self, path: str) -> dict | None:
+        directory, base, extension = self.__split(path)
+        manifest = self.__readManifest(directory, base)
+        if manifest is None or extension not in self.FileKinds:
+            return None
+        return manifest['files'].get(self.FileKinds[extension])
+
+    def putChunk(self, directory: str, data: bytes) -> tuple[str, int]:
+        """
+        Store a chunk unless it is already there, returns its id and the bytes written to disk
+        """
+        chunk = hashlib.sha256(data).hexdigest()
+        path = self.__chunkPath(directory, chunk)
+        if os.path.exists(path):
+            return chunk, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = gzip.compress(data, self.compressLevel, mtime=0)
+        with open(f'{path}.{uuid.uuid4().hex}.tmp', 'wb') as f:
+            f.write(compressed)
+            temporary = f.name
+        os.replace(temporary, path)
+        return chunk, len(compressed)
+
+    @contextmanager
+    def create(self, directory: str, base: str):
+        """
+        Write a new backup. Open its files with `backup.open(".conf")`; the manifest is only written
+        once every file is complete, so an interrupted backup never shows up in listings
+        """
+        with self.__lock:
+            backup = BackupWriter(self, directory)
+            yield backup
+            manifest = {
+                "version": self.ManifestVersion,
+                "compression": "gzip",
+                "files": {k: v.toJson() for k, v in backup.files.items()}
+            }
+            path = self.__manifestPath(directory, base)
+            with open(f'{path}.tmp', 'w') as f:
+                json.dump(manifest, f)
+            os.replace(f'{path}.tmp', path)
+
+    def exists(self, path: str) -> bool:
+        return self.__fileEntry(path) is not None or os.path.isfile(path)
+
+    def size(self, path: str) -> int:
+        entry = self.__fileEntry(path)
+        return entry['size'] if entry is not None else os.path.getsize(path)
+
+    def written(self, path: str) -> int:
+        """
+        Bytes the backup added to disk when it was created: its new chunks and its manifest
+        """
+        directory, base, _ = self.__split(path)
+        manifest = self.__readManifest(directory, base)
+        if manifest is None:
+            return sum(os.path.getsize(os.path.join(directory, f'{base}{e}'))
+                       for e in self.FileKinds.keys() if os.path.exists(os.path.join(directory, f'{base}{e}')))
+        return sum(f.get('written', 0) for f in manifest['files'].values()) + \
+            os.path.getsize(self.__manifestPath(directory, base))
+
+    def checksum(self, path: str) -> str:
+        entry = self.__fileEntry(path)
+        if entry is not None:
+            return entry['sha256']
+        checksum = hashlib.sha256()
+        for data in self.readChunks(path):
+            checksum.update(data)
+        return checksum.hexdigest()
+
+    def readChunks(self, path: str) -> Iterator[bytes]:
+        entry = self.__fileEntry(path)
+        if entry is None:
+            with open(path, 'rb') as f:
+                yield from iter(lambda: f.read(65536), b'')
+            return
+        directory, _, _ = self.__split(path)
+        for chunk in entry['chunks']:
+            with open(self.__chunkPath(directory, chunk), 'rb') as f:
+                yield gzip.decompress(f.read())
+
+    def readLines(self, path: str) -> Iterator[str]:
+        pending = b""
+        for data in self.readChunks(path):
+            lines = (pending + data).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                yield line.decode() + "\n"
+        if len(pending) > 0:
+            yield pending.decode()
+
+    def read(self, path: str) -> str:
+        return b"".join(self.readChunks(path)).decode()
+
+    def list(self, directory: str) -> list[str]:
+        """
+        Logical .conf names of every backup in the directory
+        """
+        if not os.path.isdir(directory):
+            return []
+        backups = set()
+        for f in os.listdir(directory):
+            if f.endswith(self.ManifestSuffix):
+                backups.add(f'{f[:-len(self.ManifestSuffix)]}.conf')
+            elif f.endswith(".conf") and os.path.isfile(os.path.join(directory, f)):
+                backups.add(f)
+        return list(backups)
+
+    def delete(self, path: str):
+        """
+        Delete a backup (both files) and the chunks no other backup uses anymore
+        """
+        directory, base, _ = self.__split(path)
+        with self.__lock:
+            for f in [self.__manifestPath(directory, base)] + \
+                     [os.path.join(directory, f'{base}{e}') for e in self.FileKinds.keys()]:
+                if os.path.exists(f):
+                    os.remove(f)
+            self.collectGarbage(directory)
+
+    def collectGarbage(self, directory: str) -> int:
+        with self.__lock:
+            referenced = set()
+            for f in os.listdir(directory):
+                if f.endswith(self.ManifestSuffix):
+                    manifest = self.__readManifest(directory, f[:-len(self.ManifestSuffix)])
+                    if manifest is not None:
+                        for entry in manifest['files'].values():
+                            referenced.update(entry['chunks'])
+            removed = 0
+            chunks = os.path.join(directory, self.ChunkDirectory)
+            if not os.path.isdir(chunks):
+                return removed
+            for prefix in os.listdir(chunks):
+                for f in os.listdir(os.path.join(chunks, prefix)):
+                    if f.endswith(".gz") and f[:-3] not in referenced:
+                        os.remove(os.path.join(chunks, prefix, f))
+                        removed += 1
+            return removed
+
+    def migrate(self, directory: str) -> int:
+        """
+        Move plain .conf / .sql backups into the store, only files named like a backup (<name>_<14 digit date>)
+        are touched. Run once at startup, not on the listing path
+        """
+        migrated = 0
+        if not os.path.isdir(directory):
+            return migrated
+        with self.__lock:
+            for f in os.listdir(directory):
+                base, extension = os.path.splitext(f)
+                if extension != ".conf" or not self.BackupName.match(base) or not os.path.isfile(os.path.join(directory, f)) \
+                        or os.path.exists(self.__manifestPath(directory, base)):
+                    continue
+                plain = [os.path.join(directory, f'{base}{e}') for e in self.FileKinds.keys()]
+                with self.create(directory, base) as backup:
+                    for p in plain:
+                        if os.path.exists(p):
+                            with backup.open(os.path.splitext(p)[1]) as w, open(p, 'r') as r:
+                                for line in r:
+                                    w.write(line)
+                for p in plain:
+                    if os.path.exists(p):
+                        os.remove(p)
+                migrated += 1
+        return migrated
+
+    def toJson(self, directory: str) -> dict:
+        manifests = logical = 0
+        referenced = set()
+        if os.path.isdir(directory):
+            for f in os.listdir(directory):
+                if f.endswith(self.ManifestSuffix):
+                    manifest = self.__readManifest(directory, f[:-len(self.ManifestSuffix)])
+                    if manifest is None:
+                        continue
+                    manifests += 1
+                    for entry in manifest['files'].values():
+                        logical += entry['size']
+                        referenced.update(entry['chunks'])
+        stored = sum(os.path.getsize(self.__chunkPath(directory, c))
+                     for c in referenced if os.path.exists(self.__chunkPath(directory, c)))
+        return {
+            "Backups": manifests,
+            "Chunks": len(referenced),
+            "LogicalBytes": logical,
+            "StoredBytes": stored,
+            "Ratio": round(logical / stored, 2) if stored else 0
+        }
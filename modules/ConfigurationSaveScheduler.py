@@ -0,0 +1,107 @@
+"""
+Configuration Save Scheduler
+"""
+import threading, time
+from datetime import datetime
+from typing import Callable
+
+
+class ConfigurationSaveScheduler:
+    """
+    Debounced write-behind for `wg-quick save`.
+    Save requests for the same interface arriving within `delay` seconds are coalesced into one rewrite,
+    a burst is never held back for more than `maxDelay` seconds.
+    """
+    def __init__(self, delay: float = 1.0, maxDelay: float = 5.0):
+        self.delay = delay
+        self.maxDelay = maxDelay
+        self.__lock = threading.Lock()
+        self.__pending: dict[str, dict] = {}
+        self.__flushing: dict[str, threading.Lock] = {}
+        self.TotalRequests = 0
+        self.TotalSaves = 0
+        self.FailedSaves = 0
+        self.LastError: dict[str, str] = {}
+
+    def schedule(self, name: str, save: Callable[[], tuple[bool, str | None]]) -> None:
+        with self.__lock:
+            self.TotalRequests += 1
+            now = time.monotonic()
+            pending = self.__pending.get(name)
+            if pending is None:
+                pending = {
+                    "save": save,
+                    "firstRequest": now,
+                    "requestedAt": datetime.now(),
+                    "requests": 0,
+                    "timer": None
+                }
+                self.__pending[name] = pending
+            else:
+                pending['timer'].cancel()
+            pending['save'] = save
+            pending['requests'] += 1
+            wait = max(0, min(self.delay, pending['firstRequest'] + self.maxDelay - now))
+            pending['timer'] = threading.Timer(wait, self.flush, args=(name,))
+            pending['timer'].daemon = True
+            pending['timer'].start()
+
+    def flush(self, name: str) -> tuple[bool, str | None]:
+        """
+        Run the pending save for this interface right now, if there is one
+        """
+        with self.__lock:
+            flushLock = self.__flushing.setdefault(name, threading.Lock())
+        with flushLock:
+            with self.__lock:
+                pending = self.__pending.pop(name, None)
+            if pending is None:
+                return True, None
+            pending['timer'].cancel()
+            try:
+                status, message = pending['save']()
+            except Exception as e:
+                status, message = False, str(e)
+            with self.__lock:
+                self.TotalSaves += 1
+                if status:
+                    self.LastError.pop(name, None)
+                else:
+                    self.FailedSaves += 1
+                    self.LastError[name] = message
+            if not status:
+                print(f"[WGDashboard] Failed to save configuration {name}: {message}", flush=True)
+            return status, message
+
+    def flushAll(self) -> None:
+        with self.__lock:
+            names = list(self.__pending.keys())
+        for name in names:
+            self.flush(name)
+
+    def discard(self, name: str) -> None:
+        with self.__lock:
+            pending = self.__pending.pop(name, None)
+        if pending is not None:
+            pending['timer'].cancel()
+
+    def isPending(self, name: str) -> bool:
+        with self.__lock:
+            return name in self.__pending
+
+    def toJson(self):
+        with self.__lock:
+            return {
+                "Delay": self.delay,
+                "MaxDelay": self.maxDelay,
+                "TotalRequests": self.TotalRequests,
+                "TotalSaves": self.TotalSaves,
+                "FailedSaves": self.FailedSaves,
+                "Pending": {
+                    name: {
+                        "Requests": p['requests'],
+                        "RequestedAt": p['requestedAt'].strftime("%Y-%m-%d %H:%M:%S")
+                    } for name, p in self.__pending.items()
+                },
+                "LastError": dict(self.LastError)
+            }
@@ -0,0 +1,331 @@
+"""
+Dashboard Database
+"""
+import os, queue, sqlite3, threading, time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+
+class DashboardDatabase:
+    """
+    SQLite access layer for wgdashboard.db.
+    Every thread gets its own long-lived connection from the pool, connections run in WAL mode
+    and keep a statement cache so repeated statements are not prepared again.
+    """
+    Pragmas = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000
+    }
+
+    def __init__(self, path: str, cachedStatements: int = 256):
+        self.path = path
+        self.cachedStatements = cachedStatements
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        self.__connections: list[sqlite3.Connection] = []
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self.__local, "conn", None)
+        if conn is None or self.__local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                                   cached_statements=self.cachedStatements)
+            conn.row_factory = sqlite3.Row
+            for key, value in self.Pragmas.items():
+                conn.execute(f"PRAGMA {key} = {value}")
+            self.__local.conn = conn
+            self.__local.pid = os.getpid()
+            self.__local.depth = 0
+            with self.__lock:
+                self.__connections.append(conn)
+        return conn
+
+    def select(self, statement: str, parameters: tuple | dict = ()) -> sqlite3.Cursor:
+        return self.connection().execute(statement, parameters)
+
+    def update(self, statement: str, parameters: tuple | dict = ()) -> sqlite3.Cursor:
+        """
+        Run a write statement. Outside a transaction scope it commits on its own
+        """
+        return self.connection().execute(statement.rstrip().rstrip(';'), parameters)
+
+    def updateMany(self, statement: str, parameters: list) -> sqlite3.Cursor:
+        with self.transaction() as conn:
+            return conn.executemany(statement.rstrip().rstrip(';'), parameters)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Transaction scope for the current thread. Nested scopes join the outer transaction,
+        only the outermost one commits or rolls back
+        """
+        conn = self.connection()
+        if self.__local.depth > 0:
+            self.__local.depth += 1
+            try:
+                yield conn
+            finally:
+                self.__local.depth -= 1
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        self.__local.depth = 1
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            self.__local.depth = 0
+
+    @contextmanager
+    def snapshot(self):
+        """
+        Read-only scope: every select inside sees the same committed state without blocking the writer
+        """
+        conn = self.connection()
+        if self.__local.depth > 0:
+            yield conn
+            return
+        conn.execute("BEGIN DEFERRED")
+        self.__local.depth = 1
+        try:
+            yield conn
+        finally:
+            self.__local.depth = 0
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+
+    def inTransaction(self) -> bool:
+        return getattr(self.__local, "depth", 0) > 0
+
+    def closeAll(self):
+        with self.__lock:
+            for conn in self.__connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self.__connections.clear()
+        self.__local = threading.local()
+
+    def toJson(self):
+        with self.__lock:
+            connections = len(self.__connections)
+        return {
+            "Path": self.path,
+            "Connections": connections,
+            "Pragmas": self.Pragmas
+        }
+
+
+class DatabaseWriter:
+    """
+    Single writer thread for wgdashboard.db.
+    Callers queue write intents and get a Future back; the writer drains the queue and commits
+    up to `maxBatch` statements (or whatever arrived within `maxWait` seconds) in one transaction.
+    Transactions on other threads still take the write lock directly, a batch that cannot get it
+    within the busy timeout is retried `retries` times with backoff before its writes fail.
+    """
+    def __init__(self, database: DashboardDatabase, maxBatch: int = 500, maxWait: float = 0.005,
+                 retries: int = 5, retryDelay: float = 0.05):
+        self.database = database
+        self.maxBatch = maxBatch
+        self.maxWait = maxWait
+        self.retries = retries
+        self.retryDelay = retryDelay
+        self.__queue: queue.Queue = queue.Queue()
+        self.__thread: threading.Thread | None = None
+        self.__pid = None
+        self.__lock = threading.Lock()
+        self.Batches = 0
+        self.Statements = 0
+        self.FailedStatements = 0
+        self.RetriedBatches = 0
+        self.LastCommitLatency = 0.0
+        self.MaxCommitLatency = 0.0
+        self.__totalCommitLatency = 0.0
+
+    def __ensureStarted(self):
+        with self.__lock:
+            if self.__thread is None or not self.__thread.is_alive() or self.__pid != os.getpid():
+                self.__pid = os.getpid()
+                self.__thread = threading.Thread(target=self.__run, name="DatabaseWriter", daemon=True)
+                self.__thread.start()
+
+    def submit(self, statement: str, parameters: tuple | dict = ()) -> Future:
+        self.__ensureStarted()
+        future = Future()
+        self.__queue.put((statement.rstrip().rstrip(';'), parameters, future))
+        return future
+
+    def execute(self, statement: str, parameters: tuple | dict = ()):
+        """
+        Queue a write and wait until it is committed, so the caller can read its own write afterwards
+        """
+        return self.submit(statement, parameters).result()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until every write queued before this call is committed
+        """
+        if self.__thread is None or not self.__thread.is_alive():
+            return True
+        try:
+            self.submit("SELECT 1").result(timeout)
+            return True
+        except Exception:
+            return False
+
+    def __run(self):
+        conn = self.database.connection()
+        while True:
+            batch = [self.__queue.get()]
+            deadline = time.monotonic() + self.maxWait
+            while len(batch) < self.maxBatch:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self.__queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+            self.__commit(conn, batch)
+
+    @staticmethod
+    def __busy(error: Exception) -> bool:
+        return isinstance(error, sqlite3.OperationalError) and \
+            ("locked" in str(error) or "busy" in str(error))
+
+    def __attempt(self, conn: sqlite3.Connection, batch: list) -> list:
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for statement, parameters, future in batch:
+                # A savepoint per statement keeps one bad statement from failing the whole batch
+                conn.execute("SAVEPOINT write_intent")
+                try:
+                    results.append((future, conn.execute(statement, parameters).rowcount, None))
+                    conn.execute("RELEASE write_intent")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_intent")
+                    conn.execute("RELEASE write_intent")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return results
+
+    def __commit(self, conn: sqlite3.Connection, batch: list):
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                results = self.__attempt(conn, batch)
+                break
+            except Exception as e:
+                # The batch was rolled back as a whole, so it can be run again once the lock is free
+                if attempt < self.retries and self.__busy(e):
+                    with self.__lock:
+                        self.RetriedBatches += 1
+                    time.sleep(self.retryDelay * 2 ** attempt)
+                    continue
+                results = [(future, None, e) for _, _, future in batch]
+                break
+        latency = time.perf_counter() - start
+        with self.__lock:
+            self.Batches += 1
+            self.Statements += len(batch)
+            self.LastCommitLatency = latency
+            self.MaxCommitLatency = max(self.MaxCommitLatency, latency)
+            self.__totalCommitLatency += latency
+        for future, rowcount, error in results:
+            if error is None:
+                future.set_result(rowcount)
+            else:
+                with self.__lock:
+                    self.FailedStatements += 1
+                future.set_exception(error)
+
+    def toJson(self):
+        with self.__lock:
+            return {
+                "QueueDepth": self.__queue.qsize(),
+                "Batches": self.Batches,
+                "Statements": self.Statements,
+                "FailedStatements": self.FailedStatements,
+                "RetriedBatches": self.RetriedBatches,
+                "AverageBatchSize": round(self.Statements / self.Batches, 2) if self.Batches else 0,
+                "LastCommitLatencyMs": round(self.LastCommitLatency * 1000, 3),
+                "AverageCommitLatencyMs": round(self.__totalCommitLatency / self.Batches * 1000, 3) if self.Batches else 0,
+                "MaxCommitLatencyMs": round(self.MaxCommitLatency * 1000, 3)
+            }
+
+
+def benchmark(path: str, statements: int = 2000) -> dict[str, float]:
+    """
+    Statements per second of the old connection-per-statement access compared with the pooled layer
+    """
+    table = "benchmark_statements"
+    setup = sqlite3.connect(path)
+    with setup:
+        setup.execute(f"DROP TABLE IF EXISTS {table}")
+        setup.execute(f"CREATE TABLE {table} (id VARCHAR NOT NULL PRIMARY KEY, value FLOAT)")
+    setup.close()
+
+    start = time.perf_counter()
+    for i in range(statements):
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.execute(f"INSERT INTO {table} VALUES (?, ?)", (f"before-{i}", i))
+        conn.close()
+    legacyWrite = statements / (time.perf_counter() - start)
+
+    legacyReader = sqlite3.connect(path, check_same_thread=False)
+    start = time.perf_counter()
+    for i in range(statements):
+        legacyReader.execute(f"SELECT * FROM {table} WHERE id = ?", (f"before-{i}",)).fetchone()
+    legacyRead = statements / (time.perf_counter() - start)
+    legacyReader.close()
+
+    db = DashboardDatabase(path)
+    start = time.perf_counter()
+    for i in range(statements):
+        db.update(f"INSERT INTO {table} VALUES (?, ?)", (f"after-{i}", i))
+    pooledWrite = statements / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with db.transaction():
+        for i in range(statements):
+            db.update(f"INSERT INTO {table} VALUES (?, ?)", (f"transaction-{i}", i))
+    pooledTransactionWrite = statements / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(statements):
+        db.select(f"SELECT * FROM {table} WHERE id = ?", (f"after-{i}",)).fetchone()
+    pooledRead = statements / (time.perf_counter() - start)
+
+    db.update(f"DROP TABLE {table}")
+    db.closeAll()
+    return {
+        "legacy_write_per_sec": round(legacyWrite, 1),
+        "legacy_read_per_sec": round(legacyRead, 1),
+        "pooled_write_per_sec": round(pooledWrite, 1),
+        "pooled_transaction_write_per_sec": round(pooledTransactionWrite, 1),
+        "pooled_read_per_sec": round(pooledRead, 1)
+    }
+
+
+if __name__ == "__main__":
+    import os, sys, tempfile
+    with tempfile.TemporaryDirectory() as d:
+        result = benchmark(os.path.join(d, "benchmark.db"), int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
+    for k, v in result.items():
+        print(f"{k:<36}{v:>12}")
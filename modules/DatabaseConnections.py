@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+DatabaseConnections - Module for sharing SQLite connections between the user, RBAC and organization managers
+Connections are kept per thread and have the other databases ATTACHed, so queries can join across them
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+DB_DIR = os.path.join(os.path.dirname(__file__), '..', 'db')
+DEFAULT_DATABASES = {
+    'users': os.path.join(DB_DIR, 'users.db'),
+    'rbac': os.path.join(DB_DIR, 'rbac.db'),
+    'organization': os.path.join(DB_DIR, 'organization.db')
+}
+
+
+class PooledConnection:
+    """
+    A pooled connection used like the one sqlite3.connect returns: `with` commits or rolls back,
+    close() discards what was not committed. Both hand the connection back to the thread's pool
+    """
+
+    def __init__(self, pool: list, pool_size: int, conn: sqlite3.Connection):
+        self._pool = pool
+        self._pool_size = pool_size
+        self._conn = conn
+
+    @property
+    def row_factory(self):
+        return self._conn.row_factory
+
+    @row_factory.setter
+    def row_factory(self, factory):
+        self._conn.row_factory = factory
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._conn is None:
+            return False
+        if exc_type is None:
+            self._conn.commit()
+        self.close()
+        return False
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+        if len(self._pool) < self._pool_size:
+            self._pool.append(conn)
+        else:
+            conn.close()
+
+
+class DatabaseConnections:
+    def __init__(self, databases: Dict[str, str] = None, pool_size: int = 2):
+        self.databases = dict(databases or {})
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._local = threading.local()
+
+    def register(self, name: str, path: str, replace: bool = True):
+        """Register a database under a schema name; registered later, it is attached to new connections"""
+        path = os.path.abspath(path)
+        with self._lock:
+            if self.databases.get(name) == path or (not replace and name in self.databases):
+                return
+            self.databases[name] = path
+            self._generation += 1
+
+    def _pools(self) -> Dict[str, list]:
+        local = self._local
+        if getattr(local, 'generation', None) != self._generation:
+            for pool in getattr(local, 'pools', {}).values():
+                for conn in pool:
+                    conn.close()
+            local.pools = {}
+            local.generation = self._generation
+        return local.pools
+
+    def _open(self, name: str) -> sqlite3.Connection:
+        with self._lock:
+            databases = dict(self.databases)
+        conn = sqlite3.connect(databases[name])
+        for schema, path in databases.items():
+            if schema != name:
+                conn.execute("ATTACH DATABASE ? AS " + schema, (path,))
+        return conn
+
+    def connect(self, name: str) -> PooledConnection:
+        """
+        Connection to one database with the others attached under their names. Unqualified
+        tables resolve to `name` first, tables of the others are written as `schema.table`
+        """
+        if name not in self.databases:
+            raise KeyError(f'Unknown database: {name}')
+        pools = self._pools()
+        pool = pools.setdefault(name, [])
+        # A connection in use (e.g. by the caller of a nested call) is not in the pool, so it is never shared
+        conn = pool.pop() if pool else self._open(name)
+        return PooledConnection(pool, self.pool_size, conn)
+
+    def close(self):
+        """Close the idle connections of the calling thread"""
+        for pool in getattr(self._local, 'pools', {}).values():
+            while pool:
+                pool.pop().close()
+
+
+_shared: Optional[DatabaseConnections] = None
+_shared_lock = threading.Lock()
+
+
+def get_database_connections() -> DatabaseConnections:
+    """Connections shared by the managers of this process"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = DatabaseConnections({name: os.path.abspath(path) for name, path in DEFAULT_DATABASES.items()})
+        return _shared
@@ -4,18 +4,49 @@ Enhanced RBAC Manager
 Supports scalable User ↔ Group ↔ Organization ↔ Subnet/Policy model
 """
 
+import copy
 import sqlite3
 import os
 import json
+import threading
 from datetime import datetime
+from collections import Counter
+from itertools import chain, islice
 from typing import Dict, List, Optional, Tuple
+from .PushRouteManager import PushRouteManager
+from .DatabaseConnections import DatabaseConnections, get_database_connections
+from .HierarchyReadModel import HierarchyReadModel
+from Utilities import GenerateWireguardKeyPairs
 
 class EnhancedRBACManager:
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, connections: DatabaseConnections = None):
         if db_path is None:
             db_path = os.path.join(os.path.dirname(__file__), '..', 'db', 'rbac.db')
         self.db_path = db_path
+        # rbac.db with users.db and organization.db attached as `users` and `organization`
+        self.connections = connections or get_database_connections()
+        self.connections.register('rbac', self.db_path)
+        # Effective access per peer, dropped through the indexes when what it was computed from changes
+        self._access_lock = threading.RLock()
+        self._access_cache = {}
+        self._group_access_index = {}
+        self._organization_access_index = {}
+        self.wireguard_configurations = None
         self.init_database()
+        self.push_routes = PushRouteManager(self.db_path)
+        self.hierarchy = HierarchyReadModel(self.connections)
+
+    def set_wireguard_configurations(self, configurations: Dict):
+        """Use the dashboard's WireGuard configurations instead of importing them on every call"""
+        self.wireguard_configurations = configurations
+
+    def _get_wireguard_configurations(self) -> Dict:
+        if self.wireguard_configurations is None:
+            import sys
+            sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+            from dashboard import WireguardConfigurations
+            self.wireguard_configurations = WireguardConfigurations
+        return self.wireguard_configurations
     
     def init_database(self):
         """Initialize database connection and verify schema"""
@@ -41,13 +72,23 @@ class EnhancedRBACManager:
                 print(f"[EnhancedRBAC] Database initialized: {self.db_path}")
         except Exception as e:
             print(f"[EnhancedRBAC] Database initialization error: {e}")
+        try:
+            # Group peer summaries are counted per (group, peer generated) straight from this index
+            with self.connections.connect('users') as conn:
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_groups'").fetchone():
+                    conn.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_user_groups_group_peer_generated
+                        ON user_groups (group_id, vpn_peer_generated)
+                    """)
+        except Exception as e:
+            print(f"[EnhancedRBAC] Error creating user_groups index: {e}")
     
     # ==================== ORGANIZATION MANAGEMENT ====================
     
     def get_all_organizations(self) -> Dict:
         """Get all organizations with subnet counts"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 
@@ -74,7 +115,7 @@ class EnhancedRBACManager:
     def create_organization(self, name: str, description: str = '', color: str = '#007bff') -> Dict:
         """Create new organization"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -96,7 +137,7 @@ class EnhancedRBACManager:
     def get_all_groups(self) -> Dict:
         """Get all groups with organization and peer counts"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 
@@ -123,7 +164,7 @@ class EnhancedRBACManager:
     def get_group(self, group_id: int) -> Dict:
         """Get a specific RBAC group by ID"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 
@@ -143,7 +184,7 @@ class EnhancedRBACManager:
     def create_group(self, name: str, description: str = '', color: str = '#007bff') -> Dict:
         """Create new group"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -165,7 +206,7 @@ class EnhancedRBACManager:
     def attach_group_to_organization(self, group_id: int, organization_id: int) -> Dict:
         """Attach group to organization"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -174,6 +215,7 @@ class EnhancedRBACManager:
                 """, (group_id, organization_id))
                 
                 conn.commit()
+                self.refresh_effective_access(group_ids=[group_id])
                 
                 return {'status': True, 'message': 'Group attached to organization successfully'}
         except sqlite3.IntegrityError:
@@ -184,7 +226,7 @@ class EnhancedRBACManager:
     def detach_group_from_organization(self, group_id: int, organization_id: int) -> Dict:
         """Detach group from organization"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -204,6 +246,7 @@ class EnhancedRBACManager:
                 """, (group_id, organization_id))
                 
                 conn.commit()
+                self.refresh_effective_access(group_ids=[group_id])
                 
                 return {'status': True, 'message': 'Group detached from organization successfully'}
         except Exception as e:
@@ -212,55 +255,34 @@ class EnhancedRBACManager:
     def get_group_organizations(self, group_id: int) -> Dict:
         """Get organizations attached to a group"""
         try:
-            # Get attached organization IDs from rbac.db
-            with sqlite3.connect(self.db_path) as rbac_conn:
-                rbac_cursor = rbac_conn.cursor()
-                rbac_cursor.execute("""
-                    SELECT organization_id, attached_at
-                    FROM rbac_group_organizations
-                    WHERE group_id = ?
-                    ORDER BY attached_at
-                """, (group_id,))
-                attached_orgs = rbac_cursor.fetchall()
-            
-            if not attached_orgs:
-                return {'status': True, 'data': [], 'message': 'Group organizations retrieved successfully'}
-            
-            # Get organization details from organization.db
-            org_db_path = os.path.join(os.path.dirname(__file__), '..', 'db', 'organization.db')
-            org_ids = [org[0] for org in attached_orgs]
-            placeholders = ','.join(['?' for _ in org_ids])
-            
-            with sqlite3.connect(org_db_path) as org_conn:
-                org_conn.row_factory = sqlite3.Row
-                org_cursor = org_conn.cursor()
-                org_cursor.execute(f"""
+            # Attachments are in rbac.db, organization details in the attached organization.db
+            with self.connections.connect('rbac') as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute("""
                     SELECT o.*, 
                            COUNT(os.id) as subnet_count,
-                           COUNT(uo.user_id) as user_count
-                    FROM organizations o
-                    LEFT JOIN organization_subnets os ON o.id = os.organization_id
-                    LEFT JOIN user_organizations uo ON o.id = uo.organization_id
-                    WHERE o.id IN ({placeholders})
+                           COUNT(uo.user_id) as user_count,
+                           go.attached_at
+                    FROM rbac_group_organizations go
+                    JOIN organization.organizations o ON o.id = go.organization_id
+                    LEFT JOIN organization.organization_subnets os ON o.id = os.organization_id
+                    LEFT JOIN organization.user_organizations uo ON o.id = uo.organization_id
+                    WHERE go.group_id = ?
                     GROUP BY o.id
                     ORDER BY o.name
-                """, org_ids)
-                
-                organizations = [dict(row) for row in org_cursor.fetchall()]
+                """, (group_id,))
                 
-                # Add attached_at timestamp
-                attached_dict = {org[0]: org[1] for org in attached_orgs}
-                for org in organizations:
-                    org['attached_at'] = attached_dict[org['id']]
+                organizations = [dict(row) for row in cursor.fetchall()]
                 
-                return {'status': True, 'data': organizations, 'message': 'Group organizations retrieved successfully'}                                                                                                 
+                return {'status': True, 'data': organizations, 'message': 'Group organizations retrieved successfully'}
         except Exception as e:
             return {'status': False, 'message': f'Error fetching group organizations: {str(e)}', 'data': None}
     
     def update_group_vpn_assignment(self, group_id: int, vpn_data: Dict) -> Dict:
         """Update VPN assignment for a group"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -296,7 +318,7 @@ class EnhancedRBACManager:
     def get_group_vpn_assignment(self, group_id: int) -> Dict:
         """Get VPN assignment for a group"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 
@@ -321,35 +343,31 @@ class EnhancedRBACManager:
     def get_group_vpn_subnets(self, group_id: int) -> Dict:
         """Get all subnets from attached organizations for VPN routing"""
         try:
-            # Get attached organizations
-            orgs_result = self.get_group_organizations(group_id)
-            if not orgs_result['status']:
-                return {'status': False, 'message': 'Error fetching group organizations', 'data': []}
-            
-            organizations = orgs_result['data']
-            if not organizations:
-                return {'status': True, 'data': [], 'message': 'No organizations attached to group'}
-            
-            # Get subnets from all attached organizations
-            org_db_path = os.path.join(os.path.dirname(__file__), '..', 'db', 'organization.db')
-            org_ids = [org['id'] for org in organizations]
-            placeholders = ','.join(['?' for _ in org_ids])
-            
-            with sqlite3.connect(org_db_path) as org_conn:
-                org_conn.row_factory = sqlite3.Row
-                org_cursor = org_conn.cursor()
+            with self.connections.connect('rbac') as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
                 
-                org_cursor.execute(f"""
+                cursor.execute("""
+                    SELECT COUNT(*) FROM rbac_group_organizations go
+                    JOIN organization.organizations o ON o.id = go.organization_id
+                    WHERE go.group_id = ?
+                """, (group_id,))
+                organization_count = cursor.fetchone()[0]
+                if not organization_count:
+                    return {'status': True, 'data': [], 'message': 'No organizations attached to group'}
+                
+                cursor.execute("""
                     SELECT os.*, o.name as organization_name, o.color as organization_color
-                    FROM organization_subnets os
-                    JOIN organizations o ON os.organization_id = o.id
-                    WHERE os.organization_id IN ({placeholders})
+                    FROM rbac_group_organizations go
+                    JOIN organization.organizations o ON o.id = go.organization_id
+                    JOIN organization.organization_subnets os ON os.organization_id = o.id
+                    WHERE go.group_id = ?
                     ORDER BY o.name, os.is_primary DESC, os.subnet_cidr
-                """, org_ids)
+                """, (group_id,))
                 
-                subnets = [dict(row) for row in org_cursor.fetchall()]
+                subnets = [dict(row) for row in cursor.fetchall()]
                 
-                return {'status': True, 'data': subnets, 'message': f'Retrieved {len(subnets)} subnets from {len(organizations)} organizations'}
+                return {'status': True, 'data': subnets, 'message': f'Retrieved {len(subnets)} subnets from {organization_count} organizations'}
                 
         except Exception as e:
             return {'status': False, 'message': f'Error fetching group VPN subnets: {str(e)}', 'data': None}
@@ -357,7 +375,7 @@ class EnhancedRBACManager:
     def get_groups_by_vpn_server(self, server_name: str) -> Dict:
         """Get all groups assigned to a specific VPN server"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 
@@ -379,7 +397,7 @@ class EnhancedRBACManager:
     def get_organization_groups(self, organization_id: int) -> Dict:
         """Get groups attached to an organization"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 
@@ -402,7 +420,7 @@ class EnhancedRBACManager:
     def get_effective_policies_for_group(self, group_id: int) -> Dict:
         """Get effective policies for a group (inherited + overridden)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 
@@ -459,7 +477,7 @@ class EnhancedRBACManager:
                                priority: int = 100, is_override: bool = False) -> Dict:
         """Add filter policy to group (can be organization-specific)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -470,6 +488,7 @@ class EnhancedRBACManager:
                 
                 policy_id = cursor.lastrowid
                 conn.commit()
+                self.refresh_effective_access(group_ids=[group_id])
                 
                 return {'status': True, 'data': {'id': policy_id}, 'message': 'Filter policy added successfully'}
         except Exception as e:
@@ -480,7 +499,7 @@ class EnhancedRBACManager:
                             priority: int = 100, is_override: bool = False) -> Dict:
         """Add NAT policy to group (can be organization-specific)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -491,6 +510,7 @@ class EnhancedRBACManager:
                 
                 policy_id = cursor.lastrowid
                 conn.commit()
+                self.refresh_effective_access(group_ids=[group_id])
                 
                 return {'status': True, 'data': {'id': policy_id}, 'message': 'NAT policy added successfully'}
         except Exception as e:
@@ -498,181 +518,363 @@ class EnhancedRBACManager:
     
     # ==================== EFFECTIVE ACCESS CALCULATION ====================
     
+    @staticmethod
+    def _placeholders(values) -> str:
+        return ', '.join('?' for _ in values)
+
+    def _compute_effective_access(self, peer_names: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """
+        Effective access of the given peers (every peer in a group when None) with four set-based
+        queries: memberships, organizations with their subnets, filter policies and NAT policies.
+        Organizations and subnets are read from organization.db, rbac.db only adds the default filter policy
+        """
+        with self.connections.connect('rbac') as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+
+            peer_filter, params = '', ()
+            if peer_names is not None:
+                peer_filter, params = f"WHERE gp.peer_name IN ({self._placeholders(peer_names)})", tuple(peer_names)
+            cursor.execute(f"""
+                SELECT gp.peer_name, g.id as group_id, g.name as group_name, g.inherit_org_policies
+                FROM rbac_group_peers gp
+                JOIN rbac_groups g ON g.id = gp.group_id
+                {peer_filter}
+                ORDER BY gp.peer_name, g.id
+            """, params)
+            memberships = cursor.fetchall()
+
+            group_ids = sorted({row['group_id'] for row in memberships})
+            organizations, filter_policies, nat_policies = {}, {}, {}
+            if group_ids:
+                group_filter = f"IN ({self._placeholders(group_ids)})"
+                cursor.execute(f"""
+                    SELECT go.group_id, o.id as organization_id, o.name as organization_name,
+                           COALESCE(po.default_filter_policy, 'allow') as default_filter_policy,
+                           s.subnet_cidr, s.description, s.is_primary
+                    FROM rbac_group_organizations go
+                    JOIN organization.organizations o ON o.id = go.organization_id
+                    LEFT JOIN organization.organization_subnets s ON s.organization_id = o.id
+                    LEFT JOIN organizations po ON po.id = o.id
+                    WHERE go.group_id {group_filter}
+                    ORDER BY go.group_id, o.id, s.id
+                """, group_ids)
+                for row in cursor.fetchall():
+                    organization = organizations.setdefault(row['group_id'], {}).setdefault(row['organization_id'], {
+                        'name': row['organization_name'],
+                        'default_filter_policy': row['default_filter_policy'],
+                        'subnets': []
+                    })
+                    if row['subnet_cidr'] is not None:
+                        organization['subnets'].append(row)
+
+                cursor.execute(f"""
+                    SELECT group_id, organization_id, destination, action, protocol, port, priority, is_override
+                    FROM rbac_group_filter_policies
+                    WHERE group_id {group_filter}
+                    ORDER BY rowid
+                """, group_ids)
+                for row in cursor.fetchall():
+                    filter_policies.setdefault((row['group_id'], row['organization_id']), []).append(row)
+
+                cursor.execute(f"""
+                    SELECT group_id, organization_id, destination, action, translated_ip, translated_port, priority, is_override
+                    FROM rbac_group_nat_policies
+                    WHERE group_id {group_filter}
+                    ORDER BY rowid
+                """, group_ids)
+                for row in cursor.fetchall():
+                    nat_policies.setdefault((row['group_id'], row['organization_id']), []).append(row)
+
+        results = {peer_name: {
+            'peer_name': peer_name,
+            'groups': [],
+            'subnets': [],
+            'filter_rules': [],
+            'nat_rules': [],
+            'group_ids': [],
+            'organization_ids': []
+        } for peer_name in (peer_names or [])}
+        for membership in memberships:
+            effective_access = results.setdefault(membership['peer_name'], {
+                'peer_name': membership['peer_name'],
+                'groups': [],
+                'subnets': [],
+                'filter_rules': [],
+                'nat_rules': [],
+                'group_ids': [],
+                'organization_ids': []
+            })
+            group_id, group_name = membership['group_id'], membership['group_name']
+            effective_access['groups'].append({
+                'group_id': group_id,
+                'group_name': group_name,
+                'inherit_org_policies': membership['inherit_org_policies']
+            })
+            effective_access['group_ids'].append(group_id)
+            for org_id, org in organizations.get(group_id, {}).items():
+                org_name = org['name']
+                effective_access['organization_ids'].append(org_id)
+                for subnet in org['subnets']:
+                    effective_access['subnets'].append({
+                        'subnet_cidr': subnet['subnet_cidr'],
+                        'description': subnet['description'],
+                        'is_primary': subnet['is_primary'],
+                        'organization_name': org_name,
+                        'group_name': group_name,
+                        'group_id': group_id,
+                        'organization_id': org_id,
+                        'source': 'org_subnet'
+                    })
+                if membership['inherit_org_policies'] and org['default_filter_policy'] != 'none':
+                    effective_access['filter_rules'].append({
+                        'type': 'filter',
+                        'action': org['default_filter_policy'],
+                        'destination': f"{org_name}_default",
+                        'organization_name': org_name,
+                        'group_name': group_name,
+                        'group_id': group_id,
+                        'organization_id': org_id,
+                        'source': 'org_default',
+                        'priority': 50
+                    })
+                for policy in filter_policies.get((group_id, org_id), []):
+                    effective_access['filter_rules'].append({
+                        'type': 'filter',
+                        'action': policy['action'],
+                        'destination': policy['destination'],
+                        'protocol': policy['protocol'],
+                        'port': policy['port'],
+                        'organization_name': org_name,
+                        'group_name': group_name,
+                        'group_id': group_id,
+                        'organization_id': org_id,
+                        'source': 'group_override' if policy['is_override'] else 'group_policy',
+                        'priority': policy['priority']
+                    })
+                for policy in nat_policies.get((group_id, org_id), []):
+                    effective_access['nat_rules'].append({
+                        'type': 'nat',
+                        'action': policy['action'],
+                        'destination': policy['destination'],
+                        'translated_ip': policy['translated_ip'],
+                        'translated_port': policy['translated_port'],
+                        'organization_name': org_name,
+                        'group_name': group_name,
+                        'group_id': group_id,
+                        'organization_id': org_id,
+                        'source': 'group_override' if policy['is_override'] else 'group_policy',
+                        'priority': policy['priority']
+                    })
+
+        for effective_access in results.values():
+            # Remove duplicates and sort by priority
+            effective_access['subnets'] = list({v['subnet_cidr']: v for v in effective_access['subnets']}.values())
+            effective_access['filter_rules'].sort(key=lambda x: x['priority'], reverse=True)
+            effective_access['nat_rules'].sort(key=lambda x: x['priority'], reverse=True)
+        return results
+
+    def _cache_effective_access(self, results: Dict[str, Dict]):
+        """Keep computed access with reverse indexes from groups and organizations to the peers depending on them"""
+        with self._access_lock:
+            for peer_name, effective_access in results.items():
+                self._drop_effective_access(peer_name)
+                self._access_cache[peer_name] = effective_access
+                for group_id in effective_access['group_ids']:
+                    self._group_access_index.setdefault(group_id, set()).add(peer_name)
+                for org_id in effective_access['organization_ids']:
+                    self._organization_access_index.setdefault(org_id, set()).add(peer_name)
+
+    def _drop_effective_access(self, peer_name: str):
+        effective_access = self._access_cache.pop(peer_name, None)
+        if effective_access is None:
+            return
+        for index, keys in ((self._group_access_index, effective_access['group_ids']),
+                            (self._organization_access_index, effective_access['organization_ids'])):
+            for key in keys:
+                peers = index.get(key)
+                if peers is not None:
+                    peers.discard(peer_name)
+                    if not peers:
+                        del index[key]
+
+    def invalidate_effective_access(self, peer_names: List[str] = None, group_ids: List[int] = None,
+                                    organization_ids: List[int] = None) -> set:
+        """
+        Forget cached effective access of the named peers and of every peer depending on the given
+        groups or organizations; without arguments the whole cache. Returns the peers dropped
+        """
+        with self._access_lock:
+            if peer_names is None and group_ids is None and organization_ids is None:
+                dropped = set(self._access_cache)
+            else:
+                dropped = set(peer_names or [])
+                for group_id in group_ids or []:
+                    dropped |= self._group_access_index.get(group_id, set())
+                for org_id in organization_ids or []:
+                    dropped |= self._organization_access_index.get(org_id, set())
+            for peer_name in dropped:
+                self._drop_effective_access(peer_name)
+            return dropped
+
+    @staticmethod
+    def _effective_access_view(effective_access: Dict) -> Dict:
+        """Copy of a cached entry without its dependency lists"""
+        view = copy.deepcopy(effective_access)
+        view.pop('group_ids')
+        view.pop('organization_ids')
+        return view
+
     def calculate_effective_access(self, peer_name: str) -> Dict:
         """Calculate effective access for a peer based on their group memberships"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                # Get peer's groups
-                cursor.execute("""
-                    SELECT g.id as group_id, g.name as group_name, g.inherit_org_policies
-                    FROM rbac_groups g
-                    JOIN rbac_group_peers gp ON g.id = gp.group_id
-                    WHERE gp.peer_name = ?
-                """, (peer_name,))
-                
-                peer_groups = cursor.fetchall()
-                
-                effective_access = {
-                    'peer_name': peer_name,
-                    'groups': [dict(group) for group in peer_groups],
-                    'subnets': [],
-                    'filter_rules': [],
-                    'nat_rules': []
-                }
-                
-                for group in peer_groups:
-                    group_id = group['group_id']
-                    group_name = group['group_name']
-                    inherit_org_policies = group['inherit_org_policies']
-                    
-                    # Get organizations attached to this group
-                    cursor.execute("""
-                        SELECT o.id, o.name, o.default_filter_policy, o.default_nat_policy
-                        FROM organizations o
-                        JOIN rbac_group_organizations go ON o.id = go.organization_id
-                        WHERE go.group_id = ?
-                    """, (group_id,))
-                    
-                    organizations = cursor.fetchall()
-                    
-                    for org in organizations:
-                        org_id = org['id']
-                        org_name = org['name']
-                        
-                        # Get organization subnets
-                        cursor.execute("""
-                            SELECT subnet_cidr, description, is_primary
-                            FROM organization_subnets
-                            WHERE organization_id = ? AND routing_enabled = 1
-                        """, (org_id,))
-                        
-                        subnets = cursor.fetchall()
-                        
-                        for subnet in subnets:
-                            subnet_info = {
-                                'subnet_cidr': subnet['subnet_cidr'],
-                                'description': subnet['description'],
-                                'is_primary': subnet['is_primary'],
-                                'organization_name': org_name,
-                                'group_name': group_name,
-                                'source': 'org_subnet'
-                            }
-                            effective_access['subnets'].append(subnet_info)
-                        
-                        # Get group-specific policies for this organization
-                        if inherit_org_policies:
-                            # Add organization default policies
-                            if org['default_filter_policy'] != 'none':
-                                rule = {
-                                    'type': 'filter',
-                                    'action': org['default_filter_policy'],
-                                    'destination': f"{org_name}_default",
-                                    'organization_name': org_name,
-                                    'group_name': group_name,
-                                    'source': 'org_default',
-                                    'priority': 50
-                                }
-                                effective_access['filter_rules'].append(rule)
-                        
-                        # Get group override policies
-                        cursor.execute("""
-                            SELECT destination, action, protocol, port, priority, is_override
-                            FROM rbac_group_filter_policies
-                            WHERE group_id = ? AND organization_id = ?
-                        """, (group_id, org_id))
-                        
-                        for policy in cursor.fetchall():
-                            rule = {
-                                'type': 'filter',
-                                'action': policy['action'],
-                                'destination': policy['destination'],
-                                'protocol': policy['protocol'],
-                                'port': policy['port'],
-                                'organization_name': org_name,
-                                'group_name': group_name,
-                                'source': 'group_override' if policy['is_override'] else 'group_policy',
-                                'priority': policy['priority']
-                            }
-                            effective_access['filter_rules'].append(rule)
-                        
-                        # Get NAT policies
-                        cursor.execute("""
-                            SELECT destination, action, translated_ip, translated_port, priority, is_override
-                            FROM rbac_group_nat_policies
-                            WHERE group_id = ? AND organization_id = ?
-                        """, (group_id, org_id))
-                        
-                        for policy in cursor.fetchall():
-                            rule = {
-                                'type': 'nat',
-                                'action': policy['action'],
-                                'destination': policy['destination'],
-                                'translated_ip': policy['translated_ip'],
-                                'translated_port': policy['translated_port'],
-                                'organization_name': org_name,
-                                'group_name': group_name,
-                                'source': 'group_override' if policy['is_override'] else 'group_policy',
-                                'priority': policy['priority']
-                            }
-                            effective_access['nat_rules'].append(rule)
-                
-                # Remove duplicates and sort by priority
-                effective_access['subnets'] = list({v['subnet_cidr']: v for v in effective_access['subnets']}.values())
-                effective_access['filter_rules'].sort(key=lambda x: x['priority'], reverse=True)
-                effective_access['nat_rules'].sort(key=lambda x: x['priority'], reverse=True)
-                
-                return {'status': True, 'data': effective_access, 'message': 'Effective access calculated successfully'}
+            with self._access_lock:
+                effective_access = self._access_cache.get(peer_name)
+            if effective_access is None:
+                results = self._compute_effective_access([peer_name])
+                self._cache_effective_access(results)
+                effective_access = results[peer_name]
+            
+            return {'status': True, 'data': self._effective_access_view(effective_access), 'message': 'Effective access calculated successfully'}
+        except Exception as e:
+            return {'status': False, 'message': f'Error calculating effective access: {str(e)}', 'data': None}
+    
+    def calculate_all_effective_access(self) -> Dict:
+        """Calculate effective access of every peer in a group in one pass"""
+        try:
+            results = self._compute_effective_access()
+            self._cache_effective_access(results)
+            data = [self._effective_access_view(effective_access) for effective_access in results.values()]
+            
+            return {'status': True, 'data': data, 'message': f'Effective access calculated for {len(data)} peers'}
         except Exception as e:
             return {'status': False, 'message': f'Error calculating effective access: {str(e)}', 'data': None}
     
+    def _dependent_peers(self, cursor, peer_names: List[str] = None, group_ids: List[int] = None,
+                         organization_ids: List[int] = None) -> set:
+        """
+        Peers whose effective access depends on the given groups or organizations: members of the
+        groups and of the groups attached to the organizations, plus peers whose cached or materialized
+        access still refers to them (e.g. after leaving a group or a detach)
+        """
+        group_ids, organization_ids = list(group_ids or []), list(organization_ids or [])
+        peers = set(peer_names or [])
+        with self._access_lock:
+            for group_id in group_ids:
+                peers |= self._group_access_index.get(group_id, set())
+            for org_id in organization_ids:
+                peers |= self._organization_access_index.get(org_id, set())
+        if group_ids:
+            groups = self._placeholders(group_ids)
+            cursor.execute(f"SELECT peer_name FROM rbac_group_peers WHERE group_id IN ({groups})", group_ids)
+            peers.update(row[0] for row in cursor.fetchall())
+        if organization_ids:
+            orgs = self._placeholders(organization_ids)
+            cursor.execute(f"""
+                SELECT gp.peer_name FROM rbac_group_peers gp
+                JOIN rbac_group_organizations go ON go.group_id = gp.group_id
+                WHERE go.organization_id IN ({orgs})
+            """, organization_ids)
+            peers.update(row[0] for row in cursor.fetchall())
+        if group_ids or organization_ids:
+            for table in ('rbac_effective_access', 'rbac_effective_rules'):
+                cursor.execute(f"""
+                    SELECT DISTINCT peer_name FROM {table}
+                    WHERE group_id IN ({self._placeholders(group_ids)}) OR organization_id IN ({self._placeholders(organization_ids)})
+                """, group_ids + organization_ids)
+                peers.update(row[0] for row in cursor.fetchall())
+        return peers
+
+    @staticmethod
+    def _materialized_rows(peer_name: str, effective_access: Dict) -> Tuple[List[tuple], List[tuple]]:
+        """Rows of rbac_effective_access and rbac_effective_rules for one peer, without their timestamps"""
+        access = [(
+            peer_name,
+            subnet.get('group_id', 0),
+            subnet.get('organization_id', 0),
+            subnet['subnet_cidr'],
+            'allow',  # Default filter action
+            'none'    # Default NAT action
+        ) for subnet in effective_access['subnets']]
+        rules = [(
+            peer_name,
+            rule.get('group_id', 0),
+            rule.get('organization_id', 0),
+            rule['type'],
+            json.dumps(rule),
+            rule['source']
+        ) for rule in effective_access['filter_rules'] + effective_access['nat_rules']]
+        return access, rules
+
+    def _write_effective_access(self, cursor, results: Dict[str, Dict]) -> Dict:
+        """
+        Bring the materialized rows of the given peers to `results`: rows that did not change are
+        kept, stale ones deleted and new ones inserted with executemany. Runs in the caller's transaction
+        """
+        peers = list(results)
+        if not peers:
+            return {'deleted': 0, 'inserted': 0, 'kept': 0}
+        desired = {'rbac_effective_access': [], 'rbac_effective_rules': []}
+        for peer_name, effective_access in results.items():
+            access, rules = self._materialized_rows(peer_name, effective_access)
+            desired['rbac_effective_access'] += access
+            desired['rbac_effective_rules'] += rules
+
+        now = datetime.now().isoformat()
+        stats = {'deleted': 0, 'inserted': 0, 'kept': 0}
+        for table, columns, timestamp in (
+                ('rbac_effective_access', 'peer_name, group_id, organization_id, subnet_cidr, filter_action, nat_action', 'last_updated'),
+                ('rbac_effective_rules', 'peer_name, group_id, organization_id, rule_type, rule_content, source', 'generated_at')):
+            wanted = Counter(desired[table])
+            stale = []
+            cursor.execute(f"SELECT id, {columns} FROM {table} WHERE peer_name IN ({self._placeholders(peers)})", peers)
+            for row in cursor.fetchall():
+                key = tuple(row[1:])
+                if wanted[key] > 0:
+                    wanted[key] -= 1
+                    stats['kept'] += 1
+                else:
+                    stale.append((row[0],))
+            added = [key + (now,) for key, count in wanted.items() for _ in range(count)]
+            cursor.executemany(f"DELETE FROM {table} WHERE id = ?", stale)
+            cursor.executemany(f"INSERT INTO {table} ({columns}, {timestamp}) VALUES ({self._placeholders(range(7))})", added)
+            stats['deleted'] += len(stale)
+            stats['inserted'] += len(added)
+        return stats
+
+    def refresh_effective_access(self, peer_names: List[str] = None, group_ids: List[int] = None,
+                                 organization_ids: List[int] = None) -> Dict:
+        """
+        Recompute the effective access of the peers depending on what changed and update their
+        cached and materialized access in one transaction; other peers are not touched
+        """
+        try:
+            with self._access_lock:
+                with self.connections.connect('rbac') as conn:
+                    peers = sorted(self._dependent_peers(conn.cursor(), peer_names, group_ids, organization_ids))
+                self.invalidate_effective_access(peer_names=peers)
+                if not peers:
+                    return {'status': True, 'message': 'No peers affected', 'data': {'peers': []}}
+                results = self._compute_effective_access(peers)
+                with self.connections.connect('rbac') as conn:
+                    stats = self._write_effective_access(conn.cursor(), results)
+                    conn.commit()
+                self._cache_effective_access(results)
+            
+            return {'status': True, 'message': f'Effective access refreshed for {len(peers)} peers',
+                    'data': {'peers': peers, **stats}}
+        except Exception as e:
+            print(f"[EnhancedRBAC] Error refreshing effective access: {e}")
+            return {'status': False, 'message': f'Error refreshing effective access: {str(e)}', 'data': None}
+
     def save_effective_access(self, peer_name: str, effective_access: Dict) -> Dict:
         """Save calculated effective access to database for caching"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Clear existing effective access for this peer
-                cursor.execute("DELETE FROM rbac_effective_access WHERE peer_name = ?", (peer_name,))
-                cursor.execute("DELETE FROM rbac_effective_rules WHERE peer_name = ?", (peer_name,))
-                
-                # Save effective access
-                for subnet in effective_access['subnets']:
-                    cursor.execute("""
-                        INSERT INTO rbac_effective_access
-                        (peer_name, group_id, organization_id, subnet_cidr, filter_action, nat_action, last_updated)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        peer_name, 
-                        subnet.get('group_id', 0),
-                        subnet.get('organization_id', 0),
-                        subnet['subnet_cidr'],
-                        'allow',  # Default filter action
-                        'none',   # Default NAT action
-                        datetime.now().isoformat()
-                    ))
-                
-                # Save effective rules
-                for rule in effective_access['filter_rules'] + effective_access['nat_rules']:
-                    cursor.execute("""
-                        INSERT INTO rbac_effective_rules
-                        (peer_name, group_id, organization_id, rule_type, rule_content, source, generated_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        peer_name,
-                        rule.get('group_id', 0),
-                        rule.get('organization_id', 0),
-                        rule['type'],
-                        json.dumps(rule),
-                        rule['source'],
-                        datetime.now().isoformat()
-                    ))
-                
+            with self.connections.connect('rbac') as conn:
+                stats = self._write_effective_access(conn.cursor(), {peer_name: effective_access})
                 conn.commit()
                 
-                return {'status': True, 'message': 'Effective access saved successfully'}
+                return {'status': True, 'message': 'Effective access saved successfully', 'data': stats}
         except Exception as e:
             return {'status': False, 'message': f'Error saving effective access: {str(e)}'}
     
@@ -681,39 +883,30 @@ class EnhancedRBACManager:
     def get_available_organizations_for_group(self, group_id: int) -> Dict:
         """Get organizations not yet attached to a group"""
         try:
-            # Get all organizations from organization.db
-            org_db_path = os.path.join(os.path.dirname(__file__), '..', 'db', 'organization.db')
-            
-            with sqlite3.connect(org_db_path) as org_conn:
-                org_conn.row_factory = sqlite3.Row
-                org_cursor = org_conn.cursor()
-                org_cursor.execute("SELECT * FROM organizations ORDER BY name")
-                all_organizations = [dict(row) for row in org_cursor.fetchall()]
-            
-            # Get attached organizations from rbac.db
-            with sqlite3.connect(self.db_path) as rbac_conn:
-                rbac_cursor = rbac_conn.cursor()
-                rbac_cursor.execute("""
-                    SELECT organization_id 
-                    FROM rbac_group_organizations 
-                    WHERE group_id = ?
+            with self.connections.connect('rbac') as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT o.*
+                    FROM organization.organizations o
+                    WHERE o.id NOT IN (
+                        SELECT organization_id 
+                        FROM rbac_group_organizations 
+                        WHERE group_id = ?
+                    )
+                    ORDER BY o.name
                 """, (group_id,))
-                attached_org_ids = [row[0] for row in rbac_cursor.fetchall()]
-            
-            # Filter out attached organizations
-            available_organizations = [
-                org for org in all_organizations 
-                if org['id'] not in attached_org_ids
-            ]
+                
+                available_organizations = [dict(row) for row in cursor.fetchall()]
             
-            return {'status': True, 'data': available_organizations, 'message': 'Available organizations retrieved successfully'}                                                                                             
+            return {'status': True, 'data': available_organizations, 'message': 'Available organizations retrieved successfully'}
         except Exception as e:
             return {'status': False, 'message': f'Error fetching available organizations: {str(e)}', 'data': None}
     
     def get_available_groups_for_organization(self, organization_id: int) -> Dict:
         """Get groups not yet attached to an organization"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 
@@ -749,8 +942,7 @@ class EnhancedRBACManager:
                 return {'status': False, 'message': 'Group VPN not enabled'}
             
             # 2. Assign user to group in users.db
-            users_db_path = os.path.join(os.path.dirname(__file__), '..', 'db', 'users.db')
-            with sqlite3.connect(users_db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 
                 # Check if user already assigned to this group
@@ -774,7 +966,7 @@ class EnhancedRBACManager:
             
             if peer_result['status']:
                 # Update user_groups with peer info
-                with sqlite3.connect(users_db_path) as conn:
+                with self.connections.connect('users') as conn:
                     cursor = conn.cursor()
                     cursor.execute("""
                         UPDATE user_groups 
@@ -799,8 +991,7 @@ class EnhancedRBACManager:
             vpn_result = self.remove_vpn_peer_for_user(user_id, group_id)
             
             # 2. Remove from user_groups table
-            users_db_path = os.path.join(os.path.dirname(__file__), '..', 'db', 'users.db')
-            with sqlite3.connect(users_db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -812,7 +1003,7 @@ class EnhancedRBACManager:
                 conn.commit()
             
             # 3. Remove from user_vpn_peers table
-            with sqlite3.connect(users_db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     DELETE FROM user_vpn_peers 
@@ -821,13 +1012,14 @@ class EnhancedRBACManager:
                 conn.commit()
             
             # 4. Remove from rbac_group_peers table
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     DELETE FROM rbac_group_peers 
                     WHERE user_id = ? AND group_id = ?
                 """, (user_id, group_id))
                 conn.commit()
+            self.refresh_effective_access(group_ids=[group_id])
             
             return {'status': True, 'message': f'User removed from group successfully. VPN peer cleanup: {vpn_result.get("message", "Unknown")}'}
             
@@ -838,8 +1030,7 @@ class EnhancedRBACManager:
         """Update existing peer's endpoint_allowed_ip to use organization subnets"""
         try:
             # Get user info
-            users_db_path = os.path.join(os.path.dirname(__file__), '..', 'db', 'users.db')
-            with sqlite3.connect(users_db_path) as conn:
+            with self.connections.connect('users') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
@@ -857,7 +1048,7 @@ class EnhancedRBACManager:
                 endpoint_allowed_ips = "0.0.0.0/0"
             
             # Get peer info
-            with sqlite3.connect(users_db_path) as conn:
+            with self.connections.connect('users') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute("""
@@ -871,9 +1062,7 @@ class EnhancedRBACManager:
             
             # Update WireGuard configuration
             try:
-                import sys
-                sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-                from dashboard import WireguardConfigurations
+                WireguardConfigurations = self._get_wireguard_configurations()
                 
                 vpn_server = peer_info['vpn_server_name']
                 if vpn_server in WireguardConfigurations:
@@ -913,7 +1102,7 @@ class EnhancedRBACManager:
     def delete_group(self, group_id: int) -> Dict:
         """Delete RBAC group and cleanup related data"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 cursor = conn.cursor()
                 
                 # Check if group exists
@@ -948,6 +1137,7 @@ class EnhancedRBACManager:
                 cursor.execute("DELETE FROM rbac_groups WHERE id = ?", (group_id,))
                 
                 conn.commit()
+                self.refresh_effective_access(group_ids=[group_id])
                 
                 return {'status': True, 'message': f'Group "{group_name}" deleted successfully'}
                 
@@ -957,7 +1147,7 @@ class EnhancedRBACManager:
     def get_default_group_for_role(self, role: str) -> Dict:
         """Get default group for user role"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 
@@ -1000,34 +1190,21 @@ class EnhancedRBACManager:
     def get_user_groups(self, user_id: int) -> Dict:
         """Get all groups user belongs to with VPN peer status"""
         try:
-            users_db_path = os.path.join(os.path.dirname(__file__), '..', 'db', 'users.db')
-            
-            # Get user groups from users.db
-            with sqlite3.connect(users_db_path) as conn:
+            # User groups from users.db with their details from the attached rbac.db
+            with self.connections.connect('users') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 
                 cursor.execute("""
-                    SELECT * FROM user_groups 
-                    WHERE user_id = ?
-                    ORDER BY assigned_at DESC
+                    SELECT ug.*, g.name as group_name, g.description, g.color, g.vpn_enabled,
+                           g.vpn_type, g.vpn_server_name
+                    FROM user_groups ug
+                    JOIN rbac.rbac_groups g ON g.id = ug.group_id
+                    WHERE ug.user_id = ?
+                    ORDER BY ug.assigned_at DESC
                 """, (user_id,))
                 
-                user_groups = [dict(row) for row in cursor.fetchall()]
-            
-            # Get group details from rbac.db
-            groups_with_details = []
-            for ug in user_groups:
-                group_result = self.get_group(ug['group_id'])
-                if group_result['status']:
-                    group_data = group_result['data']
-                    ug['group_name'] = group_data['name']
-                    ug['description'] = group_data['description']
-                    ug['color'] = group_data['color']
-                    ug['vpn_enabled'] = group_data['vpn_enabled']
-                    ug['vpn_type'] = group_data['vpn_type']
-                    ug['vpn_server_name'] = group_data['vpn_server_name']
-                    groups_with_details.append(ug)
+                groups_with_details = [dict(row) for row in cursor.fetchall()]
             
             return {'status': True, 'data': groups_with_details, 'message': f'Retrieved {len(groups_with_details)} groups for user'}
                 
@@ -1037,10 +1214,8 @@ class EnhancedRBACManager:
     def get_group_users(self, group_id: int) -> Dict:
         """Get all users in group with their VPN peer status"""
         try:
-            users_db_path = os.path.join(os.path.dirname(__file__), '..', 'db', 'users.db')
-            
             # Get user groups from users.db
-            with sqlite3.connect(users_db_path) as conn:
+            with self.connections.connect('users') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 
@@ -1065,8 +1240,7 @@ class EnhancedRBACManager:
         """Generate WireGuard peer for user"""
         try:
             # 1. Get user info
-            users_db_path = os.path.join(os.path.dirname(__file__), '..', 'db', 'users.db')
-            with sqlite3.connect(users_db_path) as conn:
+            with self.connections.connect('users') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
@@ -1111,9 +1285,7 @@ class EnhancedRBACManager:
                 peer_ip = manual_ip
             else:
                 # Auto-generate IP from WireGuard subnet pool
-                import sys
-                sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-                from dashboard import WireguardConfigurations
+                WireguardConfigurations = self._get_wireguard_configurations()
                 
                 if vpn_server in WireguardConfigurations:
                     config = WireguardConfigurations[vpn_server]
@@ -1139,7 +1311,7 @@ class EnhancedRBACManager:
                 allowed_ips = ['0.0.0.0/0']  # Default route
             
             # 6. Save to user_vpn_peers table
-            with sqlite3.connect(users_db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     INSERT INTO user_vpn_peers 
@@ -1149,7 +1321,7 @@ class EnhancedRBACManager:
                 conn.commit()
             
             # 7. Save to rbac_group_peers table
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     INSERT INTO rbac_group_peers 
@@ -1157,13 +1329,12 @@ class EnhancedRBACManager:
                     VALUES (?, ?, ?, 'user', ?)
                 """, (group_id, user['username'], peer_ip, user_id))
                 conn.commit()
+            self.refresh_effective_access(peer_names=[user['username']])
             
             # 8. Add peer to WireGuard configuration
             try:
                 # Import WireGuard configuration manager
-                import sys
-                sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-                from dashboard import WireguardConfigurations
+                WireguardConfigurations = self._get_wireguard_configurations()
                 
                 # Get WireGuard configuration
                 if vpn_server in WireguardConfigurations:
@@ -1219,12 +1390,125 @@ class EnhancedRBACManager:
         except Exception as e:
             return {'status': False, 'message': f'Error generating VPN peer: {str(e)}'}
     
+    def provision_group_peers(self, group_id: int) -> Dict:
+        """
+        Generate VPN peers for every member of a group that does not have one yet: addresses come
+        from the configuration's free pool, keys are generated in one batch, all peers are added
+        to WireGuard with one addPeers and the database rows are written with executemany
+        """
+        try:
+            group = self.get_group(group_id)
+            if not group['status']:
+                return {'status': False, 'message': 'Group not found'}
+            
+            group_data = group['data']
+            vpn_server = group_data.get('vpn_server_name')
+            if not group_data.get('vpn_enabled') or not vpn_server:
+                return {'status': False, 'message': 'Group VPN not enabled'}
+            
+            config = self._get_wireguard_configurations().get(vpn_server)
+            if config is None:
+                return {'status': False, 'message': f'WireGuard configuration {vpn_server} not found'}
+            
+            # 1. Members without a peer in this group
+            with self.connections.connect('users') as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT ug.user_id, u.username
+                    FROM user_groups ug
+                    JOIN users u ON u.id = ug.user_id
+                    WHERE ug.group_id = ? AND COALESCE(ug.vpn_peer_generated, 0) = 0
+                    AND NOT EXISTS (
+                        SELECT 1 FROM user_vpn_peers vp WHERE vp.user_id = ug.user_id AND vp.group_id = ug.group_id
+                    )
+                    ORDER BY ug.id
+                """, (group_id,))
+                members = [dict(row) for row in cursor.fetchall()]
+            
+            if not members:
+                return {'status': True, 'message': 'All group members already have a VPN peer', 'data': []}
+            
+            # 2. Addresses from the free pool and keys for all of them
+            status, available_ips = config.getAvailableIP(-1)
+            addresses = list(islice(chain.from_iterable(available_ips.values()), len(members))) if status else []
+            if len(addresses) < len(members):
+                return {'status': False, 'message': f'Only {len(addresses)} free addresses for {len(members)} members in {vpn_server}'}
+            key_pairs = GenerateWireguardKeyPairs(len(members))
+            
+            subnets = self.get_group_vpn_subnets(group_id)
+            if subnets['status'] and subnets['data']:
+                allowed_ips = [subnet['subnet_cidr'] for subnet in subnets['data']]
+            else:
+                allowed_ips = ['0.0.0.0/0']  # Default route
+            
+            peers = []
+            for member, address, (private_key, public_key) in zip(members, addresses, key_pairs):
+                member.update({
+                    'peer_ip': address.split('/')[0],
+                    'public_key': public_key,
+                    'private_key': private_key
+                })
+                peers.append({
+                    "name": member['username'],
+                    "id": public_key,
+                    "private_key": private_key,
+                    "allowed_ip": address,
+                    "endpoint_allowed_ip": ",".join(allowed_ips),
+                    "DNS": "",
+                    "mtu": "",
+                    "keepalive": "",
+                    "preshared_key": "",
+                    "advanced_security": "off"
+                })
+            
+            # 3. One apply for all peers
+            status, result = config.addPeers(peers)
+            if not status:
+                return {'status': False, 'message': f'Failed to add peers to WireGuard: {result.get("message", "Unknown error")}'}
+            
+            # 4. Bulk database writes in one commit, the peers are taken out of WireGuard again if they fail
+            try:
+                with self.connections.connect('users') as conn:
+                    conn.executemany("""
+                        INSERT INTO user_vpn_peers 
+                        (user_id, group_id, vpn_server_name, peer_ip, public_key, private_key, config_generated)
+                        VALUES (?, ?, ?, ?, ?, ?, 1)
+                    """, [(m['user_id'], group_id, vpn_server, m['peer_ip'], m['public_key'], m['private_key']) for m in members])
+                    conn.executemany("""
+                        UPDATE user_groups 
+                        SET vpn_peer_generated = 1, 
+                            peer_ip = ?, 
+                            peer_status = 'active'
+                        WHERE user_id = ? AND group_id = ?
+                    """, [(m['peer_ip'], m['user_id'], group_id) for m in members])
+                    conn.executemany("""
+                        INSERT INTO rbac.rbac_group_peers 
+                        (group_id, peer_name, peer_ip, peer_type, user_id)
+                        VALUES (?, ?, ?, 'user', ?)
+                    """, [(group_id, m['username'], m['peer_ip'], m['user_id']) for m in members])
+            except Exception as e:
+                try:
+                    config.deletePeers([m['public_key'] for m in members])
+                except Exception as cleanup_error:
+                    print(f"[EnhancedRBAC] Error removing provisioned peers from {vpn_server}: {cleanup_error}")
+                return {'status': False, 'message': f'Error saving provisioned peers, the peers were removed again: {str(e)}'}
+            self.refresh_effective_access(peer_names=[m['username'] for m in members])
+            
+            if subnets['status'] and subnets['data']:
+                self._configure_group_push_routes(config, allowed_ips, [m['peer_ip'] for m in members])
+            
+            data = [{key: m[key] for key in ('user_id', 'username', 'peer_ip', 'public_key')} for m in members]
+            return {'status': True, 'message': f'Provisioned {len(members)} VPN peers in {vpn_server}', 'data': data}
+            
+        except Exception as e:
+            return {'status': False, 'message': f'Error provisioning group peers: {str(e)}'}
+    
     def remove_vpn_peer_for_user(self, user_id: int, group_id: int) -> Dict:
         """Remove VPN peer configuration for user"""
         try:
             # Get peer info before deletion
-            users_db_path = os.path.join(os.path.dirname(__file__), '..', 'db', 'users.db')
-            with sqlite3.connect(users_db_path) as conn:
+            with self.connections.connect('users') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute("""
@@ -1241,9 +1525,7 @@ class EnhancedRBACManager:
             # Remove peer from WireGuard configuration
             try:
                 # Import WireGuard configuration manager
-                import sys
-                sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-                from dashboard import WireguardConfigurations
+                WireguardConfigurations = self._get_wireguard_configurations()
                 
                 vpn_server = peer["vpn_server_name"]
                 public_key = peer["public_key"]
@@ -1280,7 +1562,7 @@ class EnhancedRBACManager:
                 return {'status': False, 'message': f'Error removing peer from WireGuard: {str(wg_error)}'}
             
             # Clean up database records
-            with sqlite3.connect(users_db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     DELETE FROM user_vpn_peers 
@@ -1289,13 +1571,14 @@ class EnhancedRBACManager:
                 conn.commit()
             
             # Remove from rbac_group_peers
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('rbac') as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     DELETE FROM rbac_group_peers 
                     WHERE user_id = ? AND group_id = ? AND peer_type = 'user'
                 """, (user_id, group_id))
                 conn.commit()
+            self.refresh_effective_access(group_ids=[group_id])
             
             return {'status': True, 'message': f'VPN peer removed from {peer["vpn_server_name"]}'}
             
@@ -1305,75 +1588,69 @@ class EnhancedRBACManager:
     def get_user_vpn_peers(self, user_id: int) -> Dict:
         """Get all VPN peers for a user"""
         try:
-            users_db_path = os.path.join(os.path.dirname(__file__), '..', 'db', 'users.db')
-            
-            # Get VPN peers from users.db
-            with sqlite3.connect(users_db_path) as conn:
+            # VPN peers from users.db with their group from the attached rbac.db
+            with self.connections.connect('users') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 
                 cursor.execute("""
-                    SELECT * FROM user_vpn_peers 
-                    WHERE user_id = ?
-                    ORDER BY created_at DESC
+                    SELECT vp.*, g.name as group_name, g.color as group_color
+                    FROM user_vpn_peers vp
+                    JOIN rbac.rbac_groups g ON g.id = vp.group_id
+                    WHERE vp.user_id = ?
+                    ORDER BY vp.created_at DESC
                 """, (user_id,))
                 
-                peers = [dict(row) for row in cursor.fetchall()]
-            
-            # Get group details from rbac.db
-            peers_with_details = []
-            for peer in peers:
-                group_result = self.get_group(peer['group_id'])
-                if group_result['status']:
-                    group_data = group_result['data']
-                    peer['group_name'] = group_data['name']
-                    peer['group_color'] = group_data['color']
-                    peers_with_details.append(peer)
+                peers_with_details = [dict(row) for row in cursor.fetchall()]
             
             return {'status': True, 'data': peers_with_details, 'message': f'Retrieved {len(peers_with_details)} VPN peers for user'}
                 
         except Exception as e:
             return {'status': False, 'message': f'Error fetching user VPN peers: {str(e)}', 'data': []}
     
-    def get_group_peers_summary(self, group_id: int) -> Dict:
-        """Get VPN peers summary for a group"""
+    def get_groups_peers_summary(self, group_ids: List[int] = None) -> Dict:
+        """Get VPN peers summaries of all groups, or of the given ones, from one grouped count"""
         try:
-            users_db_path = os.path.join(os.path.dirname(__file__), '..', 'db', 'users.db')
-            with sqlite3.connect(users_db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Get total peers count
-                cursor.execute("""
-                    SELECT COUNT(*) as total FROM user_groups WHERE group_id = ?
-                """, (group_id,))
-                total = cursor.fetchone()[0]
-                
-                # Get active peers count
-                cursor.execute("""
-                    SELECT COUNT(*) as active FROM user_groups 
-                    WHERE group_id = ? AND vpn_peer_generated = 1
-                """, (group_id,))
-                active = cursor.fetchone()[0]
-                
-                # Get pending peers count
-                pending = total - active
-                
-                return {
-                    'status': True,
-                    'data': {
-                        'total': total,
-                        'active': active,
-                        'pending': pending
-                    },
-                    'message': f'Group has {total} total users, {active} with VPN peers'
-                }
-                
+            where, params = '', []
+            if group_ids is not None:
+                if not group_ids:
+                    return {'status': True, 'data': {}, 'message': 'Retrieved peers summary for 0 groups'}
+                where, params = f"WHERE g.id IN ({self._placeholders(group_ids)})", list(group_ids)
+            with self.connections.connect('rbac') as conn:
+                rows = conn.execute(f"""
+                    SELECT g.id, COUNT(ug.group_id), COALESCE(SUM(ug.vpn_peer_generated = 1), 0)
+                    FROM rbac_groups g
+                    LEFT JOIN users.user_groups ug ON ug.group_id = g.id
+                    {where}
+                    GROUP BY g.id
+                    ORDER BY g.id
+                """, params).fetchall()
+            summaries = {group_id: {'total': total, 'active': active, 'pending': total - active}
+                         for group_id, total, active in rows}
+            return {
+                'status': True,
+                'data': summaries,
+                'message': f'Retrieved peers summary for {len(summaries)} groups'
+            }
         except Exception as e:
-            return {'status': False, 'message': f'Error fetching group peers summary: {str(e)}', 'data': None}
+            return {'status': False, 'message': f'Error fetching groups peers summary: {str(e)}', 'data': None}
+
+    def get_group_peers_summary(self, group_id: int) -> Dict:
+        """Get VPN peers summary for a group"""
+        result = self.get_groups_peers_summary([group_id])
+        if not result['status']:
+            return {'status': False, 'message': result['message'], 'data': None}
+        summary = result['data'].get(group_id, {'total': 0, 'active': 0, 'pending': 0})
+        return {
+            'status': True,
+            'data': summary,
+            'message': f"Group has {summary['total']} total users, {summary['active']} with VPN peers"
+        }
     
     def _configure_push_routes(self, config, organization_subnets: List[str], peer_ip: str) -> bool:
         """
-        Configure push routes for organization subnets to be accessible by VPN peer
+        Route organization subnets through a VPN peer. Only this peer's routes are added,
+        the full table is applied when the interface comes up
         
         Args:
             config: WireGuard configuration object
@@ -1383,44 +1660,31 @@ class EnhancedRBACManager:
         Returns:
             bool: True if successful, False otherwise
         """
-        try:
-            # Get current PostUp configuration
-            current_postup = getattr(config, 'PostUp', '')
-            
-            # Generate push route commands
-            push_routes = []
-            for subnet in organization_subnets:
-                # Format: ip route add <subnet> via <peer_ip>
-                route_cmd = f"ip route add {subnet} via {peer_ip}"
-                push_routes.append(route_cmd)
-            
-            # Add push routes to PostUp if not already present
-            if push_routes:
-                new_postup_commands = []
-                for route in push_routes:
-                    if route not in current_postup:
-                        new_postup_commands.append(route)
-                
-                if new_postup_commands:
-                    # Append new routes to existing PostUp
-                    if current_postup:
-                        updated_postup = f"{current_postup}; {'; '.join(new_postup_commands)}"
-                    else:
-                        updated_postup = '; '.join(new_postup_commands)
-                    
-                    # Update WireGuard configuration
-                    setattr(config, 'PostUp', updated_postup)
-                    
-                    # Save configuration
-                    config.SaveConfig
-                    
-                    print(f"[EnhancedRBAC] Added push routes for peer {peer_ip}: {', '.join(new_postup_commands)}")
-            
-            return True
+        result = self.push_routes.add_routes(config.Name, organization_subnets, peer_ip)
+        if result['status']:
+            print(f"[EnhancedRBAC] Added push routes for peer {peer_ip}: {', '.join(organization_subnets)}")
+        else:
+            print(f"[EnhancedRBAC] Error configuring push routes: {result['message']}")
+        return result['status']
+    
+    def _configure_group_push_routes(self, config, organization_subnets: List[str], peer_ips: List[str]) -> bool:
+        """
+        Route organization subnets through several VPN peers with one route apply
+        
+        Args:
+            config: WireGuard configuration object
+            organization_subnets: List of subnet strings (e.g., ['10.0.0.0/24', '192.168.1.0/24'])
+            peer_ips: IP addresses of the VPN peers
             
-        except Exception as e:
-            print(f"[EnhancedRBAC] Error configuring push routes: {str(e)}")
-            return False
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        result = self.push_routes.add_hop_routes(config.Name, {peer_ip: organization_subnets for peer_ip in peer_ips})
+        if result['status']:
+            print(f"[EnhancedRBAC] Added push routes for {len(peer_ips)} peers: {', '.join(organization_subnets)}")
+        else:
+            print(f"[EnhancedRBAC] Error configuring push routes: {result['message']}")
+        return result['status']
     
     def _remove_push_routes(self, config, organization_subnets: List[str], peer_ip: str) -> bool:
         """
@@ -1434,47 +1698,11 @@ class EnhancedRBACManager:
         Returns:
             bool: True if successful, False otherwise
         """
-        try:
-            # Get current PostUp configuration
-            current_postup = getattr(config, 'PostUp', '')
-            
-            # Generate route removal commands
-            routes_to_remove = []
-            for subnet in organization_subnets:
-                # Format: ip route add <subnet> via <peer_ip>
-                route_cmd = f"ip route add {subnet} via {peer_ip}"
-                routes_to_remove.append(route_cmd)
-            
-            # Remove routes from PostUp
-            if routes_to_remove and current_postup:
-                # Split existing commands
-                existing_commands = [cmd.strip() for cmd in current_postup.split(';')]
-                
-                # Filter out routes for this peer
-                filtered_commands = []
-                for cmd in existing_commands:
-                    should_remove = False
-                    for route in routes_to_remove:
-                        if route in cmd:
-                            should_remove = True
-                            break
-                    
-                    if not should_remove:
-                        filtered_commands.append(cmd)
-                
-                # Update PostUp configuration
-                updated_postup = '; '.join(filtered_commands)
-                setattr(config, 'PostUp', updated_postup)
-                
-                # Save configuration
-                config.SaveConfig
-                
-                print(f"[EnhancedRBAC] Removed push routes for peer {peer_ip}: {', '.join(routes_to_remove)}")
-            
-            return True
-            
-        except Exception as e:
-            print(f"[EnhancedRBAC] Error removing push routes: {str(e)}")
-            return False
+        result = self.push_routes.remove_routes(config.Name, peer_ip, organization_subnets)
+        if result['status']:
+            print(f"[EnhancedRBAC] Removed push routes for peer {peer_ip}: {', '.join(organization_subnets)}")
+        else:
+            print(f"[EnhancedRBAC] Error removing push routes: {result['message']}")
+        return result['status']
 
 # Export the class for import
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+FakeNft - Stand-in for the nft binary, for exercising NftablesBackend without touching the kernel
+Usage: python3 FakeNft.py [--state <file>] [-j] (list ruleset | list table <family> <name> | -f <file|->)
+"""
+
+import copy
+import json
+import os
+import sys
+from typing import List, Dict, Any, Tuple
+
+
+class FakeNftError(Exception):
+    pass
+
+
+class FakeNft:
+    """
+    Keeps a ruleset in a JSON state file and understands the JSON commands NftablesBackend sends
+    (add / insert / replace / delete / flush of tables, chains, rules, sets and elements).
+    A transaction is applied to a copy and only written back when every command succeeded,
+    like `nft -f` does. Use `NftablesBackend(command=FakeNft(path).command())`.
+    """
+    def __init__(self, state_path: str = None):
+        self.state_path = state_path or os.environ.get('FAKE_NFT_STATE', '/tmp/fake-nft.json')
+
+    def command(self) -> List[str]:
+        return [sys.executable, os.path.abspath(__file__), '--state', self.state_path]
+
+    def load(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'handle': 0, 'tables': {}}
+
+    def save(self, state: Dict[str, Any]):
+        with open(f'{self.state_path}.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(f'{self.state_path}.tmp', self.state_path)
+
+    # ===== STATE =====
+
+    @staticmethod
+    def _table(state, value, create: bool = False) -> Dict[str, Any]:
+        key = f"{value['family']} {value.get('table', value.get('name'))}"
+        if key not in state['tables']:
+            if not create:
+                raise FakeNftError(f'No such file or directory: table {key}')
+            state['handle'] += 1
+            state['tables'][key] = {'handle': state['handle'], 'chains': {}, 'sets': {}}
+        return state['tables'][key]
+
+    def _chain(self, state, value) -> Dict[str, Any]:
+        chains = self._table(state, value)['chains']
+        name = value.get('chain', value.get('name'))
+        if name not in chains:
+            raise FakeNftError(f'No such file or directory: chain {name}')
+        return chains[name]
+
+    def _set(self, state, value) -> Dict[str, Any]:
+        sets = self._table(state, value)['sets']
+        if value['name'] not in sets:
+            raise FakeNftError(f"No such file or directory: set {value['name']}")
+        return sets[value['name']]
+
+    @staticmethod
+    def _references(table: Dict[str, Any]) -> str:
+        return json.dumps([rule['expr'] for chain in table['chains'].values() for rule in chain['rules']])
+
+    @staticmethod
+    def _position(rules: List[Dict[str, Any]], value: Dict[str, Any]) -> int:
+        for i, rule in enumerate(rules):
+            if rule['handle'] == value['handle']:
+                return i
+        raise FakeNftError(f"No such file or directory: rule handle {value['handle']}")
+
+    def _add(self, state, kind: str, value: Dict[str, Any], insert: bool = False):
+        if kind == 'table':
+            self._table(state, value, create=True)
+        elif kind == 'chain':
+            chains = self._table(state, value)['chains']
+            if value['name'] not in chains:
+                state['handle'] += 1
+                chains[value['name']] = {
+                    'spec': {k: v for k, v in value.items() if k in ('type', 'hook', 'prio', 'policy')},
+                    'handle': state['handle'],
+                    'rules': []
+                }
+        elif kind == 'rule':
+            chain = self._chain(state, value)
+            for expr in value['expr']:
+                if 'jump' in expr or 'goto' in expr:
+                    target = next(iter(expr.values()))['target']
+                    if target not in self._table(state, value)['chains']:
+                        raise FakeNftError(f'No such file or directory: chain {target}')
+            state['handle'] += 1
+            rule = {'handle': state['handle'], 'expr': copy.deepcopy(value['expr'])}
+            if value.get('comment'):
+                rule['comment'] = value['comment']
+            if 'handle' in value:
+                position = self._position(chain['rules'], value) + (0 if insert else 1)
+            elif 'index' in value:
+                position = value['index'] + (0 if insert else 1)
+            else:
+                position = 0 if insert else len(chain['rules'])
+            chain['rules'].insert(position, rule)
+        elif kind == 'set':
+            sets = self._table(state, value)['sets']
+            if value['name'] not in sets:
+                state['handle'] += 1
+                sets[value['name']] = {'type': value['type'], 'flags': value.get('flags', []),
+                                       'handle': state['handle'], 'elem': []}
+        elif kind == 'element':
+            elements = self._set(state, value)['elem']
+            for element in value['elem']:
+                if element not in elements:
+                    elements.append(element)
+        else:
+            raise FakeNftError(f'Unsupported object: {kind}')
+
+    def _delete(self, state, kind: str, value: Dict[str, Any]):
+        if kind == 'table':
+            del state['tables'][f"{value['family']} {value['name']}"]
+        elif kind == 'chain':
+            table = self._table(state, value)
+            chain = self._chain(state, value)
+            if chain['rules']:
+                raise FakeNftError(f"Device or resource busy: chain {value['name']} is not empty")
+            if f'"target": "{value["name"]}"' in self._references(table):
+                raise FakeNftError(f"Device or resource busy: chain {value['name']} is referenced")
+            del table['chains'][value['name']]
+        elif kind == 'rule':
+            chain = self._chain(state, value)
+            del chain['rules'][self._position(chain['rules'], value)]
+        elif kind == 'set':
+            table = self._table(state, value)
+            self._set(state, value)
+            if f'"@{value["name"]}"' in self._references(table):
+                raise FakeNftError(f"Device or resource busy: set {value['name']} is referenced")
+            del table['sets'][value['name']]
+        elif kind == 'element':
+            elements = self._set(state, value)['elem']
+            for element in value['elem']:
+                if element not in elements:
+                    raise FakeNftError(f'No such file or directory: element {json.dumps(element)}')
+                elements.remove(element)
+        else:
+            raise FakeNftError(f'Unsupported object: {kind}')
+
+    def _flush(self, state, kind: str, value: Dict[str, Any]):
+        if kind == 'ruleset':
+            state['tables'] = {}
+        elif kind == 'table':
+            for chain in self._table(state, value)['chains'].values():
+                chain['rules'] = []
+        elif kind == 'chain':
+            self._chain(state, value)['rules'] = []
+        elif kind == 'set':
+            self._set(state, value)['elem'] = []
+        else:
+            raise FakeNftError(f'Unsupported object: {kind}')
+
+    def apply(self, commands: List[Dict[str, Any]]):
+        """Run one transaction, nothing changes when a command fails"""
+        state = self.load()
+        for command in commands:
+            verb, body = next(iter(command.items()))
+            kind, value = next(iter(body.items()))
+            if verb in ('add', 'create'):
+                self._add(state, kind, value)
+            elif verb == 'insert':
+                self._add(state, kind, value, insert=True)
+            elif verb == 'replace':
+                chain = self._chain(state, value)
+                chain['rules'][self._position(chain['rules'], value)]['expr'] = copy.deepcopy(value['expr'])
+            elif verb in ('delete', 'destroy'):
+                self._delete(state, kind, value)
+            elif verb == 'flush':
+                self._flush(state, kind, value)
+            else:
+                raise FakeNftError(f'Unsupported command: {verb}')
+        self.save(state)
+
+    def list(self, only: str = None) -> Dict[str, Any]:
+        state = self.load()
+        objects = [{'metainfo': {'version': 'fake', 'json_schema_version': 1}}]
+        for key, table in state['tables'].items():
+            if only is not None and key != only:
+                continue
+            family, name = key.split(' ', 1)
+            objects.append({'table': {'family': family, 'name': name, 'handle': table['handle']}})
+            for chain_name, chain in table['chains'].items():
+                objects.append({'chain': dict({'family': family, 'table': name, 'name': chain_name,
+                                               'handle': chain['handle']}, **chain['spec'])})
+            for set_name, nft_set in table['sets'].items():
+                entry = {'family': family, 'table': name, 'name': set_name, 'handle': nft_set['handle'],
+                         'type': nft_set['type'], 'flags': nft_set['flags']}
+                if nft_set['elem']:
+                    entry['elem'] = nft_set['elem']
+                objects.append({'set': entry})
+            for chain_name, chain in table['chains'].items():
+                for rule in chain['rules']:
+                    objects.append({'rule': dict({'family': family, 'table': name, 'chain': chain_name}, **rule)})
+        if only is not None and len(objects) == 1:
+            raise FakeNftError(f'No such file or directory: table {only}')
+        return {'nftables': objects}
+
+    def run(self, args: List[str], stdin: str = '') -> Tuple[int, str, str]:
+        """Handle one nft command line, returns (exit code, stdout, stderr)"""
+        args = [arg for arg in args if arg not in ('-a', '-s')]
+        as_json = '-j' in args
+        args = [arg for arg in args if arg != '-j']
+        try:
+            if not as_json:
+                raise FakeNftError('fake nft only speaks JSON, use -j')
+            if args[:1] == ['-f']:
+                if args[1] == '-':
+                    payload = stdin
+                else:
+                    with open(args[1], 'r') as f:
+                        payload = f.read()
+                self.apply(json.loads(payload).get('nftables', []))
+                return 0, '', ''
+            if args[:2] == ['list', 'ruleset']:
+                return 0, json.dumps(self.list()), ''
+            if args[:2] == ['list', 'table'] and len(args) == 4:
+                return 0, json.dumps(self.list(f'{args[2]} {args[3]}')), ''
+            raise FakeNftError(f"Unsupported command: {' '.join(args)}")
+        except (FakeNftError, KeyError, ValueError, IndexError) as e:
+            return 1, '', f'Error: {e}\n'
+
+
+def main():
+    args = sys.argv[1:]
+    state_path = None
+    if args[:1] == ['--state']:
+        state_path, args = args[1], args[2:]
+    code, stdout, stderr = FakeNft(state_path).run(args, sys.stdin.read() if '-' in args else '')
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    sys.exit(code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+Firewall Accounting
+"""
+import os, re, threading, time
+from datetime import datetime
+from .DashboardDatabase import DashboardDatabase
+from .FirewallBackend import FirewallBackend
+from .FirewallReconciler import RBAC_CHAIN
+
+
+class FirewallAccounting:
+    """
+    Per-rule packet / byte counters of the dashboard's chains as a time series.
+    Every interval the ruleset is listed once (one `iptables-save -c` or one `nft -j list ruleset`), the deltas
+    since the previous sample are added to one bucket per resolution, and buckets older than their
+    resolution's retention are pruned. RBAC policy rules are tracked by their `RBAC-<group>-<policy>` comment,
+    so their series survive reorders and regenerations; every other rule by its chain and rule text
+    """
+    ManagedChains = {'filter': FirewallBackend.FILTER_CHAINS, 'nat': FirewallBackend.NAT_CHAINS}
+    MinimumInterval = 10
+    MaximumPoints = 1000
+    # Resolution (seconds) -> retention (seconds), the finest resolution is the sampling interval
+    Rollups = {3600: 30 * 86400, 86400: 400 * 86400}
+    RawRetention = 86400
+
+    def __init__(self, database: DashboardDatabase, firewallManager, interval: int = 60):
+        self.database = database
+        self.firewallManager = firewallManager
+        self.interval = max(self.MinimumInterval, int(interval))
+        self.resolutions = {self.interval: self.RawRetention, **self.Rollups}
+        self.lastSample = None
+        self.lastDuration = None
+        self.lastRules = 0
+        self.lastError = None
+        self.__previous = {}
+        self.__seriesIds = {}
+        self.__lastPrune = 0.0
+        self.__lock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__thread: threading.Thread | None = None
+        self.__pid = None
+        self.__createTable()
+
+    def __createTable(self):
+        with self.database.transaction():
+            self.database.update("""
+                CREATE TABLE IF NOT EXISTS FirewallCounterSeries (
+                    id INTEGER PRIMARY KEY, table_name VARCHAR NOT NULL, chain VARCHAR NOT NULL, rule VARCHAR NOT NULL,
+                    group_id INTEGER, policy_id INTEGER, UNIQUE (table_name, chain, rule)
+                )
+            """)
+            self.database.update("""
+                CREATE TABLE IF NOT EXISTS FirewallCounterSamples (
+                    series_id INTEGER NOT NULL, resolution INTEGER NOT NULL, bucket INTEGER NOT NULL,
+                    packets INTEGER NOT NULL, bytes INTEGER NOT NULL, PRIMARY KEY (series_id, resolution, bucket)
+                ) WITHOUT ROWID
+            """)
+            self.database.update(
+                "CREATE INDEX IF NOT EXISTS FirewallCounterSamplesBucket ON FirewallCounterSamples (resolution, bucket)")
+            self.database.update(
+                "CREATE INDEX IF NOT EXISTS FirewallCounterSeriesGroup ON FirewallCounterSeries (group_id)")
+
+    @staticmethod
+    def __ruleIdentity(rule: dict) -> tuple[str, int | None, int | None]:
+        comment = rule.get('comment')
+        if comment is None:
+            match = re.search(r'--comment "?(RBAC-\d+-\d+)"?', rule['raw'])
+            comment = match.group(1) if match else None
+        match = re.match(r'^RBAC-(\d+)-(\d+)$', comment or '')
+        if match:
+            return comment, int(match.group(1)), int(match.group(2))
+        return rule['raw'], None, None
+
+    def __managed(self, table: str, chain: str) -> bool:
+        return chain in self.ManagedChains.get(table, ()) or RBAC_CHAIN.match(chain) is not None
+
+    def __seriesId(self, key: tuple, groupId: int | None, policyId: int | None) -> int:
+        seriesId = self.__seriesIds.get(key)
+        if seriesId is None:
+            self.database.update("""
+                INSERT OR IGNORE INTO FirewallCounterSeries (table_name, chain, rule, group_id, policy_id)
+                VALUES (?, ?, ?, ?, ?)
+            """, (*key, groupId, policyId))
+            seriesId = self.database.select(
+                "SELECT id FROM FirewallCounterSeries WHERE table_name = ? AND chain = ? AND rule = ?", key).fetchone()['id']
+            self.__seriesIds[key] = seriesId
+        return seriesId
+
+    def sample(self) -> dict:
+        """
+        List the ruleset once and store the counter deltas since the previous sample
+        """
+        start = time.perf_counter()
+        tables = self.firewallManager.get_ruleset(force=True)['tables']
+        now = int(time.time())
+        counters, deltas = {}, []
+        for table in self.ManagedChains:
+            occurrences = {}
+            for rule in tables.get(table, {'rules': []})['rules']:
+                if not self.__managed(table, rule['chain']):
+                    continue
+                identity, groupId, policyId = self.__ruleIdentity(rule)
+                # Identical rules in one chain get their own series
+                occurrence = occurrences.get((rule['chain'], identity), 0)
+                occurrences[(rule['chain'], identity)] = occurrence + 1
+                key = (table, rule['chain'], identity if occurrence == 0 else f'{identity} #{occurrence + 1}')
+                counters[key] = (rule['packets'], rule['bytes'])
+                previous = self.__previous.get(key)
+                if previous is None:
+                    continue
+                if rule['packets'] >= previous[0] and rule['bytes'] >= previous[1]:
+                    packets, byteCount = rule['packets'] - previous[0], rule['bytes'] - previous[1]
+                else:
+                    # Counters were reset (rule re-added, ruleset reloaded), everything counted is new
+                    packets, byteCount = rule['packets'], rule['bytes']
+                if packets or byteCount:
+                    deltas.append((key, groupId, policyId, packets, byteCount))
+        with self.database.transaction():
+            rows = []
+            for key, groupId, policyId, packets, byteCount in deltas:
+                seriesId = self.__seriesId(key, groupId, policyId)
+                rows.extend((seriesId, resolution, now - now % resolution, packets, byteCount)
+                            for resolution in self.resolutions)
+            if rows:
+                self.database.updateMany("""
+                    INSERT INTO FirewallCounterSamples (series_id, resolution, bucket, packets, bytes)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (series_id, resolution, bucket) DO UPDATE SET
+                    packets = packets + excluded.packets, bytes = bytes + excluded.bytes
+                """, rows)
+            if now - self.__lastPrune >= 3600:
+                for resolution, retention in self.resolutions.items():
+                    self.database.update("DELETE FROM FirewallCounterSamples WHERE resolution = ? AND bucket < ?",
+                                         (resolution, now - retention))
+                self.__lastPrune = now
+        self.__previous = counters
+        self.lastSample = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+        self.lastDuration = round(time.perf_counter() - start, 3)
+        self.lastRules = len(counters)
+        return {"Rules": len(counters), "Changed": len(deltas), "Duration": self.lastDuration}
+
+    def __window(self, resolution: int | None, hours: float | None) -> tuple[int, int, int]:
+        """
+        Resolution and first / last bucket of a query; picks the finest resolution that still holds the window
+        """
+        now = int(time.time())
+        seconds = int((hours or 1) * 3600)
+        if resolution is None:
+            resolution = next((r for r in sorted(self.resolutions)
+                               if self.resolutions[r] >= seconds and seconds <= r * self.MaximumPoints),
+                              max(self.resolutions))
+        if resolution not in self.resolutions:
+            raise ValueError(f"Resolution must be one of {', '.join(map(str, sorted(self.resolutions)))}")
+        seconds = min(seconds, self.resolutions[resolution], resolution * self.MaximumPoints)
+        last = now - now % resolution
+        return resolution, last - seconds + resolution, last
+
+    @staticmethod
+    def __points(rows, resolution: int, first: int, last: int) -> list[dict]:
+        buckets = {r['bucket']: (r['packets'], r['bytes']) for r in rows}
+        points = []
+        for bucket in range(first, last + 1, resolution):
+            packets, byteCount = buckets.get(bucket, (0, 0))
+            points.append({
+                "Time": datetime.fromtimestamp(bucket).strftime("%Y-%m-%d %H:%M:%S"),
+                "Packets": packets,
+                "Bytes": byteCount,
+                "PacketRate": round(packets / resolution, 3),
+                "ByteRate": round(byteCount / resolution, 3)
+            })
+        return points
+
+    @staticmethod
+    def __seriesToJson(row) -> dict:
+        return {
+            "ID": row['id'],
+            "Table": row['table_name'],
+            "Chain": row['chain'],
+            "Rule": row['rule'],
+            "GroupID": row['group_id'],
+            "PolicyID": row['policy_id'],
+            "Packets": row['packets'] or 0,
+            "Bytes": row['bytes'] or 0
+        }
+
+    def getSeries(self, hours: float = 1) -> list[dict]:
+        """
+        Every tracked rule with its traffic over the last hours, busiest first
+        """
+        resolution, first, last = self.__window(None, hours)
+        return [self.__seriesToJson(r) for r in self.database.select("""
+            SELECT s.*, SUM(c.packets) AS packets, SUM(c.bytes) AS bytes FROM FirewallCounterSeries s
+            LEFT JOIN FirewallCounterSamples c ON c.series_id = s.id AND c.resolution = ? AND c.bucket BETWEEN ? AND ?
+            GROUP BY s.id ORDER BY bytes DESC, s.table_name, s.chain, s.id
+        """, (resolution, first, last)).fetchall()]
+
+    def getRuleRates(self, seriesId: int, resolution: int = None, hours: float = 1) -> dict | None:
+        series = self.database.select("SELECT *, NULL AS packets, NULL AS bytes FROM FirewallCounterSeries WHERE id = ?",
+                                      (seriesId, )).fetchone()
+        if series is None:
+            return None
+        resolution, first, last = self.__window(resolution, hours)
+        rows = self.database.select("""
+            SELECT bucket, packets, bytes FROM FirewallCounterSamples
+            WHERE series_id = ? AND resolution = ? AND bucket BETWEEN ? AND ?
+        """, (seriesId, resolution, first, last)).fetchall()
+        points = self.__points(rows, resolution, first, last)
+        result = self.__seriesToJson(series)
+        result.update(Packets=sum(p['Packets'] for p in points), Bytes=sum(p['Bytes'] for p in points),
+                      Resolution=resolution, Points=points)
+        return result
+
+    def getGroupRates(self, groupId: int, resolution: int = None, hours: float = 1) -> dict:
+        """
+        Traffic of every policy rule of an RBAC group summed per bucket, with the per-policy totals
+        """
+        resolution, first, last = self.__window(resolution, hours)
+        rows = self.database.select("""
+            SELECT c.bucket, SUM(c.packets) AS packets, SUM(c.bytes) AS bytes FROM FirewallCounterSeries s
+            JOIN FirewallCounterSamples c ON c.series_id = s.id
+            WHERE s.group_id = ? AND c.resolution = ? AND c.bucket BETWEEN ? AND ?
+            GROUP BY c.bucket
+        """, (groupId, resolution, first, last)).fetchall()
+        policies = self.database.select("""
+            SELECT s.table_name, s.policy_id, SUM(c.packets) AS packets, SUM(c.bytes) AS bytes FROM FirewallCounterSeries s
+            LEFT JOIN FirewallCounterSamples c ON c.series_id = s.id AND c.resolution = ? AND c.bucket BETWEEN ? AND ?
+            WHERE s.group_id = ? GROUP BY s.table_name, s.policy_id ORDER BY s.table_name, s.policy_id
+        """, (resolution, first, last, groupId)).fetchall()
+        points = self.__points(rows, resolution, first, last)
+        return {
+            "GroupID": groupId,
+            "Resolution": resolution,
+            "Packets": sum(p['Packets'] for p in points),
+            "Bytes": sum(p['Bytes'] for p in points),
+            "Policies": [{"Table": p['table_name'], "PolicyID": p['policy_id'],
+                          "Packets": p['packets'] or 0, "Bytes": p['bytes'] or 0} for p in policies],
+            "Points": points
+        }
+
+    def __run(self):
+        print(f"[WGDashboard] Firewall Accounting Started", flush=True)
+        while True:
+            start = time.monotonic()
+            try:
+                self.sample()
+                self.lastError = None
+            except Exception as e:
+                self.lastError = str(e)
+                print(f"[WGDashboard] Firewall Accounting Error: {str(e)}", flush=True)
+            self.__wake.wait(max(1.0, self.interval - (time.monotonic() - start)))
+            self.__wake.clear()
+
+    def start(self):
+        with self.__lock:
+            if self.__thread is None or not self.__thread.is_alive() or self.__pid != os.getpid():
+                self.__pid = os.getpid()
+                self.__thread = threading.Thread(target=self.__run, name="FirewallAccounting", daemon=True)
+                self.__thread.start()
+
+    def toJson(self):
+        counts = self.database.select("""
+            SELECT (SELECT COUNT(*) FROM FirewallCounterSeries) AS series,
+            (SELECT COUNT(*) FROM FirewallCounterSamples) AS samples
+        """).fetchone()
+        return {
+            "Running": self.__thread is not None and self.__thread.is_alive() and self.__pid == os.getpid(),
+            "Interval": self.interval,
+            "Resolutions": {str(r): retention for r, retention in sorted(self.resolutions.items())},
+            "LastSample": self.lastSample,
+            "LastDuration": self.lastDuration,
+            "LastRules": self.lastRules,
+            "LastError": self.lastError,
+            "Series": counts['series'],
+            "Samples": counts['samples']
+        }
@@ -0,0 +1,826 @@
+#!/usr/bin/env python3
+"""
+FirewallBackend - iptables and nftables implementations of the firewall operations
+used by FirewallManager and RBACManager
+"""
+
+import subprocess
+import ipaddress
+import json
+import os
+import re
+import shlex
+import shutil
+import time
+from typing import List, Dict, Any, Optional
+
+
+class FirewallBackendError(Exception):
+    pass
+
+
+class FirewallBackend:
+    """
+    Operations both backends provide. Tables are 'filter' and 'nat' and chains keep the iptables
+    names (INPUT, FORWARD, POSTROUTING, ...), so callers never see which backend is in use.
+    Rules are returned as dicts with chain, raw, packets, bytes, source, destination, protocol, port
+    and target; backends add whatever they need to address a rule again (e.g. its nftables handle).
+    """
+    name = ''
+    FILTER_CHAINS = ['INPUT', 'OUTPUT', 'FORWARD']
+    NAT_CHAINS = ['PREROUTING', 'POSTROUTING', 'OUTPUT']
+
+    def list_ruleset(self) -> Dict[str, Dict[str, Any]]:
+        raise NotImplementedError
+
+    def add_rule(self, table: str, rule_data: Dict[str, Any]) -> str:
+        raise NotImplementedError
+
+    def delete_rule(self, table: str, rule: Dict[str, Any]) -> str:
+        raise NotImplementedError
+
+    def save_rules(self) -> str:
+        raise NotImplementedError
+
+    def saved_ruleset(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """The saved rules file parsed like list_ruleset, None when nothing was saved yet"""
+        raise NotImplementedError
+
+    def rule_key(self, rule: Dict[str, Any]) -> Any:
+        """What makes two rules the same rule, however the backend happens to print them"""
+        raise NotImplementedError
+
+    def apply_plan(self, plan: Dict[str, Any]):
+        """Apply a FirewallReconciler plan in one transaction"""
+        raise NotImplementedError
+
+    def rbac_entries(self, groups: List[Dict[str, Any]]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+        """Rules of the groups' chains per table, as list_ruleset would return them"""
+        raise NotImplementedError
+
+    def jump_entry(self, table: str, parent: str, chain: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def list_rbac_sets(self) -> Dict[str, List[str]]:
+        """Members of every RBAC set currently in place"""
+        raise NotImplementedError
+
+    def apply_rbac(self, groups: List[Dict[str, Any]], remove_ids: List[int], prune: bool = False) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def update_rbac_set(self, group_id: int, networks: List[str], add: bool = True):
+        raise NotImplementedError
+
+    def rbac_filter_chain(self, group_id: int) -> str:
+        return f'RBAC-FWD-{group_id}'
+
+    def rbac_nat_chain(self, group_id: int) -> str:
+        return f'RBAC-NAT-{group_id}'
+
+    def _run(self, cmd: List[str], payload: str = None) -> str:
+        try:
+            result = subprocess.run(cmd, input=payload, capture_output=True, text=True)
+        except OSError as e:
+            raise FirewallBackendError(f'Cannot run {cmd[0]}: {e}')
+        if result.returncode != 0:
+            raise FirewallBackendError(result.stderr.strip() or f'{cmd[0]} exited with {result.returncode}')
+        return result.stdout
+
+
+class IptablesBackend(FirewallBackend):
+    """iptables-save / iptables-restore with one ipset per RBAC group"""
+    name = 'iptables'
+
+    def __init__(self, rules_file: str = None):
+        if rules_file is None:
+            rules_file = "/etc/iptables/rules.v4" if os.path.exists('/etc/debian_version') else "/etc/sysconfig/iptables"
+        self.rules_file = rules_file
+
+    def rbac_set(self, group_id: int) -> str:
+        return f'rbac-{group_id}'
+
+    # ===== RULES =====
+
+    def list_ruleset(self) -> Dict[str, Dict[str, Any]]:
+        return self.parse(self._run(['iptables-save', '-c']))
+
+    def parse(self, output: str) -> Dict[str, Dict[str, Any]]:
+        """Split iptables-save (-c) output into tables; counters are taken off the rule lines and kept per rule"""
+        tables = {}
+        current = None
+        for line in output.split('\n'):
+            if line.startswith('*'):
+                current = line[1:]
+                tables[current] = {'lines': [line], 'rules': [], 'chains': set()}
+                continue
+            if current is None or len(line) == 0 or line.startswith('#'):
+                continue
+            packets = byte_count = 0
+            match = re.match(r'^\[(\d+):(\d+)\] (.*)$', line)
+            if match:
+                packets, byte_count, line = int(match.group(1)), int(match.group(2)), match.group(3)
+            tables[current]['lines'].append(line)
+            if line.startswith(':'):
+                tables[current]['chains'].add(line[1:].split()[0])
+            elif line.startswith('-A'):
+                rule = self.describe(line)
+                rule.update({'packets': packets, 'bytes': byte_count})
+                tables[current]['rules'].append(rule)
+        return tables
+
+    def describe(self, line: str) -> Dict[str, Any]:
+        """Display fields of one iptables-save rule line"""
+        parts = line.split()
+        rule = {
+            'chain': parts[1] if len(parts) > 1 else '',
+            'raw': line,
+            'source': 'Any',
+            'destination': 'Any',
+            'protocol': 'Any',
+            'port': 'Any',
+            'target': 'ACCEPT'
+        }
+        for i, part in enumerate(parts[2:], 2):
+            if part == '-s' and i + 1 < len(parts):
+                rule['source'] = parts[i + 1]
+            elif part == '-d' and i + 1 < len(parts):
+                rule['destination'] = parts[i + 1]
+            elif part == '-p' and i + 1 < len(parts):
+                rule['protocol'] = parts[i + 1]
+            elif part == '--dport' and i + 1 < len(parts):
+                rule['port'] = parts[i + 1]
+            elif part == '--sport' and i + 1 < len(parts):
+                rule['port'] = parts[i + 1]
+            elif part == '-j' and i + 1 < len(parts):
+                rule['target'] = parts[i + 1]
+        return rule
+
+    def add_rule(self, table: str, rule_data: Dict[str, Any]) -> str:
+        if table == 'filter':
+            cmd = ['iptables', '-A', rule_data['chain']]
+            if rule_data.get('source'):
+                cmd.extend(['-s', rule_data['source']])
+            if rule_data.get('destination'):
+                cmd.extend(['-d', rule_data['destination']])
+            if rule_data.get('protocol'):
+                cmd.extend(['-p', rule_data['protocol']])
+            if rule_data.get('port'):
+                cmd.extend(['--dport', rule_data['port']])
+            if rule_data.get('target'):
+                cmd.extend(['-j', rule_data['target']])
+        else:
+            cmd = ['iptables', '-t', 'nat', '-A', rule_data['chain']]
+            if rule_data.get('source'):
+                cmd.extend(['-s', rule_data['source']])
+            if rule_data.get('destination'):
+                cmd.extend(['-d', rule_data['destination']])
+            if rule_data.get('protocol') and rule_data['protocol'] != 'any':
+                cmd.extend(['-p', rule_data['protocol']])
+            if rule_data.get('port'):
+                cmd.extend(['--dport', rule_data['port']])
+            cmd.extend(['-j', rule_data['target']])
+            if rule_data['target'] == 'SNAT' and rule_data.get('toSource'):
+                cmd.extend(['--to-source', rule_data['toSource']])
+            elif rule_data['target'] == 'DNAT' and rule_data.get('toDestination'):
+                cmd.extend(['--to-destination', rule_data['toDestination']])
+        self._run(cmd)
+        return ' '.join(cmd)
+
+    def delete_rule(self, table: str, rule: Dict[str, Any]) -> str:
+        # Delete by rule specification (replace -A with -D), a stale cached entry can only fail, never hit another rule
+        cmd = ['iptables', '-t', table, '-D'] + shlex.split(rule['raw'])[1:]
+        self._run(cmd)
+        return ' '.join(cmd)
+
+    def save_rules(self) -> str:
+        os.makedirs(os.path.dirname(self.rules_file), exist_ok=True)
+        output = self._run(['iptables-save'])
+        with open(self.rules_file, 'w') as f:
+            f.write(output)
+        return self.rules_file
+
+    def saved_ruleset(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        if not os.path.exists(self.rules_file):
+            return None
+        with open(self.rules_file, 'r') as f:
+            return self.parse(f.read())
+
+    def rule_key(self, rule: Dict[str, Any]) -> Any:
+        """Options of the rule without match module names, in a fixed order and with host addresses as /32"""
+        groups = []
+        negate = False
+        for token in shlex.split(rule['raw'])[2:]:
+            if token == '!':
+                negate = True
+            elif token.startswith('-') and not re.match(r'^-\d', token):
+                groups.append([('!' if negate else '') + token])
+                negate = False
+            elif groups:
+                groups[-1].append(token)
+        options = {'--source': '-s', '--destination': '-d', '--protocol': '-p', '--jump': '-j'}
+        key = []
+        for group in groups:
+            option, values = options.get(group[0], group[0]), group[1:]
+            if option in ('-m', '--match'):
+                continue
+            if option.lstrip('!') in ('-s', '-d'):
+                values = [value if '/' in value else f'{value}/32' for value in values]
+            elif option == '-p':
+                values = [value.lower() for value in values]
+            key.append((option, tuple(values)))
+        return tuple(sorted(key))
+
+    def apply_plan(self, plan: Dict[str, Any]):
+        """ipset changes, then one iptables-restore --noflush of every chain change, then set removals"""
+        sets = plan['sets']
+        payload = [f'create {name} hash:net family inet -exist' for name in sets['create']]
+        for name, networks in sets['add'].items():
+            payload.extend(f'add {name} {network} -exist' for network in networks)
+        for name, networks in sets['delete'].items():
+            payload.extend(f'del {name} {network} -exist' for network in networks)
+        if payload:
+            self._run(['ipset', 'restore'], '\n'.join(payload) + '\n')
+        restore = []
+        for table, changes in plan['tables'].items():
+            if not (changes['create'] or changes['remove'] or changes['chains']):
+                continue
+            restore.append(f'*{table}')
+            restore.extend(f':{chain} - [0:0]' for chain in changes['create'])
+            for chain, diff in changes['chains'].items():
+                restore.extend(f'-D {chain} {delete["position"]}' for delete in diff['delete'])
+                for insert in diff['insert']:
+                    spec = insert['rule']['raw'].split(' ', 2)[2:]
+                    restore.append(' '.join([f'-I {chain} {insert["position"]}'] + spec))
+            for chain in changes['remove']:
+                restore.extend([f'-F {chain}', f'-X {chain}'])
+            restore.append('COMMIT')
+        if restore:
+            self._run(['iptables-restore', '--noflush'], '\n'.join(restore) + '\n')
+        if sets['destroy']:
+            self._run(['ipset', 'restore'], ''.join(f'destroy {name}\n' for name in sets['destroy']))
+
+    # ===== RBAC =====
+
+    def get_rbac_state(self) -> Dict[str, Any]:
+        """RBAC sets, chains, their jumps and per-rule RBAC leftovers currently in the filter and nat tables"""
+        state = {
+            'filter': {'chains': set(), 'jumps': set(), 'legacy': []},
+            'nat': {'chains': set(), 'jumps': set(), 'legacy': []},
+            'sets': set()
+        }
+        try:
+            state['sets'] = {name for name in self._run(['ipset', 'list', '-n']).split()
+                             if re.match(r'^rbac-\d+$', name)}
+        except FirewallBackendError:
+            pass
+        table = None
+        for line in self._run(['iptables-save']).split('\n'):
+            if line.startswith('*'):
+                table = line[1:]
+                continue
+            if table not in ('filter', 'nat'):
+                continue
+            match = re.match(r'^:(RBAC-(?:FWD|NAT)-\d+) ', line)
+            if match:
+                state[table]['chains'].add(match.group(1))
+                continue
+            match = re.match(r'^-A (FORWARD|POSTROUTING) -j (RBAC-(?:FWD|NAT)-\d+)$', line)
+            if match:
+                state[table]['jumps'].add(match.group(2))
+            elif re.match(r'^-A (FORWARD|POSTROUTING) .*--comment "?RBAC-\d+-\d+"?', line):
+                # One rule per peer and policy straight in FORWARD / POSTROUTING, written by older releases
+                state[table]['legacy'].append(line)
+        return state
+
+    def installed_rbac_groups(self, state: Dict[str, Any]) -> set:
+        installed = {int(chain.rsplit('-', 1)[1]) for table in ('filter', 'nat') for chain in state[table]['chains']}
+        return installed | {int(name.rsplit('-', 1)[1]) for name in state['sets']}
+
+    def render_filter_policy(self, group_id: int, policy: Dict[str, Any]) -> str:
+        rule_parts = ['-A', self.rbac_filter_chain(group_id), '-m', 'set', '--match-set', self.rbac_set(group_id), 'src',
+                      '-d', policy['destination']]
+        if policy['protocol'] != 'any':
+            rule_parts.extend(['-p', policy['protocol']])
+        if policy['port']:
+            rule_parts.extend(['--dport', policy['port']])
+        rule_parts.extend(['-j', policy['action']])
+        rule_parts.extend(['-m', 'comment', '--comment', f'RBAC-{group_id}-{policy["id"]}'])
+        return ' '.join(rule_parts)
+
+    def render_nat_policy(self, group_id: int, policy: Dict[str, Any]) -> str:
+        rule_parts = ['-A', self.rbac_nat_chain(group_id), '-m', 'set', '--match-set', self.rbac_set(group_id), 'src',
+                      '-d', policy['destination'], '-j', policy['action']]
+        if policy['action'] in ['SNAT', 'DNAT'] and policy['translated_ip']:
+            if policy['translated_port']:
+                rule_parts.extend(['--to-source', f"{policy['translated_ip']}:{policy['translated_port']}"])
+            else:
+                rule_parts.extend(['--to-source', policy['translated_ip']])
+        rule_parts.extend(['-m', 'comment', '--comment', f'RBAC-{group_id}-{policy["id"]}'])
+        return ' '.join(rule_parts)
+
+    def render_rbac_sets(self, groups: List[Dict[str, Any]]) -> str:
+        """One ipset restore payload that fills each group's set and swaps it in atomically"""
+        payload = []
+        for group in groups:
+            name = self.rbac_set(group['id'])
+            payload.append(f'create {name} hash:net family inet -exist')
+            payload.append(f'create {name}-new hash:net family inet -exist')
+            payload.append(f'flush {name}-new')
+            payload.extend(f'add {name}-new {network} -exist' for network in group['networks'])
+            payload.append(f'swap {name}-new {name}')
+            payload.append(f'destroy {name}-new')
+        return '\n'.join(payload) + '\n'
+
+    def render_rbac_rules(self, groups: List[Dict[str, Any]], remove_ids: List[int], state: Dict[str, Any]) -> str:
+        """One iptables-restore --noflush payload that rebuilds the groups' chains and removes the others"""
+        tables = {
+            'filter': {'parent': 'FORWARD', 'chain': self.rbac_filter_chain,
+                       'policies': 'filter_policies', 'render': self.render_filter_policy},
+            'nat': {'parent': 'POSTROUTING', 'chain': self.rbac_nat_chain,
+                    'policies': 'nat_policies', 'render': self.render_nat_policy}
+        }
+        payload = []
+        for table, spec in tables.items():
+            payload.append(f'*{table}')
+            for group in groups:
+                payload.append(f':{spec["chain"](group["id"])} - [0:0]')
+            for line in state[table]['legacy']:
+                payload.append(line.replace('-A ', '-D ', 1))
+            for group in groups:
+                chain = spec['chain'](group['id'])
+                payload.append(f'-F {chain}')
+                payload.extend(spec['render'](group['id'], policy) for policy in group[spec['policies']])
+                if chain not in state[table]['jumps']:
+                    payload.append(f'-A {spec["parent"]} -j {chain}')
+            for group_id in remove_ids:
+                chain = spec['chain'](group_id)
+                if chain in state[table]['jumps']:
+                    payload.append(f'-D {spec["parent"]} -j {chain}')
+                if chain in state[table]['chains']:
+                    payload.append(f'-F {chain}')
+                    payload.append(f'-X {chain}')
+            payload.append('COMMIT')
+        return '\n'.join(payload) + '\n'
+
+    def apply_rbac(self, groups: List[Dict[str, Any]], remove_ids: List[int], prune: bool = False) -> Dict[str, Any]:
+        started = time.perf_counter()
+        state = self.get_rbac_state()
+        if prune:
+            remove_ids = sorted(set(remove_ids) | (self.installed_rbac_groups(state) - {g['id'] for g in groups}))
+        sets = self.render_rbac_sets(groups)
+        payload = self.render_rbac_rules(groups, remove_ids, state)
+        rendered = time.perf_counter()
+        # Sets first, the chains refer to them; sets of removed groups only once nothing refers to them anymore
+        if groups:
+            self._run(['ipset', 'restore'], sets)
+        self._run(['iptables-restore', '--noflush'], payload)
+        stale = [self.rbac_set(group_id) for group_id in remove_ids if self.rbac_set(group_id) in state['sets']]
+        if stale:
+            self._run(['ipset', 'restore'], ''.join(f'destroy {name}\n' for name in stale))
+        applied = time.perf_counter()
+        return {
+            'rules': sum(1 for line in payload.split('\n') if line.startswith('-A RBAC-')),
+            'members': sum(1 for line in sets.split('\n') if line.startswith('add ')),
+            'removed': len(remove_ids),
+            'render_ms': round((rendered - started) * 1000, 2),
+            'apply_ms': round((applied - rendered) * 1000, 2)
+        }
+
+    def update_rbac_set(self, group_id: int, networks: List[str], add: bool = True):
+        self._run(['ipset', 'restore'],
+                  ''.join(f'{"add" if add else "del"} {self.rbac_set(group_id)} {network} -exist\n' for network in networks))
+
+
+    def rbac_entries(self, groups: List[Dict[str, Any]]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+        entries = {'filter': {}, 'nat': {}}
+        for group in groups:
+            entries['filter'][self.rbac_filter_chain(group['id'])] = [
+                self.describe(self.render_filter_policy(group['id'], policy)) for policy in group['filter_policies']]
+            entries['nat'][self.rbac_nat_chain(group['id'])] = [
+                self.describe(self.render_nat_policy(group['id'], policy)) for policy in group['nat_policies']]
+        return entries
+
+    def jump_entry(self, table: str, parent: str, chain: str) -> Dict[str, Any]:
+        return self.describe(f'-A {parent} -j {chain}')
+
+    def list_rbac_sets(self) -> Dict[str, List[str]]:
+        sets = {}
+        try:
+            output = self._run(['ipset', 'save'])
+        except FirewallBackendError:
+            return sets
+        for line in output.split('\n'):
+            parts = line.split()
+            if len(parts) >= 3 and parts[0] in ('create', 'add') and re.match(r'^rbac-\d+$', parts[1]):
+                members = sets.setdefault(parts[1], [])
+                if parts[0] == 'add':
+                    members.append(str(ipaddress.ip_network(parts[2], strict=False)))
+        return sets
+
+
+class NftablesBackend(FirewallBackend):
+    """
+    nftables through its JSON API: `nft -j list ruleset` is parsed and every change is one `nft -j -f -`
+    transaction. Rules live in two tables of our own (filter and nat base chains named like the iptables
+    chains); RBAC groups are named sets matched by one rule per policy.
+    """
+    name = 'nftables'
+    FILTER_HOOKS = {'INPUT': ('input', 0), 'OUTPUT': ('output', 0), 'FORWARD': ('forward', 0)}
+    NAT_HOOKS = {'PREROUTING': ('prerouting', -100), 'POSTROUTING': ('postrouting', 100), 'OUTPUT': ('output', -100)}
+    VERDICTS = {'ACCEPT': 'accept', 'DROP': 'drop', 'REJECT': 'reject', 'RETURN': 'return'}
+
+    def __init__(self, command: List[str] = None, rules_file: str = "/etc/wgdashboard/nftables.json",
+                 family: str = 'ip', filter_table: str = 'wgdashboard', nat_table: str = 'wgdashboard_nat'):
+        self.command = command or ['nft']
+        self.rules_file = rules_file
+        self.family = family
+        self.tables = {'filter': filter_table, 'nat': nat_table}
+
+    def rbac_set(self, group_id: int) -> str:
+        return f'rbac_{group_id}'
+
+    def _nft(self, args: List[str], payload: str = None) -> str:
+        return self._run(self.command + args, payload)
+
+    def _transaction(self, commands: List[Dict[str, Any]]):
+        self._nft(['-j', '-f', '-'], json.dumps({'nftables': commands}))
+
+    def _list(self) -> List[Dict[str, Any]]:
+        return json.loads(self._nft(['-j', 'list', 'ruleset'])).get('nftables', [])
+
+    def _ref(self, table: str, **kwargs) -> Dict[str, Any]:
+        return dict({'family': self.family, 'table': self.tables[table]}, **kwargs)
+
+    def _scaffold(self) -> List[Dict[str, Any]]:
+        """Our tables and base chains; `add` leaves existing ones as they are"""
+        commands = []
+        for table, hooks, chain_type in (('filter', self.FILTER_HOOKS, 'filter'), ('nat', self.NAT_HOOKS, 'nat')):
+            commands.append({'add': {'table': {'family': self.family, 'name': self.tables[table]}}})
+            for chain, (hook, priority) in hooks.items():
+                commands.append({'add': {'chain': self._ref(table, name=chain, type=chain_type, hook=hook,
+                                                            prio=priority, policy='accept')}})
+        return commands
+
+    # ===== EXPRESSIONS =====
+
+    @staticmethod
+    def _address(value: str) -> Any:
+        try:
+            network = ipaddress.ip_network(value.strip(), strict=False)
+        except ValueError:
+            raise FirewallBackendError(f'Invalid address: {value}')
+        if network.prefixlen == network.max_prefixlen:
+            return str(network.network_address)
+        return {'prefix': {'addr': str(network.network_address), 'len': network.prefixlen}}
+
+    @staticmethod
+    def _port(value: str) -> Any:
+        try:
+            if ':' in str(value):
+                low, high = str(value).split(':', 1)
+                return {'range': [int(low), int(high)]}
+            return int(value)
+        except ValueError:
+            raise FirewallBackendError(f'Invalid port: {value}')
+
+    @staticmethod
+    def _match(left: Dict[str, Any], right: Any) -> Dict[str, Any]:
+        return {'match': {'op': '==', 'left': left, 'right': right}}
+
+    def _match_exprs(self, source: str = None, destination: str = None, protocol: str = None,
+                     port: str = None) -> List[Dict[str, Any]]:
+        exprs = []
+        if source:
+            exprs.append(self._match({'payload': {'protocol': 'ip', 'field': 'saddr'}},
+                                     source if source.startswith('@') else self._address(source)))
+        if destination:
+            exprs.append(self._match({'payload': {'protocol': 'ip', 'field': 'daddr'}}, self._address(destination)))
+        if protocol and protocol not in ('any', 'all'):
+            exprs.append(self._match({'meta': {'key': 'l4proto'}}, protocol))
+        if port:
+            if protocol not in ('tcp', 'udp', 'sctp', 'dccp'):
+                raise FirewallBackendError('A destination port needs protocol tcp or udp')
+            exprs.append(self._match({'payload': {'protocol': protocol, 'field': 'dport'}}, self._port(port)))
+        exprs.append({'counter': {'packets': 0, 'bytes': 0}})
+        return exprs
+
+    def _nat_to(self, value: str) -> Dict[str, Any]:
+        address, _, port = (value or '').partition(':')
+        if not address:
+            raise FirewallBackendError('SNAT / DNAT needs a translated address')
+        to = {'addr': str(ipaddress.ip_address(address.strip()))}
+        if port:
+            to['port'] = self._port(port)
+        return to
+
+    def _target_expr(self, target: str, to_source: str = None, to_destination: str = None) -> Optional[Dict[str, Any]]:
+        if not target:
+            return None
+        if target in self.VERDICTS:
+            return {self.VERDICTS[target]: None}
+        if target == 'MASQUERADE':
+            return {'masquerade': None}
+        if target == 'SNAT':
+            return {'snat': self._nat_to(to_source)}
+        if target == 'DNAT':
+            return {'dnat': self._nat_to(to_destination)}
+        if target == 'LOG':
+            return {'log': None}
+        if re.match(r'^[A-Za-z0-9_-]+$', target):
+            return {'jump': {'target': target}}
+        raise FirewallBackendError(f'Target {target} is not supported on nftables')
+
+    @staticmethod
+    def _render_value(value: Any) -> str:
+        if isinstance(value, dict):
+            if 'prefix' in value:
+                return f"{value['prefix']['addr']}/{value['prefix']['len']}"
+            if 'range' in value:
+                return f"{value['range'][0]}-{value['range'][1]}"
+            if 'set' in value:
+                return '{ ' + ', '.join(NftablesBackend._render_value(v) for v in value['set']) + ' }'
+            return json.dumps(value)
+        return str(value)
+
+    def describe(self, rule: Dict[str, Any]) -> Dict[str, Any]:
+        """Display fields and nft-like text of one listed rule"""
+        described = {
+            'chain': rule['chain'],
+            'source': 'Any',
+            'destination': 'Any',
+            'protocol': 'Any',
+            'port': 'Any',
+            'target': 'ACCEPT',
+            'packets': 0,
+            'bytes': 0
+        }
+        text = []
+        for expr in rule.get('expr', []):
+            key, value = next(iter(expr.items()))
+            if key == 'match':
+                left, right = value['left'], self._render_value(value['right'])
+                operator = '' if value.get('op', '==') == '==' else f"{value['op']} "
+                if 'payload' in left:
+                    field, protocol = left['payload'].get('field'), left['payload'].get('protocol')
+                    text.append(f'{protocol} {field} {operator}{right}')
+                    if field == 'saddr':
+                        described['source'] = right
+                    elif field == 'daddr':
+                        described['destination'] = right
+                    elif field == 'dport':
+                        described['port'] = right
+                        described['protocol'] = protocol
+                elif 'meta' in left:
+                    text.append(f"meta {left['meta']['key']} {operator}{right}")
+                    if left['meta']['key'] == 'l4proto':
+                        described['protocol'] = right
+                else:
+                    text.append(f'{json.dumps(left)} {operator}{right}')
+            elif key == 'counter':
+                described['packets'] = (value or {}).get('packets', 0)
+                described['bytes'] = (value or {}).get('bytes', 0)
+            elif key in ('jump', 'goto'):
+                text.append(f"{key} {value['target']}")
+                described['target'] = value['target']
+            elif key in ('snat', 'dnat'):
+                to = value.get('addr', '')
+                if 'port' in value:
+                    to = f"{to}:{self._render_value(value['port'])}"
+                text.append(f'{key} to {to}')
+                described['target'] = key.upper()
+            else:
+                text.append(key)
+                described['target'] = key.upper()
+        if rule.get('comment'):
+            text.append(f'comment "{rule["comment"]}"')
+        described['raw'] = ' '.join(text)
+        return described
+
+    # ===== RULES =====
+
+    def list_ruleset(self, objects: List[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+        names = {name: table for table, name in self.tables.items()}
+        tables = {table: {'lines': [], 'rules': [], 'chains': set(), 'sets': set()} for table in self.tables}
+        for item in self._list() if objects is None else objects:
+            kind, value = next(iter(item.items()))
+            if not isinstance(value, dict) or value.get('family') != self.family or value.get('table') not in names:
+                continue
+            table = tables[names[value['table']]]
+            if kind == 'chain':
+                table['chains'].add(value['name'])
+            elif kind == 'set':
+                table['sets'].add(value['name'])
+            elif kind == 'rule':
+                rule = self.describe(value)
+                rule.update({'handle': value['handle'], 'expr': value['expr'], 'comment': value.get('comment')})
+                table['rules'].append(rule)
+        return tables
+
+    def add_rule(self, table: str, rule_data: Dict[str, Any]) -> str:
+        exprs = self._match_exprs(rule_data.get('source'), rule_data.get('destination'),
+                                  rule_data.get('protocol'), rule_data.get('port'))
+        target = self._target_expr(rule_data.get('target'), rule_data.get('toSource'), rule_data.get('toDestination'))
+        if target is not None:
+            exprs.append(target)
+        rule = self._ref(table, chain=rule_data['chain'], expr=exprs)
+        self._transaction(self._scaffold() + [{'add': {'rule': rule}}])
+        return f"{self.tables[table]} {rule_data['chain']} {self.describe(rule)['raw']}"
+
+    def delete_rule(self, table: str, rule: Dict[str, Any]) -> str:
+        # Handles are never reused, a stale cached entry can only fail, never hit another rule
+        self._transaction([{'delete': {'rule': self._ref(table, chain=rule['chain'], handle=rule['handle'])}}])
+        return f"{self.tables[table]} {rule['chain']} handle {rule['handle']}"
+
+    def _readd(self, table: str, rule: Dict[str, Any]) -> Dict[str, Any]:
+        readded = self._ref(table, chain=rule['chain'], expr=rule['expr'])
+        if rule.get('comment'):
+            readded['comment'] = rule['comment']
+        return {'add': {'rule': readded}}
+
+    def save_rules(self) -> str:
+        objects = []
+        for name in self.tables.values():
+            objects += [item for item in json.loads(self._nft(['-j', 'list', 'table', self.family, name]))['nftables']
+                        if 'metainfo' not in item]
+        os.makedirs(os.path.dirname(self.rules_file), exist_ok=True)
+        with open(f'{self.rules_file}.tmp', 'w') as f:
+            json.dump({'nftables': objects}, f)
+        os.replace(f'{self.rules_file}.tmp', self.rules_file)
+        return self.rules_file
+
+    def saved_ruleset(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        if not os.path.exists(self.rules_file):
+            return None
+        with open(self.rules_file, 'r') as f:
+            return self.list_ruleset(json.load(f).get('nftables', []))
+
+    def rule_key(self, rule: Dict[str, Any]) -> Any:
+        """Expressions without counters and without the l4proto match nft adds (or drops) in front of a port match"""
+        exprs = [expr for expr in rule.get('expr', []) if 'counter' not in expr]
+        protocols = {expr['match']['left']['payload'].get('protocol') for expr in exprs
+                     if 'match' in expr and 'payload' in expr['match']['left']}
+        exprs = [expr for expr in exprs if not ('match' in expr and expr['match']['left'].get('meta', {}).get('key') == 'l4proto'
+                                                and expr['match']['right'] in protocols)]
+        return json.dumps([exprs, rule.get('comment')], sort_keys=True)
+
+    def apply_plan(self, plan: Dict[str, Any]):
+        """Every set, chain and rule change of the plan in one nft transaction"""
+        sets = plan['sets']
+        commands = self._scaffold()
+        for table in self.tables:
+            for name in sets['create']:
+                commands.append({'add': {'set': self._ref(table, name=name, type='ipv4_addr', flags=['interval'])}})
+            for name, networks in sets['add'].items():
+                commands.append({'add': {'element': self._ref(table, name=name, elem=self._set_elements(networks))}})
+            for name, networks in sets['delete'].items():
+                # Adding first makes the delete safe in a table whose set has drifted
+                elements = self._set_elements(networks)
+                commands.append({'add': {'element': self._ref(table, name=name, elem=elements)}})
+                commands.append({'delete': {'element': self._ref(table, name=name, elem=elements)}})
+        for table, changes in plan['tables'].items():
+            commands.extend({'add': {'chain': self._ref(table, name=chain)}} for chain in changes['create'])
+            for chain, diff in changes['chains'].items():
+                commands.extend({'delete': {'rule': self._ref(table, chain=chain, handle=delete['rule']['handle'])}}
+                                for delete in diff['delete'])
+                length = diff['keep']
+                for insert in diff['insert']:
+                    rule = self._readd(table, dict(insert['rule'], chain=chain))['add']['rule']
+                    if insert['position'] - 1 < length:
+                        rule['index'] = insert['position'] - 1
+                        commands.append({'insert': {'rule': rule}})
+                    else:
+                        commands.append({'add': {'rule': rule}})
+                    length += 1
+            for chain in changes['remove']:
+                commands.append({'flush': {'chain': self._ref(table, name=chain)}})
+                commands.append({'delete': {'chain': self._ref(table, name=chain)}})
+        for table in self.tables:
+            for name in sets['destroy']:
+                commands.append({'add': {'set': self._ref(table, name=name, type='ipv4_addr', flags=['interval'])}})
+                commands.append({'delete': {'set': self._ref(table, name=name)}})
+        self._transaction(commands)
+
+    # ===== RBAC =====
+
+    def _set_elements(self, networks: List[str]) -> List[Any]:
+        return [self._address(network) for network in networks]
+
+    def render_filter_policy(self, group_id: int, policy: Dict[str, Any]) -> Dict[str, Any]:
+        exprs = self._match_exprs(f'@{self.rbac_set(group_id)}', policy['destination'],
+                                  policy['protocol'], policy['port'])
+        exprs.append(self._target_expr(policy['action']))
+        return self._ref('filter', chain=self.rbac_filter_chain(group_id), expr=exprs,
+                         comment=f'RBAC-{group_id}-{policy["id"]}')
+
+    def render_nat_policy(self, group_id: int, policy: Dict[str, Any]) -> Dict[str, Any]:
+        exprs = self._match_exprs(f'@{self.rbac_set(group_id)}', policy['destination'])
+        to = policy['translated_ip']
+        if to and policy['translated_port']:
+            to = f"{to}:{policy['translated_port']}"
+        exprs.append(self._target_expr(policy['action'], to, to))
+        return self._ref('nat', chain=self.rbac_nat_chain(group_id), expr=exprs,
+                         comment=f'RBAC-{group_id}-{policy["id"]}')
+
+    def apply_rbac(self, groups: List[Dict[str, Any]], remove_ids: List[int], prune: bool = False) -> Dict[str, Any]:
+        """Rebuild the groups' sets and chains and drop removed ones, all in one nft transaction"""
+        started = time.perf_counter()
+        objects = self._list()
+        ruleset = self.list_ruleset(objects)
+        specs = {
+            'filter': {'parent': 'FORWARD', 'chain': self.rbac_filter_chain,
+                       'policies': 'filter_policies', 'render': self.render_filter_policy},
+            'nat': {'parent': 'POSTROUTING', 'chain': self.rbac_nat_chain,
+                    'policies': 'nat_policies', 'render': self.render_nat_policy}
+        }
+        if prune:
+            installed = {int(chain.rsplit('-', 1)[1]) for table in ruleset.values()
+                         for chain in table['chains'] if re.match(r'^RBAC-(FWD|NAT)-\d+$', chain)}
+            installed |= {int(name.rsplit('_', 1)[1]) for table in ruleset.values()
+                          for name in table['sets'] if re.match(r'^rbac_\d+$', name)}
+            remove_ids = sorted(set(remove_ids) | (installed - {g['id'] for g in groups}))
+        commands = self._scaffold()
+        rules = members = 0
+        for table, spec in specs.items():
+            jumps = {}
+            for rule in ruleset[table]['rules']:
+                if rule['chain'] == spec['parent'] and re.match(r'^jump RBAC-(FWD|NAT)-\d+$', rule['raw']):
+                    jumps.setdefault(rule['target'], []).append(rule['handle'])
+            for group in groups:
+                name, chain = self.rbac_set(group['id']), spec['chain'](group['id'])
+                commands.append({'add': {'set': self._ref(table, name=name, type='ipv4_addr', flags=['interval'])}})
+                commands.append({'flush': {'set': self._ref(table, name=name)}})
+                if group['networks']:
+                    commands.append({'add': {'element': self._ref(table, name=name,
+                                                                   elem=self._set_elements(group['networks']))}})
+                    members += len(group['networks']) if table == 'filter' else 0
+                commands.append({'add': {'chain': self._ref(table, name=chain)}})
+                commands.append({'flush': {'chain': self._ref(table, name=chain)}})
+                for policy in group[spec['policies']]:
+                    commands.append({'add': {'rule': spec['render'](group['id'], policy)}})
+                    rules += 1
+                if chain not in jumps:
+                    commands.append({'add': {'rule': self._ref(table, chain=spec['parent'],
+                                                               expr=[{'jump': {'target': chain}}])}})
+            for group_id in remove_ids:
+                name, chain = self.rbac_set(group_id), spec['chain'](group_id)
+                for handle in jumps.get(chain, []):
+                    commands.append({'delete': {'rule': self._ref(table, chain=spec['parent'], handle=handle)}})
+                if chain in ruleset[table]['chains']:
+                    commands.append({'flush': {'chain': self._ref(table, name=chain)}})
+                    commands.append({'delete': {'chain': self._ref(table, name=chain)}})
+                if name in ruleset[table]['sets']:
+                    commands.append({'delete': {'set': self._ref(table, name=name)}})
+        rendered = time.perf_counter()
+        self._transaction(commands)
+        applied = time.perf_counter()
+        return {
+            'rules': rules,
+            'members': members,
+            'removed': len(remove_ids),
+            'render_ms': round((rendered - started) * 1000, 2),
+            'apply_ms': round((applied - rendered) * 1000, 2)
+        }
+
+    def rbac_entries(self, groups: List[Dict[str, Any]]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+        entries = {'filter': {}, 'nat': {}}
+        for table, chain, policies, render in (('filter', self.rbac_filter_chain, 'filter_policies', self.render_filter_policy),
+                                               ('nat', self.rbac_nat_chain, 'nat_policies', self.render_nat_policy)):
+            for group in groups:
+                rules = [render(group['id'], policy) for policy in group[policies]]
+                entries[table][chain(group['id'])] = [dict(self.describe(rule), expr=rule['expr'], comment=rule.get('comment'))
+                                                      for rule in rules]
+        return entries
+
+    def jump_entry(self, table: str, parent: str, chain: str) -> Dict[str, Any]:
+        rule = {'chain': parent, 'expr': [{'jump': {'target': chain}}]}
+        return dict(self.describe(rule), expr=rule['expr'], comment=None)
+
+    def list_rbac_sets(self) -> Dict[str, List[str]]:
+        sets = {}
+        for item in self._list():
+            value = item.get('set')
+            if value is None or value.get('family') != self.family or value.get('table') != self.tables['filter'] \
+                    or not re.match(r'^rbac_\d+$', value['name']):
+                continue
+            sets[value['name']] = [str(ipaddress.ip_network(
+                f"{element['prefix']['addr']}/{element['prefix']['len']}" if isinstance(element, dict) else element,
+                strict=False)) for element in value.get('elem', [])]
+        return sets
+
+    def update_rbac_set(self, group_id: int, networks: List[str], add: bool = True):
+        elements = self._set_elements(networks)
+        self._transaction([{'add' if add else 'delete': {'element': self._ref(table, name=self.rbac_set(group_id),
+                                                                               elem=elements)}}
+                           for table in self.tables])
+
+
+def get_firewall_backend(name: str = 'auto', **kwargs) -> FirewallBackend:
+    """Backend by name; 'auto' keeps iptables where it is installed and uses nftables otherwise"""
+    name = (name or 'auto').lower()
+    if name == 'auto':
+        name = 'iptables' if shutil.which('iptables-save') or not shutil.which('nft') else 'nftables'
+    if name == 'iptables':
+        return IptablesBackend(**kwargs)
+    if name in ('nftables', 'nft'):
+        return NftablesBackend(**kwargs)
+    raise FirewallBackendError(f'Unknown firewall backend: {name}')
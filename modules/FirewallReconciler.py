@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+FirewallReconciler - Module for bringing the live firewall to the dashboard's desired state
+Diffs desired filter, NAT and RBAC rules against the live ruleset and applies only the changes
+"""
+
+import difflib
+import re
+import time
+from collections import Counter
+from typing import List, Dict, Any, Callable, Iterable, Optional, Tuple
+
+from .FirewallBackend import FirewallBackend, FirewallBackendError
+
+RBAC_CHAIN = re.compile(r'^RBAC-(FWD|NAT)-(\d+)$')
+# Chains the RBAC group chains are jumped to from
+RBAC_PARENTS = {'filter': 'FORWARD', 'nat': 'POSTROUTING'}
+
+
+def diff_chain(live: List[Dict[str, Any]], desired: List[Dict[str, Any]], key: Callable) -> Dict[str, Any]:
+    """
+    Minimal edit of one chain: positions are 1-based, deletes refer to the live chain and run
+    from the bottom up, inserts refer to the final chain and run from the top down afterwards
+    """
+    live_keys = [key(rule) for rule in live]
+    desired_keys = [key(rule) for rule in desired]
+    deletes, inserts, keep = [], [], 0
+    matcher = difflib.SequenceMatcher(None, live_keys, desired_keys, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            keep += i2 - i1
+            continue
+        deletes.extend({'position': i + 1, 'rule': live[i]} for i in range(i1, i2))
+        inserts.extend({'position': j + 1, 'rule': desired[j]} for j in range(j1, j2))
+    # A rule deleted in one place and inserted in another is a move
+    deleted = Counter(live_keys[delete['position'] - 1] for delete in deletes)
+    inserted = Counter(desired_keys[insert['position'] - 1] for insert in inserts)
+    deletes.reverse()
+    return {
+        'delete': deletes,
+        'insert': inserts,
+        'keep': keep,
+        'moves': sum(min(count, inserted[rule_key]) for rule_key, count in deleted.items()),
+        'length': len(desired)
+    }
+
+
+class FirewallReconciler:
+    def __init__(self, firewall_manager, rbac_manager=None):
+        self.firewall_manager = firewall_manager
+        self.rbac_manager = rbac_manager
+
+    def set_rbac_manager(self, rbac_manager):
+        self.rbac_manager = rbac_manager
+
+    def get_backend(self) -> FirewallBackend:
+        return self.firewall_manager.get_backend()
+
+    @staticmethod
+    def _chains(tables: Dict[str, Dict[str, Any]], table: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Rules of a parsed table per chain, chains without rules included"""
+        content = tables.get(table, {'rules': [], 'chains': set()})
+        chains = {chain: [] for chain in sorted(content.get('chains', set()))}
+        for rule in content['rules']:
+            chains.setdefault(rule['chain'], []).append(rule)
+        return chains
+
+    # =============================================================================
+    # DESIRED STATE
+    # =============================================================================
+
+    def desired_state(self, source: str = 'saved', tables: Iterable[str] = ('filter', 'nat')) \
+            -> Tuple[Dict[str, Dict[str, List[Dict[str, Any]]]], Dict[str, Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+        """
+        Desired chains per table, the live ruleset they are compared to and the RBAC groups.
+        Filter and NAT chains come from the saved rules file (or stay as they are with source='live'),
+        RBAC chains, their jumps and their sets from the RBAC database. Chains neither side knows are left alone.
+        """
+        backend = self.get_backend()
+        live = self.firewall_manager.get_ruleset(force=True)['tables']
+        base = live
+        if source == 'saved':
+            base = backend.saved_ruleset()
+            if base is None:
+                raise FirewallBackendError(f'No rules file found at {backend.rules_file}')
+        elif source != 'live':
+            raise FirewallBackendError(f'Unknown source: {source}')
+
+        groups = None
+        entries = {}
+        if self.rbac_manager is not None:
+            groups = [self.rbac_manager.get_group_spec(group['id']) for group in self.rbac_manager.get_all_groups()]
+            entries = backend.rbac_entries(groups)
+
+        desired = {}
+        for table in tables:
+            live_chains = self._chains(live, table)
+            chains = {chain: rules for chain, rules in self._chains(base, table).items() if not RBAC_CHAIN.match(chain)}
+            if groups is None:
+                # Without the RBAC database the group chains stay exactly as they are
+                chains.update({chain: rules for chain, rules in live_chains.items() if RBAC_CHAIN.match(chain)})
+            else:
+                group_chains = entries.get(table, {})
+                chains.update(group_chains)
+                parent = RBAC_PARENTS.get(table)
+                if parent is not None:
+                    rules = [rule for rule in chains.get(parent, live_chains.get(parent, []))
+                             if not (RBAC_CHAIN.match(rule['target'] or '') and rule['target'] not in group_chains)]
+                    jumped = {rule['target'] for rule in rules}
+                    rules.extend(backend.jump_entry(table, parent, chain) for chain in group_chains if chain not in jumped)
+                    chains[parent] = rules
+            desired[table] = chains
+        return desired, live, groups
+
+    # =============================================================================
+    # PLAN
+    # =============================================================================
+
+    def plan(self, desired: Dict[str, Dict[str, List[Dict[str, Any]]]], live: Dict[str, Dict[str, Any]],
+             groups: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Chain, rule and set changes turning live into desired, with their estimated cost"""
+        backend = self.get_backend()
+        plan = {'tables': {}, 'sets': {'create': [], 'add': {}, 'delete': {}, 'destroy': []}}
+        operations = full_rewrite = kept = moves = 0
+        for table, chains in desired.items():
+            live_chains = self._chains(live, table)
+            builtin = backend.FILTER_CHAINS if table == 'filter' else backend.NAT_CHAINS
+            changes = {
+                'create': [chain for chain in chains if chain not in live_chains and chain not in builtin],
+                'remove': [],
+                'chains': {}
+            }
+            if groups is not None:
+                changes['remove'] = [chain for chain in live_chains if RBAC_CHAIN.match(chain) and chain not in chains]
+            for chain, rules in chains.items():
+                current = live_chains.get(chain, [])
+                diff = diff_chain(current, rules, backend.rule_key)
+                kept += diff['keep']
+                if diff['delete'] or diff['insert']:
+                    changes['chains'][chain] = diff
+                    operations += len(diff['delete']) + len(diff['insert'])
+                    moves += diff['moves']
+                    # What flushing the chain and restoring it would have cost
+                    full_rewrite += 1 + len(rules)
+            operations += len(changes['create']) + 2 * len(changes['remove'])
+            full_rewrite += len(changes['create']) + sum(2 + len(live_chains[chain]) for chain in changes['remove'])
+            plan['tables'][table] = changes
+
+        if groups is not None:
+            sets = plan['sets']
+            live_sets = backend.list_rbac_sets()
+            desired_sets = {backend.rbac_set(group['id']): group['networks'] for group in groups}
+            for name, networks in desired_sets.items():
+                current = live_sets.get(name)
+                if current is None:
+                    sets['create'].append(name)
+                    current = []
+                added = [network for network in networks if network not in current]
+                removed = [network for network in current if network not in networks]
+                if added:
+                    sets['add'][name] = added
+                if removed:
+                    sets['delete'][name] = removed
+                operations += len(added) + len(removed)
+                full_rewrite += 1 + len(networks)
+            sets['destroy'] = [name for name in live_sets if name not in desired_sets]
+            operations += len(sets['create']) + len(sets['destroy'])
+            full_rewrite += len(sets['destroy'])
+
+        plan['estimated_cost'] = {
+            'operations': operations,
+            'full_rewrite_operations': full_rewrite,
+            'rules_kept': kept,
+            'moves': moves
+        }
+        plan['summary'] = self.summarize(plan)
+        return plan
+
+    @staticmethod
+    def summarize(plan: Dict[str, Any]) -> List[str]:
+        """One line per change, in the order they are applied"""
+        lines = []
+        sets = plan['sets']
+        lines.extend(f'create set {name}' for name in sets['create'])
+        for name, networks in sets['add'].items():
+            lines.extend(f'add {network} to set {name}' for network in networks)
+        for name, networks in sets['delete'].items():
+            lines.extend(f'delete {network} from set {name}' for network in networks)
+        for table, changes in plan['tables'].items():
+            lines.extend(f'{table}: create chain {chain}' for chain in changes['create'])
+            for chain, diff in changes['chains'].items():
+                lines.extend(f"{table}: delete {chain} #{delete['position']}: {delete['rule']['raw']}" for delete in diff['delete'])
+                lines.extend(f"{table}: insert {chain} #{insert['position']}: {insert['rule']['raw']}" for insert in diff['insert'])
+            lines.extend(f'{table}: remove chain {chain}' for chain in changes['remove'])
+        lines.extend(f'destroy set {name}' for name in sets['destroy'])
+        return lines
+
+    @staticmethod
+    def report(plan: Dict[str, Any]) -> Dict[str, Any]:
+        """The plan without the parsed rules, for the API"""
+        return {
+            'tables': {table: {
+                'create': changes['create'],
+                'remove': changes['remove'],
+                'chains': {chain: {
+                    'delete': [delete['position'] for delete in diff['delete']],
+                    'insert': [{'position': insert['position'], 'rule': insert['rule']['raw']} for insert in diff['insert']],
+                    'keep': diff['keep'],
+                    'moves': diff['moves']
+                } for chain, diff in changes['chains'].items()}
+            } for table, changes in plan['tables'].items()},
+            'sets': plan['sets'],
+            'estimated_cost': plan['estimated_cost'],
+            'summary': plan['summary']
+        }
+
+    # =============================================================================
+    # APPLY
+    # =============================================================================
+
+    def apply(self, plan: Dict[str, Any], dry_run: bool = False) -> Dict[str, Any]:
+        """Apply a plan in one backend transaction, returns its report"""
+        report = self.report(plan)
+        report.update({'dry_run': dry_run, 'applied': False, 'apply_ms': 0.0})
+        if dry_run or plan['estimated_cost']['operations'] == 0:
+            return report
+        started = time.perf_counter()
+        try:
+            self.get_backend().apply_plan(plan)
+        finally:
+            self.firewall_manager.invalidate_cache()
+        report['applied'] = True
+        report['apply_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return report
+
+    def reconcile(self, dry_run: bool = False, source: str = 'saved') -> Dict[str, Any]:
+        """Converge filter, NAT and RBAC state, or only show the plan with dry_run"""
+        started = time.perf_counter()
+        desired, live, groups = self.desired_state(source)
+        plan = self.plan(desired, live, groups)
+        plan_ms = round((time.perf_counter() - started) * 1000, 2)
+        report = self.apply(plan, dry_run)
+        report['plan_ms'] = plan_ms
+        return report
+
+    def reorder(self, table: str, chains: List[str], ordered_rules: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Move the rules of the given chains into the new order"""
+        live = self.firewall_manager.get_ruleset(force=True)['tables']
+        desired = {table: {chain: [rule for rule in ordered_rules if rule['chain'] == chain] for chain in chains}}
+        return self.apply(self.plan(desired, live))
+
+    def reload(self, table: str) -> Dict[str, Any]:
+        """Bring one table back to the saved rules file"""
+        desired, live, groups = self.desired_state('saved', (table,))
+        return self.apply(self.plan(desired, live, groups))
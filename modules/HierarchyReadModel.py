@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+HierarchyReadModel - Module for a denormalized view of the organization / group / user hierarchy
+Writes are captured by triggers into a change table per database; reads reload only the changed entities
+"""
+
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from .DatabaseConnections import DatabaseConnections
+
+# Per database: table -> (columns whose updates matter or None for all, [(entity, key column)])
+TRACKED_TABLES = {
+    'users': {
+        'users': (['username', 'email', 'full_name', 'role', 'is_active'], [('user', 'id')]),
+        'user_groups': (None, [('user', 'user_id'), ('group', 'group_id')])
+    },
+    'rbac': {
+        'rbac_groups': (None, [('group', 'id')]),
+        'rbac_group_organizations': (None, [('group', 'group_id'), ('organization', 'organization_id')])
+    },
+    'organization': {
+        'organizations': (None, [('organization', 'id')]),
+        'organization_subnets': (None, [('organization', 'organization_id')]),
+        'user_organizations': (None, [('organization', 'organization_id'), ('user', 'user_id')])
+    }
+}
+
+
+class HierarchyReadModel:
+    def __init__(self, connections: DatabaseConnections):
+        self.connections = connections
+        self._lock = threading.RLock()
+        self._sequences = None
+        self.groups = {}
+        self.organizations = {}
+        self.users = {}
+        self._snapshot = None
+        self.install_triggers()
+
+    def install_triggers(self):
+        """Create the change table and its triggers in every database"""
+        for database, tables in TRACKED_TABLES.items():
+            try:
+                with self.connections.connect(database) as conn:
+                    conn.execute("""
+                        CREATE TABLE IF NOT EXISTS hierarchy_changes (
+                            entity TEXT NOT NULL,
+                            entity_id INTEGER NOT NULL,
+                            sequence INTEGER NOT NULL,
+                            PRIMARY KEY (entity, entity_id)
+                        )
+                    """)
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_hierarchy_changes_sequence ON hierarchy_changes (sequence)")
+                    existing = {row[0] for row in conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'table'")}
+                    for table, (columns, entities) in tables.items():
+                        if table not in existing:
+                            continue
+                        for event, rows in (('insert', ['NEW']), ('update', ['OLD', 'NEW']), ('delete', ['OLD'])):
+                            on = f"UPDATE OF {', '.join(columns)}" if event == 'update' and columns else event.upper()
+                            statements = ''.join(f"""
+                                INSERT INTO hierarchy_changes (entity, entity_id, sequence)
+                                VALUES ('{entity}', {row}.{column}, (SELECT COALESCE(MAX(sequence), 0) + 1 FROM hierarchy_changes))
+                                ON CONFLICT (entity, entity_id) DO UPDATE SET sequence = excluded.sequence;"""
+                                for entity, column in entities for row in rows)
+                            conn.execute(f"""
+                                CREATE TRIGGER IF NOT EXISTS hierarchy_{table}_{event} AFTER {on} ON {table}
+                                BEGIN {statements}
+                                END
+                            """)
+            except Exception as e:
+                print(f"[Hierarchy] Error installing triggers in {database}: {e}")
+
+    @staticmethod
+    def _placeholders(ids) -> str:
+        return ', '.join('?' for _ in ids)
+
+    # =============================================================================
+    # LOADING
+    # =============================================================================
+
+    def _load_groups(self, ids: Optional[List[int]] = None) -> Dict[int, Dict]:
+        where, params = ('WHERE g.id IN (%s)' % self._placeholders(ids), list(ids)) if ids is not None else ('', [])
+        with self.connections.connect('rbac') as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT id, name, description, color, vpn_enabled, vpn_type, vpn_server_name,
+                       auto_route_subnets, custom_routing_enabled, firewall_rules_enabled
+                FROM rbac_groups g {where}
+                ORDER BY g.name
+            """, params)
+            groups = {row['id']: {
+                'id': row['id'],
+                'name': row['name'],
+                'description': row['description'],
+                'color': row['color'],
+                'vpn': {
+                    'enabled': bool(row['vpn_enabled']),
+                    'type': row['vpn_type'],
+                    'server_name': row['vpn_server_name'],
+                    'auto_route_subnets': bool(row['auto_route_subnets']),
+                    'custom_routing_enabled': bool(row['custom_routing_enabled']),
+                    'firewall_rules_enabled': bool(row['firewall_rules_enabled'])
+                },
+                'organization_ids': [],
+                'user_ids': [],
+                'peers': {'total': 0, 'active': 0, 'pending': 0}
+            } for row in cursor.fetchall()}
+            if not groups:
+                return groups
+            group_ids = list(groups)
+            placeholders = self._placeholders(group_ids)
+            cursor.execute(f"""
+                SELECT go.group_id, go.organization_id
+                FROM rbac_group_organizations go
+                JOIN organization.organizations o ON o.id = go.organization_id
+                WHERE go.group_id IN ({placeholders})
+                ORDER BY o.name
+            """, group_ids)
+            for row in cursor.fetchall():
+                groups[row['group_id']]['organization_ids'].append(row['organization_id'])
+            cursor.execute(f"""
+                SELECT ug.group_id, ug.user_id, ug.vpn_peer_generated
+                FROM users.user_groups ug
+                JOIN users.users u ON u.id = ug.user_id
+                WHERE ug.group_id IN ({placeholders})
+                ORDER BY u.username
+            """, group_ids)
+            for row in cursor.fetchall():
+                group = groups[row['group_id']]
+                group['user_ids'].append(row['user_id'])
+                group['peers']['total'] += 1
+                group['peers']['active' if row['vpn_peer_generated'] == 1 else 'pending'] += 1
+        return groups
+
+    def _load_organizations(self, ids: Optional[List[int]] = None) -> Dict[int, Dict]:
+        where, params = ('WHERE o.id IN (%s)' % self._placeholders(ids), list(ids)) if ids is not None else ('', [])
+        with self.connections.connect('organization') as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT o.id, o.name, o.description, o.color,
+                       (SELECT COUNT(*) FROM organization_subnets s WHERE s.organization_id = o.id) as subnet_count,
+                       (SELECT COUNT(*) FROM user_organizations uo WHERE uo.organization_id = o.id) as user_count
+                FROM organizations o {where}
+                ORDER BY o.name
+            """, params)
+            organizations = {row['id']: dict(row, group_ids=[]) for row in cursor.fetchall()}
+            if not organizations:
+                return organizations
+            org_ids = list(organizations)
+            cursor.execute(f"""
+                SELECT go.organization_id, go.group_id
+                FROM rbac.rbac_group_organizations go
+                JOIN rbac.rbac_groups g ON g.id = go.group_id
+                WHERE go.organization_id IN ({self._placeholders(org_ids)})
+                ORDER BY g.name
+            """, org_ids)
+            for row in cursor.fetchall():
+                organizations[row['organization_id']]['group_ids'].append(row['group_id'])
+        return organizations
+
+    def _load_users(self, ids: Optional[List[int]] = None) -> Dict[int, Dict]:
+        where, params = ('WHERE u.id IN (%s)' % self._placeholders(ids), list(ids)) if ids is not None else ('', [])
+        with self.connections.connect('users') as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT u.id, u.username, u.full_name, u.email, u.role, u.is_active
+                FROM users u {where}
+                ORDER BY u.username
+            """, params)
+            users = {row['id']: dict(row, group_ids=[]) for row in cursor.fetchall()}
+            if not users:
+                return users
+            user_ids = list(users)
+            cursor.execute(f"""
+                SELECT ug.user_id, ug.group_id
+                FROM user_groups ug
+                JOIN rbac.rbac_groups g ON g.id = ug.group_id
+                WHERE ug.user_id IN ({self._placeholders(user_ids)})
+                ORDER BY g.name
+            """, user_ids)
+            for row in cursor.fetchall():
+                users[row['user_id']]['group_ids'].append(row['group_id'])
+        return users
+
+    # =============================================================================
+    # SYNC
+    # =============================================================================
+
+    def _changes(self) -> Dict[str, Dict]:
+        """Latest sequence per database and the entities changed since the last sync"""
+        sequences, changed = {}, {'group': set(), 'organization': set(), 'user': set()}
+        for database in TRACKED_TABLES:
+            since = (self._sequences or {}).get(database, 0)
+            with self.connections.connect(database) as conn:
+                sequences[database] = conn.execute("SELECT COALESCE(MAX(sequence), 0) FROM hierarchy_changes").fetchone()[0]
+                if self._sequences is not None and sequences[database] > since:
+                    for entity, entity_id in conn.execute(
+                            "SELECT entity, entity_id FROM hierarchy_changes WHERE sequence > ?", (since,)):
+                        changed[entity].add(entity_id)
+        return {'sequences': sequences, 'changed': changed}
+
+    def sync(self) -> Dict[str, int]:
+        """Bring the model up to date: a full load the first time, then only the entities that changed"""
+        with self._lock:
+            changes = self._changes()
+            if self._sequences is None:
+                self.groups = self._load_groups()
+                self.organizations = self._load_organizations()
+                self.users = self._load_users()
+                self._sequences = changes['sequences']
+                self._snapshot = None
+                return {'groups': len(self.groups), 'organizations': len(self.organizations), 'users': len(self.users)}
+
+            # Relations to rows of another database are not removed with them, so the related entities are reloaded too
+            changed = changes['changed']
+            for group_id in list(changed['group']):
+                group = self.groups.get(group_id, {})
+                changed['organization'].update(group.get('organization_ids', []))
+                changed['user'].update(group.get('user_ids', []))
+            for org_id in list(changed['organization']):
+                changed['group'].update(self.organizations.get(org_id, {}).get('group_ids', []))
+            for user_id in list(changed['user']):
+                changed['group'].update(self.users.get(user_id, {}).get('group_ids', []))
+
+            refreshed = {}
+            for entity, store, load in (('group', self.groups, self._load_groups),
+                                        ('organization', self.organizations, self._load_organizations),
+                                        ('user', self.users, self._load_users)):
+                ids = sorted(changes['changed'][entity])
+                refreshed[f'{entity}s'] = len(ids)
+                if not ids:
+                    continue
+                loaded = load(ids)
+                for entity_id in ids:
+                    if entity_id in loaded:
+                        store[entity_id] = loaded[entity_id]
+                    else:
+                        store.pop(entity_id, None)
+                self._snapshot = None
+            self._sequences = changes['sequences']
+            return refreshed
+
+    def snapshot(self) -> Dict:
+        """The whole hierarchy in one response, rebuilt only when something changed"""
+        try:
+            with self._lock:
+                self.sync()
+                if self._snapshot is None:
+                    self._snapshot = {
+                        'groups': list(self.groups.values()),
+                        'organizations': list(self.organizations.values()),
+                        'users': list(self.users.values())
+                    }
+                snapshot = self._snapshot
+            return {'status': True, 'data': snapshot,
+                    'message': f"Hierarchy snapshot with {len(snapshot['groups'])} groups, "
+                               f"{len(snapshot['organizations'])} organizations and {len(snapshot['users'])} users"}
+        except Exception as e:
+            return {'status': False, 'data': None, 'message': f'Error building hierarchy snapshot: {str(e)}'}
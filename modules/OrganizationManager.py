@@ -7,14 +7,17 @@ Handles organization, subnet, and user-organization relationship management
 import sqlite3
 import os
 from datetime import datetime
+from .DatabaseConnections import DatabaseConnections, get_database_connections
 
 class OrganizationManager:
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, connections: DatabaseConnections = None):
         if db_path is None:
             # Default to the same directory as this module
             db_path = os.path.join(os.path.dirname(__file__), '..', 'db', 'organization.db')
         
         self.db_path = db_path
+        self.connections = connections or get_database_connections()
+        self.connections.register('organization', self.db_path)
         self.init_database()
     
     def init_database(self):
@@ -33,7 +36,7 @@ class OrganizationManager:
     def create_organization(self, name, description=None, color='#007bff'):
         """Create a new organization"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     INSERT INTO organizations (name, description, color)
@@ -49,7 +52,7 @@ class OrganizationManager:
     def get_all_organizations(self):
         """Get all organizations with subnet count"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute("""
@@ -70,7 +73,7 @@ class OrganizationManager:
     def get_organization(self, org_id):
         """Get organization details with subnets"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 
@@ -119,7 +122,7 @@ class OrganizationManager:
             params.append(datetime.now().isoformat())
             params.append(org_id)
             
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 cursor = conn.cursor()
                 cursor.execute(f"""
                     UPDATE organizations 
@@ -140,7 +143,7 @@ class OrganizationManager:
     def delete_organization(self, org_id):
         """Delete organization and all related data"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 cursor = conn.cursor()
                 
                 # Get organization name for message
@@ -162,7 +165,7 @@ class OrganizationManager:
     def add_subnet_to_organization(self, org_id, subnet_cidr, description=None, is_primary=False):
         """Add a subnet to an organization"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 cursor = conn.cursor()
                 
                 # If this is primary, unset other primary subnets for this org
@@ -185,6 +188,18 @@ class OrganizationManager:
         except Exception as e:
             return {'status': False, 'message': f'Error adding subnet: {str(e)}'}
     
+    def get_subnet_organization_id(self, subnet_id):
+        """Get the id of the organization a subnet belongs to"""
+        try:
+            with self.connections.connect('organization') as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT organization_id FROM organization_subnets WHERE id = ?", (subnet_id,))
+                row = cursor.fetchone()
+                return row[0] if row else None
+        except Exception as e:
+            print(f"Error getting subnet organization: {e}")
+            return None
+    
     def update_subnet(self, subnet_id, subnet_cidr=None, description=None, is_primary=None):
         """Update subnet details"""
         try:
@@ -220,7 +235,7 @@ class OrganizationManager:
             
             params.append(subnet_id)
             
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 cursor = conn.cursor()
                 cursor.execute(f"""
                     UPDATE organization_subnets 
@@ -241,7 +256,7 @@ class OrganizationManager:
     def delete_subnet(self, subnet_id):
         """Delete a subnet from an organization"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM organization_subnets WHERE id = ?", (subnet_id,))
                 
@@ -257,7 +272,7 @@ class OrganizationManager:
     def assign_user_to_organization(self, user_id, org_id):
         """Assign a user to an organization"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     INSERT INTO user_organizations (user_id, organization_id)
@@ -274,7 +289,7 @@ class OrganizationManager:
     def remove_user_from_organization(self, user_id, org_id):
         """Remove a user from an organization"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     DELETE FROM user_organizations 
@@ -292,7 +307,7 @@ class OrganizationManager:
     def get_user_organizations(self, user_id):
         """Get all organizations for a user"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute("""
@@ -309,7 +324,7 @@ class OrganizationManager:
     def get_organization_users(self, org_id):
         """Get all users in an organization"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute("""
@@ -327,7 +342,7 @@ class OrganizationManager:
     def get_user_subnets(self, user_id):
         """Get all subnets for organizations that a user belongs to"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute("""
@@ -345,7 +360,7 @@ class OrganizationManager:
     def get_all_organization_subnets(self):
         """Get all subnets from all organizations for routing purposes"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute("""
@@ -395,7 +410,7 @@ class OrganizationManager:
             params.append(datetime.now().isoformat())
             params.append(org_id)
             
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 cursor = conn.cursor()
                 cursor.execute(f"""
                     UPDATE organizations 
@@ -414,7 +429,7 @@ class OrganizationManager:
     def get_organization_vpn_assignment(self, org_id):
         """Get VPN assignment details for an organization"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute("""
@@ -435,7 +450,7 @@ class OrganizationManager:
     def get_organizations_by_vpn_server(self, vpn_server_name):
         """Get all organizations assigned to a specific VPN server"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute("""
@@ -454,7 +469,7 @@ class OrganizationManager:
     def get_organization_subnets_for_vpn(self, org_id):
         """Get organization subnets that should be routed via VPN"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('organization') as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute("""
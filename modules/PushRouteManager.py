@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+PushRouteManager - Module for managing routes to organization subnets through VPN peers
+Push routes are kept as a table keyed by (subnet, next hop) and applied with `ip -batch`
+"""
+
+import ipaddress
+import os
+import sqlite3
+import subprocess
+from typing import Dict, List, Optional
+
+
+class PushRouteManager:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.init_database()
+
+    def init_database(self):
+        """Create the push route table"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS rbac_push_routes (
+                        configuration TEXT NOT NULL,
+                        subnet TEXT NOT NULL,
+                        next_hop TEXT NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (configuration, subnet, next_hop)
+                    )
+                """)
+                conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_rbac_push_routes_next_hop
+                    ON rbac_push_routes (configuration, next_hop)
+                """)
+        except Exception as e:
+            print(f"[PushRoutes] Database initialization error: {e}")
+
+    @staticmethod
+    def _collapse(subnets: List[str]) -> List[str]:
+        """Merge adjacent and overlapping subnets, per address family"""
+        networks = [ipaddress.ip_network(subnet, strict=False) for subnet in subnets]
+        collapsed = []
+        for version in (4, 6):
+            collapsed += [str(network) for network in
+                          ipaddress.collapse_addresses(n for n in networks if n.version == version)]
+        return collapsed
+
+    @staticmethod
+    def _exclude(subnets: List[str], removed: List[str]) -> List[str]:
+        """Subnets without the address space of the removed ones"""
+        networks = [ipaddress.ip_network(subnet, strict=False) for subnet in subnets]
+        for subnet in removed:
+            cut = ipaddress.ip_network(subnet, strict=False)
+            remaining = []
+            for network in networks:
+                if network.version != cut.version or not network.overlaps(cut):
+                    remaining.append(network)
+                elif cut.subnet_of(network) and cut != network:
+                    remaining.extend(network.address_exclude(cut))
+            networks = remaining
+        return [str(network) for network in networks]
+
+    @staticmethod
+    def _hop_routes(conn, configuration: str, next_hop: str) -> List[str]:
+        return [row[0] for row in conn.execute(
+            "SELECT subnet FROM rbac_push_routes WHERE configuration = ? AND next_hop = ? ORDER BY rowid",
+            (configuration, next_hop))]
+
+    def _set_hop_routes(self, conn, configuration: str, next_hop: str, subnets: List[str]) -> List[str]:
+        """Store a peer's subnets collapsed; rows that stay keep their place in the ownership order"""
+        current = self._hop_routes(conn, configuration, next_hop)
+        collapsed = self._collapse(subnets)
+        conn.executemany("DELETE FROM rbac_push_routes WHERE configuration = ? AND subnet = ? AND next_hop = ?",
+                         [(configuration, subnet, next_hop) for subnet in current if subnet not in collapsed])
+        conn.executemany("INSERT INTO rbac_push_routes (configuration, subnet, next_hop) VALUES (?, ?, ?)",
+                         [(configuration, subnet, next_hop) for subnet in collapsed if subnet not in current])
+        return collapsed
+
+    @staticmethod
+    def _owner(conn, configuration: str, subnet: str, exclude: str = None) -> Optional[str]:
+        """Next hop that serves a subnet: the first one it was pushed through, apart from `exclude`"""
+        row = conn.execute("""
+            SELECT next_hop FROM rbac_push_routes
+            WHERE configuration = ? AND subnet = ? AND next_hop != ?
+            ORDER BY rowid LIMIT 1
+        """, (configuration, subnet, exclude or '')).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _is_up(interface: str) -> bool:
+        return os.path.exists(f'/sys/class/net/{interface}')
+
+    @staticmethod
+    def _batch(commands: List[str]) -> Dict:
+        """Run route commands through one `ip -batch`; -force keeps going past a failing line"""
+        if not commands:
+            return {'status': True, 'message': 'No route changes', 'commands': []}
+        result = subprocess.run(['ip', '-force', '-batch', '-'], input='\n'.join(commands) + '\n',
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return {'status': False, 'message': result.stderr.strip(), 'commands': commands}
+        return {'status': True, 'message': f'Applied {len(commands)} route changes', 'commands': commands}
+
+    def get_routes(self, configuration: str) -> Dict:
+        """Collapsed push routes of a configuration; a subnet pushed through several peers is served by the first"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                hops = [row[0] for row in conn.execute("""
+                    SELECT next_hop FROM rbac_push_routes WHERE configuration = ?
+                    GROUP BY next_hop ORDER BY MIN(rowid)
+                """, (configuration,))]
+                routes, served = [], set()
+                for next_hop in hops:
+                    for subnet in self._hop_routes(conn, configuration, next_hop):
+                        routes.append({'subnet': subnet, 'next_hop': next_hop, 'active': subnet not in served})
+                        served.add(subnet)
+            return {'status': True, 'data': routes, 'message': f'Retrieved {len(routes)} push routes'}
+        except Exception as e:
+            return {'status': False, 'data': [], 'message': f'Error fetching push routes: {str(e)}'}
+
+    def apply_configuration(self, configuration: str) -> Dict:
+        """Install every active push route of a configuration, used when its interface comes up"""
+        routes = self.get_routes(configuration)
+        if not routes['status']:
+            return routes
+        if not self._is_up(configuration):
+            return {'status': False, 'message': f'Interface {configuration} is down'}
+        result = self._batch([f"route replace {route['subnet']} via {route['next_hop']} dev {configuration}"
+                              for route in routes['data'] if route['active']])
+        if not result['status']:
+            print(f"[PushRoutes] Error applying push routes of {configuration}: {result['message']}")
+        return result
+
+    def add_routes(self, configuration: str, subnets: List[str], next_hop: str) -> Dict:
+        """Push subnets through one peer; only that peer's routes are touched"""
+        return self.add_hop_routes(configuration, {next_hop: subnets})
+
+    def add_hop_routes(self, configuration: str, hops: Dict[str, List[str]]) -> Dict:
+        """Push subnets through several peers at once, with one `ip -batch` for all of them"""
+        try:
+            for next_hop in hops:
+                ipaddress.ip_address(next_hop)
+            hops = {next_hop: [str(ipaddress.ip_network(subnet, strict=False)) for subnet in subnets]
+                    for next_hop, subnets in hops.items()}
+            commands = []
+            with sqlite3.connect(self.db_path) as conn:
+                for next_hop, subnets in hops.items():
+                    current = self._hop_routes(conn, configuration, next_hop)
+                    routes = self._set_hop_routes(conn, configuration, next_hop, current + subnets)
+                    # Subnets merged into a wider one keep their old route until it is replaced, like with any overlap
+                    commands += [f'route replace {subnet} via {next_hop} dev {configuration}'
+                                 for subnet in routes if subnet not in current
+                                 and self._owner(conn, configuration, subnet) == next_hop]
+            if not self._is_up(configuration):
+                return {'status': True, 'message': 'Push routes saved, applied when the interface comes up', 'commands': []}
+            return self._batch(commands)
+        except Exception as e:
+            return {'status': False, 'message': f'Error adding push routes: {str(e)}'}
+
+    def remove_routes(self, configuration: str, next_hop: str, subnets: List[str] = None) -> Dict:
+        """Stop pushing subnets (all of them by default) through one peer, handing them to the next peer that has them"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                before = [subnet for subnet in self._hop_routes(conn, configuration, next_hop)
+                          if self._owner(conn, configuration, subnet) in (None, next_hop)]
+                remaining = [] if subnets is None else \
+                    self._exclude(self._hop_routes(conn, configuration, next_hop), subnets)
+                after = self._set_hop_routes(conn, configuration, next_hop, remaining)
+                commands = []
+                for subnet in before:
+                    if subnet in after:
+                        continue
+                    owner = self._owner(conn, configuration, subnet, next_hop)
+                    if owner is None:
+                        commands.append(f'route del {subnet} via {next_hop} dev {configuration}')
+                    else:
+                        commands.append(f'route replace {subnet} via {owner} dev {configuration}')
+                commands += [f'route replace {subnet} via {next_hop} dev {configuration}'
+                             for subnet in after if subnet not in before
+                             and self._owner(conn, configuration, subnet) == next_hop]
+            if not self._is_up(configuration):
+                return {'status': True, 'message': 'Push routes removed', 'commands': []}
+            return self._batch(commands)
+        except Exception as e:
+            return {'status': False, 'message': f'Error removing push routes: {str(e)}'}
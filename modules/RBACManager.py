@@ -6,13 +6,21 @@ Handles Role-Based Access Control for VPN users and firewall policies
 import sqlite3
 import json
 import subprocess
+import ipaddress
 import os
+import time
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+from .FirewallBackend import FirewallBackend, FirewallBackendError, get_firewall_backend
+from .DatabaseConnections import DatabaseConnections, get_database_connections
 
 class RBACManager:
-    def __init__(self, db_path: str = 'rbac.db'):
+    def __init__(self, db_path: str = 'rbac.db', backend: FirewallBackend = None,
+                 connections: DatabaseConnections = None):
         self.db_path = db_path
+        self.connections = connections or get_database_connections()
+        self.connections.register('rbac', self.db_path)
+        self.backend = backend
         self.init_database()
     
     def init_database(self):
@@ -37,7 +45,7 @@ class RBACManager:
     
     def get_connection(self):
         """Get database connection"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connections.connect('rbac')
         conn.row_factory = sqlite3.Row
         return conn
     
@@ -177,8 +185,8 @@ class RBACManager:
             conn.commit()
             conn.close()
             
-            # Regenerate firewall rules after assignment
-            self.regenerate_group_rules(group_id)
+            # Add the peer to the group's set, the rule chain stays as it is
+            self.update_group_set(group_id, peer_ip, add=True)
             
             return {'status': True, 'message': f'Peer "{peer_name}" assigned to group successfully'}
             
@@ -193,6 +201,12 @@ class RBACManager:
             conn = self.get_connection()
             cursor = conn.cursor()
             
+            cursor.execute("""
+                SELECT peer_ip FROM rbac_group_peers 
+                WHERE group_id = ? AND peer_name = ?
+            """, (group_id, peer_name))
+            peer = cursor.fetchone()
+            
             cursor.execute("""
                 DELETE FROM rbac_group_peers 
                 WHERE group_id = ? AND peer_name = ?
@@ -202,8 +216,11 @@ class RBACManager:
                 conn.commit()
                 conn.close()
                 
-                # Regenerate firewall rules after removal
-                self.regenerate_group_rules(group_id)
+                # Take the peer's address out of the group's set unless another peer in the group still uses it
+                remaining = set(self.get_group_peer_networks(group_id))
+                removed = [ip for ip in self.get_peer_networks([peer['peer_ip']]) if ip not in remaining]
+                for ip in removed:
+                    self.update_group_set(group_id, ip, add=False)
                 
                 return {'status': True, 'message': f'Peer "{peer_name}" removed from group successfully'}
             else:
@@ -382,150 +399,100 @@ class RBACManager:
             print(f"[RBAC] Error getting group peer IPs: {e}")
             return []
     
-    def generate_filter_rules(self, group_id: int) -> List[str]:
-        """Generate iptables filter rules for a group"""
+    def get_peer_networks(self, peer_ips: List[str]) -> List[str]:
+        """IPv4 networks of the given peer addresses (a peer address may list several, comma separated)"""
+        networks = []
+        for peer_ip in peer_ips:
+            for address in (peer_ip or '').split(','):
+                try:
+                    network = ipaddress.ip_network(address.strip(), strict=False)
+                except ValueError:
+                    continue
+                if network.version == 4 and str(network) not in networks:
+                    networks.append(str(network))
+        return networks
+    
+    def get_group_peer_networks(self, group_id: int) -> List[str]:
+        return self.get_peer_networks(self.get_group_peer_ips(group_id))
+    
+    def get_backend(self) -> FirewallBackend:
+        if self.backend is None:
+            self.backend = get_firewall_backend()
+        return self.backend
+    
+    def set_backend(self, backend: FirewallBackend):
+        self.backend = backend
+    
+    def get_group_spec(self, group_id: int) -> Dict[str, Any]:
+        """Everything the firewall backend needs to build a group's set and chains"""
+        return {
+            'id': group_id,
+            'networks': self.get_group_peer_networks(group_id),
+            'filter_policies': self.get_group_filter_policies(group_id),
+            'nat_policies': self.get_group_nat_policies(group_id)
+        }
+    
+    def update_group_set(self, group_id: int, peer_ip: str, add: bool = True) -> bool:
+        """Add or remove one peer's networks in the group's set; rebuilds the group when its set is missing"""
+        networks = self.get_peer_networks([peer_ip])
+        if not networks:
+            return True
         try:
-            peer_ips = self.get_group_peer_ips(group_id)
-            if not peer_ips:
-                return []
-            
-            policies = self.get_group_filter_policies(group_id)
-            rules = []
-            
-            for policy in policies:
-                for peer_ip in peer_ips:
-                    rule_parts = ['iptables', '-A', 'FORWARD']
-                    
-                    # Source (peer IP)
-                    if peer_ip:
-                        rule_parts.extend(['-s', peer_ip])
-                    
-                    # Destination
-                    rule_parts.extend(['-d', policy['destination']])
-                    
-                    # Protocol
-                    if policy['protocol'] != 'any':
-                        rule_parts.extend(['-p', policy['protocol']])
-                    
-                    # Port
-                    if policy['port']:
-                        rule_parts.extend(['--dport', policy['port']])
-                    
-                    # Action
-                    rule_parts.extend(['-j', policy['action']])
-                    
-                    # Comment
-                    rule_parts.extend(['-m', 'comment', '--comment', f'RBAC-{policy["group_id"]}-{policy["id"]}'])
-                    
-                    rules.append(' '.join(rule_parts))
-            
-            return rules
-            
-        except Exception as e:
-            print(f"[RBAC] Error generating filter rules: {e}")
-            return []
+            self.get_backend().update_rbac_set(group_id, networks, add)
+            return True
+        except FirewallBackendError as e:
+            print(f"[RBAC] Set of group {group_id} is not in place ({e}), regenerating group rules")
+            return self.regenerate_group_rules(group_id)['status']
     
-    def generate_nat_rules(self, group_id: int) -> List[str]:
-        """Generate iptables NAT rules for a group"""
+    def apply_rbac_rules(self, group_ids: List[int], remove_ids: List[int] = None, prune: bool = False) -> Dict[str, Any]:
+        """Rebuild the given groups' sets and chains (and drop those of remove_ids) in a single atomic backend update"""
+        report = {'status': False, 'groups': len(group_ids), 'rules': 0}
         try:
-            peer_ips = self.get_group_peer_ips(group_id)
-            if not peer_ips:
-                return []
-            
-            policies = self.get_group_nat_policies(group_id)
-            rules = []
-            
-            for policy in policies:
-                for peer_ip in peer_ips:
-                    rule_parts = ['iptables', '-t', 'nat', '-A', 'POSTROUTING']
-                    
-                    # Source (peer IP)
-                    if peer_ip:
-                        rule_parts.extend(['-s', peer_ip])
-                    
-                    # Destination
-                    rule_parts.extend(['-d', policy['destination']])
-                    
-                    # Action
-                    rule_parts.extend(['-j', policy['action']])
-                    
-                    # Translated IP/Port for SNAT/DNAT
-                    if policy['action'] in ['SNAT', 'DNAT'] and policy['translated_ip']:
-                        if policy['translated_port']:
-                            rule_parts.extend(['--to-source', f"{policy['translated_ip']}:{policy['translated_port']}"])
-                        else:
-                            rule_parts.extend(['--to-source', policy['translated_ip']])
-                    
-                    # Comment
-                    rule_parts.extend(['-m', 'comment', '--comment', f'RBAC-{policy["group_id"]}-{policy["id"]}'])
-                    
-                    rules.append(' '.join(rule_parts))
-            
-            return rules
-            
+            started = time.perf_counter()
+            groups = [self.get_group_spec(group_id) for group_id in group_ids]
+            loaded = time.perf_counter()
+            report.update(self.get_backend().apply_rbac(groups, remove_ids or [], prune))
+            report.update({
+                'status': True,
+                'backend': self.get_backend().name,
+                'load_ms': round((loaded - started) * 1000, 2),
+                'total_ms': round((time.perf_counter() - started) * 1000, 2)
+            })
+            report['message'] = f"Applied {report['rules']} rules and {report['members']} set members for {report['groups']} groups in {report['total_ms']} ms"
+            print(f"[RBAC] {report['message']} (render {report['render_ms']} ms, apply {report['apply_ms']} ms)")
         except Exception as e:
-            print(f"[RBAC] Error generating NAT rules: {e}")
-            return []
+            report['message'] = f'Error applying RBAC rules: {e}'
+            print(f"[RBAC] {report['message']}")
+        return report
     
-    def regenerate_group_rules(self, group_id: int):
+    def regenerate_group_rules(self, group_id: int) -> Dict[str, Any]:
         """Regenerate firewall rules for a specific group"""
         try:
-            # Get group name
             conn = self.get_connection()
             cursor = conn.cursor()
             cursor.execute("SELECT name FROM rbac_groups WHERE id = ?", (group_id,))
             group = cursor.fetchone()
-            if not group:
-                conn.close()
-                return
-            group_name = group['name']
             conn.close()
             
-            # Remove existing RBAC rules for this group
-            self.remove_rbac_rules_for_group(group_id)
-            
-            # Generate new rules
-            filter_rules = self.generate_filter_rules(group_id)
-            nat_rules = self.generate_nat_rules(group_id)
-            
-            # Apply new rules
-            for rule in filter_rules + nat_rules:
-                try:
-                    subprocess.run(rule.split(), check=True)
-                    print(f"[RBAC] Applied rule: {rule}")
-                except subprocess.CalledProcessError as e:
-                    print(f"[RBAC] Error applying rule '{rule}': {e}")
-            
-            print(f"[RBAC] Regenerated rules for group '{group_name}'")
+            if not group:
+                return self.apply_rbac_rules([], [group_id])
+            return self.apply_rbac_rules([group_id])
             
         except Exception as e:
             print(f"[RBAC] Error regenerating group rules: {e}")
+            return {'status': False, 'message': f'Error regenerating group rules: {e}'}
     
-    def regenerate_all_rules(self):
-        """Regenerate all RBAC firewall rules"""
+    def regenerate_all_rules(self) -> Dict[str, Any]:
+        """Regenerate all RBAC firewall rules, sets and chains of groups that no longer exist are removed"""
         try:
-            groups = self.get_all_groups()
-            for group in groups:
-                self.regenerate_group_rules(group['id'])
-            print("[RBAC] Regenerated all RBAC rules")
+            return self.apply_rbac_rules([group['id'] for group in self.get_all_groups()], prune=True)
         except Exception as e:
             print(f"[RBAC] Error regenerating all rules: {e}")
+            return {'status': False, 'message': f'Error regenerating all rules: {e}'}
     
-    def remove_rbac_rules_for_group(self, group_id: int):
-        """Remove all RBAC rules for a specific group"""
-        try:
-            # Remove filter rules
-            subprocess.run(['iptables', '-D', 'FORWARD', '-m', 'comment', '--comment', f'RBAC-{group_id}-*'], 
-                         capture_output=True)
-            
-            # Remove NAT rules
-            subprocess.run(['iptables', '-t', 'nat', '-D', 'POSTROUTING', '-m', 'comment', '--comment', f'RBAC-{group_id}-*'], 
-                         capture_output=True)
-            
-            print(f"[RBAC] Removed existing rules for group {group_id}")
-            
-        except Exception as e:
-            print(f"[RBAC] Error removing rules for group {group_id}: {e}")
+    def remove_rbac_rules_for_group(self, group_id: int) -> Dict[str, Any]:
+        """Remove the set, chains and jumps of a specific group"""
+        return self.apply_rbac_rules([], [group_id])
     
     def get_available_peers(self) -> List[Dict[str, Any]]:
         """Get list of available WireGuard peers for assignment"""
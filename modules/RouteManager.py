@@ -5,17 +5,25 @@ Integrated with WGDashboard for comprehensive network management
 """
 
 import subprocess
+import hashlib
+import ipaddress
 import json
 import os
 import re
+import threading
+import time
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
 class RouteManager:
-    def __init__(self):
+    def __init__(self, cache_ttl: float = 2.0):
         self.routes_file_ubuntu = "/etc/network/routes"
         self.routes_file_centos = "/etc/sysconfig/static-routes"
         self.log_file = "/var/log/wgdashboard-routes.log"
+        self.cache_ttl = cache_ttl
+        self._cache_lock = threading.Lock()
+        self._routes = None
+        self._routes_time = 0.0
         
     def log_message(self, message: str):
         """Log routing operations"""
@@ -43,161 +51,169 @@ class RouteManager:
         except:
             pass  # Fallback to file logging if centralized logging fails
     
-    def get_routes(self) -> List[Dict[str, Any]]:
+    # =============================================================================
+    # ROUTE TABLE AND CACHE
+    # =============================================================================
+
+    def _ip(self, args: List[str], payload: str = None) -> str:
+        result = subprocess.run(['ip'] + args, input=payload, capture_output=True, text=True, check=True)
+        return result.stdout
+
+    def invalidate_cache(self):
+        """Drop the cached routes, the next read asks the kernel again"""
+        with self._cache_lock:
+            self._routes = None
+
+    @staticmethod
+    def route_id(route: Dict[str, Any]) -> str:
+        """Stable id of a route: the kernel keys a route by table, destination, tos and metric"""
+        key = f"{route.get('table', 'main')}|{route.get('dst', 'default')}|{route.get('tos', 0)}|{route.get('metric', 0)}"
+        return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+    def _describe(self, index: int, route: Dict[str, Any]) -> Dict[str, Any]:
+        """Display fields of one `ip -json route` entry"""
+        nexthops = route.get('nexthops', [route])
+        gateway = ', '.join(hop['gateway'] for hop in nexthops if hop.get('gateway'))
+        interface = ', '.join(hop['dev'] for hop in nexthops if hop.get('dev'))
+        raw = [route.get('dst', 'default')]
+        if route.get('type', 'unicast') != 'unicast':
+            raw.insert(0, route['type'])
+        for key, label in (('gateway', 'via'), ('dev', 'dev'), ('protocol', 'proto'), ('scope', 'scope'),
+                           ('prefsrc', 'src'), ('metric', 'metric'), ('table', 'table')):
+            if route.get(key) not in (None, ''):
+                raw.extend([label, str(route[key])])
+        for hop in route.get('nexthops', []):
+            raw.extend(['nexthop', 'via', hop.get('gateway', ''), 'dev', hop.get('dev', ''), 'weight', str(hop.get('weight', 1))])
+        raw.extend(route.get('flags', []))
+        route_data = {
+            'id': self.route_id(route),
+            'index': index,
+            'raw': ' '.join(raw),
+            'route': ' '.join(raw),
+            'destination': route.get('dst', 'default'),
+            'protocol': route.get('protocol'),
+            'scope': route.get('scope'),
+            'table': route.get('table', 'main'),
+            'spec': route
+        }
+        if gateway:
+            route_data['gateway'] = gateway
+        if interface:
+            route_data['interface'] = interface
+        if 'metric' in route:
+            route_data['metric'] = str(route['metric'])
+        if 'prefsrc' in route:
+            route_data['source'] = route['prefsrc']
+        return route_data
+
+    def _list_routes(self, force: bool = False) -> List[Dict[str, Any]]:
+        """Routes of the main table from `ip -json route show`, cached for cache_ttl seconds"""
+        with self._cache_lock:
+            if not force and self._routes is not None and time.monotonic() - self._routes_time < self.cache_ttl:
+                return self._routes
+            routes = [self._describe(index, route)
+                      for index, route in enumerate(json.loads(self._ip(['-json', 'route', 'show']) or '[]'), 1)]
+            self._routes = routes
+            self._routes_time = time.monotonic()
+            return routes
+
+    def get_routes(self, force: bool = False) -> List[Dict[str, Any]]:
         """Get current routing table"""
         try:
-            # Get routing table
-            result = subprocess.run(['ip', 'route', 'show'], capture_output=True, text=True, check=True)
-            routes = []
-            
-            for line_num, line in enumerate(result.stdout.strip().split('\n'), 1):
-                if line.strip():
-                    route_data = {
-                        'id': line_num,
-                        'raw': line.strip(),
-                        'route': line.strip()
-                    }
-                    
-                    # Parse route components
-                    parts = line.strip().split()
-                    
-                    # Parse destination
-                    if parts:
-                        route_data['destination'] = parts[0]
-                    
-                    # Parse gateway
-                    if 'via' in parts:
-                        via_index = parts.index('via')
-                        if via_index + 1 < len(parts):
-                            route_data['gateway'] = parts[via_index + 1]
-                    
-                    # Parse interface
-                    if 'dev' in parts:
-                        dev_index = parts.index('dev')
-                        if dev_index + 1 < len(parts):
-                            route_data['interface'] = parts[dev_index + 1]
-                    
-                    # Parse metric
-                    if 'metric' in parts:
-                        metric_index = parts.index('metric')
-                        if metric_index + 1 < len(parts):
-                            route_data['metric'] = parts[metric_index + 1]
-                    
-                    # Parse source
-                    if 'src' in parts:
-                        src_index = parts.index('src')
-                        if src_index + 1 < len(parts):
-                            route_data['source'] = parts[src_index + 1]
-                    
-                    routes.append(route_data)
-            
+            routes = self._list_routes(force)
             self.log_message(f"Retrieved {len(routes)} routes")
             return routes
-            
+
         except subprocess.CalledProcessError as e:
-            self.log_message(f"Error getting routes: {e}")
+            self.log_message(f"Error getting routes: {e.stderr}")
             return []
         except Exception as e:
             self.log_message(f"Unexpected error getting routes: {e}")
             return []
-    
-    def add_route(self, route_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Add a new route"""
+
+    # =============================================================================
+    # ROUTE CHANGES
+    # =============================================================================
+
+    @staticmethod
+    def _add_args(route_data: Dict[str, Any]) -> List[str]:
+        """`ip route add` arguments of one route from the dashboard's route fields"""
+        destination = str(route_data.get('destination') or '').strip()
+        if not destination:
+            raise ValueError('Destination is required')
+        if destination != 'default':
+            ipaddress.ip_network(destination, strict=False)
+        args = [destination]
+        for key, label in (('gateway', 'via'), ('interface', 'dev'), ('metric', 'metric'), ('source', 'src')):
+            if route_data.get(key):
+                value = str(route_data[key]).strip()
+                if re.search(r'\s', value):
+                    raise ValueError(f'Invalid {key}: {value}')
+                args.extend([label, value])
+        return args
+
+    @staticmethod
+    def _delete_args(route: Dict[str, Any]) -> List[str]:
+        """`ip route del` arguments matching exactly one listed route"""
+        spec = route['spec']
+        args = [spec.get('dst', 'default')]
+        for key, label in (('tos', 'tos'), ('metric', 'metric'), ('table', 'table'), ('dev', 'dev'), ('gateway', 'via')):
+            if spec.get(key) not in (None, ''):
+                args.extend([label, str(spec[key])])
+        return args
+
+    def apply_routes(self, add: List[Dict[str, Any]] = None, delete: List[str] = None) -> Dict[str, Any]:
+        """Delete routes by id and add new ones with a single `ip -batch`"""
+        add, delete = add or [], delete or []
         try:
-            # Build ip route command
-            cmd = ['ip', 'route', 'add']
-            
-            # Add destination
-            if 'destination' in route_data and route_data['destination']:
-                cmd.append(route_data['destination'])
-            
-            # Add gateway
-            if 'gateway' in route_data and route_data['gateway']:
-                cmd.extend(['via', route_data['gateway']])
-            
-            # Add interface
-            if 'interface' in route_data and route_data['interface']:
-                cmd.extend(['dev', route_data['interface']])
-            
-            # Add metric
-            if 'metric' in route_data and route_data['metric']:
-                cmd.extend(['metric', route_data['metric']])
-            
-            # Add source
-            if 'source' in route_data and route_data['source']:
-                cmd.extend(['src', route_data['source']])
-            
-            # Execute command
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            # Save routes
+            commands = []
+            if delete:
+                routes = {route['id']: route for route in self._list_routes(force=True)}
+                unknown = [route_id for route_id in delete if route_id not in routes]
+                if unknown:
+                    return {'status': False, 'message': f"Invalid route ID: {', '.join(map(str, unknown))}"}
+                commands += ['route del ' + ' '.join(self._delete_args(routes[route_id])) for route_id in delete]
+            commands += ['route add ' + ' '.join(self._add_args(route_data)) for route_data in add]
+            if not commands:
+                return {'status': False, 'message': 'No routes to add or delete'}
+
+            self._ip(['-batch', '-'], '\n'.join(commands) + '\n')
             self.save_routes()
-            
-            self.log_message(f"Added route: {' '.join(cmd)}")
+
+            self.log_message(f"Applied {len(commands)} route changes: {'; '.join(commands)}")
             return {
                 'status': True,
-                'message': 'Route added successfully',
-                'route': ' '.join(cmd)
+                'message': f'{len(add)} route(s) added, {len(delete)} route(s) deleted',
+                'commands': [f'ip {command}' for command in commands]
             }
-            
+
         except subprocess.CalledProcessError as e:
-            error_msg = f"Error adding route: {e.stderr}"
+            error_msg = f"Error applying routes: {e.stderr.strip()}"
             self.log_message(error_msg)
-            return {
-                'status': False,
-                'message': error_msg
-            }
+            return {'status': False, 'message': error_msg}
+        except ValueError as e:
+            return {'status': False, 'message': f"Invalid route: {e}"}
         except Exception as e:
-            error_msg = f"Unexpected error adding route: {e}"
+            error_msg = f"Unexpected error applying routes: {e}"
             self.log_message(error_msg)
-            return {
-                'status': False,
-                'message': error_msg
-            }
-    
-    def delete_route(self, route_id: int) -> Dict[str, Any]:
+            return {'status': False, 'message': error_msg}
+        finally:
+            self.invalidate_cache()
+
+    def add_route(self, route_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Add a new route"""
+        result = self.apply_routes(add=[route_data])
+        if result['status']:
+            result.update(message='Route added successfully', route=result['commands'][0])
+        return result
+
+    def delete_route(self, route_id: str) -> Dict[str, Any]:
         """Delete a route by ID"""
-        try:
-            routes = self.get_routes()
-            if route_id < 1 or route_id > len(routes):
-                return {
-                    'status': False,
-                    'message': 'Invalid route ID'
-                }
-            
-            route = routes[route_id - 1]
-            route_parts = route['raw'].split()
-            
-            # Build delete command
-            delete_cmd = ['ip', 'route', 'del'] + route_parts
-            
-            # Execute delete command
-            result = subprocess.run(delete_cmd, capture_output=True, text=True, check=True)
-            
-            # Save routes
-            self.save_routes()
-            
-            self.log_message(f"Deleted route: {' '.join(delete_cmd)}")
-            return {
-                'status': True,
-                'message': 'Route deleted successfully'
-            }
-            
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Error deleting route: {e.stderr}"
-            self.log_message(error_msg)
-            return {
-                'status': False,
-                'message': error_msg
-            }
-        except Exception as e:
-            error_msg = f"Unexpected error deleting route: {e}"
-            self.log_message(error_msg)
-            return {
-                'status': False,
-                'message': error_msg
-            }
-    
+        result = self.apply_routes(delete=[route_id])
+        if result['status']:
+            result['message'] = 'Route deleted successfully'
+        return result
+
     def save_routes(self) -> bool:
         """Save current routes to file"""
         try:
@@ -12,16 +12,20 @@ import json
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 import logging
+from .DatabaseConnections import DatabaseConnections, get_database_connections
 
 class UserManager:
-    def __init__(self, db_path: str = "db/users.db"):
+    def __init__(self, db_path: str = "db/users.db", connections: DatabaseConnections = None):
         """
         Initialize UserManager with database connection
         
         Args:
             db_path: Path to SQLite database file
+            connections: Shared connections, with the RBAC and organization databases attached
         """
         self.db_path = db_path
+        self.connections = connections or get_database_connections()
+        self.connections.register('users', self.db_path)
         self.logger = logging.getLogger(__name__)
         self._init_database()
     
@@ -91,7 +95,7 @@ class UserManager:
     def _create_default_admin(self):
         """Create default admin user if no users exist"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT COUNT(*) FROM users")
                 count = cursor.fetchone()[0]
@@ -154,7 +158,7 @@ class UserManager:
             Dict with authentication result
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 
                 # Get user data
@@ -236,7 +240,7 @@ class UserManager:
             Dict with validation result
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -288,7 +292,7 @@ class UserManager:
             bool: Success status
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     UPDATE user_sessions SET is_active = 0 WHERE session_token = ?
@@ -314,7 +318,7 @@ class UserManager:
             Dict with creation result
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 
                 # Check if username already exists
@@ -363,7 +367,7 @@ class UserManager:
             List of user dictionaries
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT id, username, email, full_name, role, is_active, created_at, last_login
@@ -401,7 +405,7 @@ class UserManager:
             Dict with update result
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 
                 # Build update query
@@ -450,7 +454,7 @@ class UserManager:
             Dict with deletion result
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 
                 # Check if user exists
@@ -493,7 +497,7 @@ class UserManager:
             List of permission strings
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT permission FROM user_permissions WHERE user_id = ?
@@ -517,7 +521,7 @@ class UserManager:
             bool: Success status
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT OR IGNORE INTO user_permissions (user_id, permission)
@@ -541,7 +545,7 @@ class UserManager:
             bool: Success status
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     DELETE FROM user_permissions WHERE user_id = ? AND permission = ?
@@ -560,7 +564,7 @@ class UserManager:
             Dict with user statistics
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.connect('users') as conn:
                 cursor = conn.cursor()
                 
                 # Total users
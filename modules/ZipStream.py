@@ -0,0 +1,47 @@
+"""
+Zip Stream
+"""
+import time
+from typing import Iterable, Iterator
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+
+
+class ZipStreamBuffer:
+    """
+    Write-only, non-seekable sink for ZipFile; whatever was written since the last drain is handed out
+    """
+    def __init__(self):
+        self.__chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self.__chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.__chunks)
+        self.__chunks.clear()
+        return data
+
+
+def zipStream(entries: Iterable[tuple[str, Iterable[bytes | str] | bytes | str]], mode: int = 0o600) -> Iterator[bytes]:
+    """
+    Build a ZIP archive on the fly. Each entry is (name, content) where content is bytes / str or an
+    iterable of them; only the data of the chunk being compressed is held in memory at any time
+    """
+    buffer = ZipStreamBuffer()
+    with ZipFile(buffer, 'w', ZIP_DEFLATED) as archive:
+        for name, content in entries:
+            info = ZipInfo(name, time.localtime()[:6])
+            info.compress_type = ZIP_DEFLATED
+            info.external_attr = mode << 16
+            with archive.open(info, 'w') as f:
+                for data in ([content] if isinstance(content, (bytes, str)) else content):
+                    f.write(data.encode() if isinstance(data, str) else data)
+                    if chunk := buffer.drain():
+                        yield chunk
+            if chunk := buffer.drain():
+                yield chunk
+    yield buffer.drain()
@@ -0,0 +1,45 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from modules.DatabaseConnections import DatabaseConnections
+
+
+@pytest.fixture
+def databases(tmp_path):
+    """Copies of the shipped users, RBAC and organization databases with connections between them"""
+    paths = {}
+    for name in ('users', 'rbac', 'organization'):
+        paths[name] = str(tmp_path / f'{name}.db')
+        shutil.copy(os.path.join(ROOT, 'db', f'{name}.db'), paths[name])
+    connections = DatabaseConnections(paths)
+    yield paths, connections
+    connections.close()
+
+
+FAKE_WG = """#!/bin/sh
+# Stand-in for wg pubkey: one base64 32 byte "public key" per private key read from stdin
+[ "$1" = pubkey ] || exit 1
+read -r key
+[ -n "$key" ] || exit 1
+printf '%s' "$key" | sha256sum | cut -c1-64 | xxd -r -p | base64
+"""
+
+
+@pytest.fixture
+def fake_wg(tmp_path, monkeypatch):
+    """A `wg` on PATH that only knows `pubkey`"""
+    if shutil.which('xxd') is None or shutil.which('sha256sum') is None:
+        pytest.skip('needs xxd and sha256sum')
+    directory = tmp_path / 'bin'
+    directory.mkdir()
+    wg = directory / 'wg'
+    wg.write_text(FAKE_WG)
+    wg.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{directory}{os.pathsep}{os.environ['PATH']}")
+    return wg
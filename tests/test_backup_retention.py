@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from modules.BackupCatalog import BackupCatalog
+from modules.BackupScheduler import BackupScheduler
+from modules.BackupStore import BackupStore
+from modules.DashboardDatabase import DashboardDatabase
+
+
+class Configuration:
+    """The parts of WireguardConfiguration the scheduler uses, backed by a real store and catalog"""
+    Name = "wg0"
+    Protocol = "wg"
+
+    def __init__(self, directory, store, catalog):
+        self.directory = directory
+        self.store = store
+        self.catalog = catalog
+        self.checksum = "0"
+        self.day = 0
+
+    def getContentChecksum(self):
+        return self.checksum
+
+    def backupConfigurationFile(self, scheduled: bool = False):
+        self.day += 1
+        filename = f'{self.Name}_202601{self.day:02d}120000'
+        with self.store.create(self.directory, filename) as backup:
+            with backup.open(".conf") as f:
+                f.write(f"[Interface]\n# {self.day}\n")
+        backup = self.catalog.record(self.Protocol, self.directory, f'{filename}.conf', scheduled)
+        backup['written'] = self.store.written(os.path.join(self.directory, f'{filename}.conf'))
+        return True, backup
+
+    def getBackups(self):
+        self.catalog.sync(self.Protocol, self.directory)
+        return self.catalog.list(self.Protocol, self.Name)
+
+    def deleteBackup(self, filename):
+        self.store.delete(os.path.join(self.directory, filename))
+        self.catalog.remove(self.Protocol, filename)
+        return True
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    database = DashboardDatabase(str(tmp_path / "wgdashboard.db"))
+    store = BackupStore()
+    directory = str(tmp_path / "backups")
+    os.mkdir(directory)
+    configuration = Configuration(directory, store, BackupCatalog(database, store))
+    yield BackupScheduler(database, lambda name: configuration), configuration
+    database.closeAll()
+
+
+def run(scheduler, configuration, keep_count):
+    configuration.checksum = str(int(configuration.checksum) + 1)
+    return scheduler.runSchedule({
+        "configuration": configuration.Name, "keep_count": keep_count, "keep_days": None,
+        "last_backup": None, "last_checksum": None, "cron": None, "interval": 3600
+    })
+
+
+def test_retention_keeps_manual_backups(scheduler):
+    scheduler, configuration = scheduler
+    manual = configuration.backupConfigurationFile()[1]['filename']
+    for _ in range(3):
+        assert run(scheduler, configuration, 2)['last_status'] == "Success"
+    backups = configuration.getBackups()
+    assert manual in [b['filename'] for b in backups]
+    assert [b['scheduled'] for b in backups].count(True) == 2
+
+
+def test_retention_keeps_newest_scheduled_backup(scheduler):
+    scheduler, configuration = scheduler
+    run(scheduler, configuration, 1)
+    result = run(scheduler, configuration, 1)
+    configuration.backupConfigurationFile()
+    assert result['pruned'] == 1
+    scheduled = [b['filename'] for b in configuration.getBackups() if b['scheduled']]
+    assert scheduled == [result['last_backup']]
+
+
+def test_listing_does_not_migrate_and_migrate_only_touches_backups(tmp_path):
+    database = DashboardDatabase(str(tmp_path / "wgdashboard.db"))
+    store = BackupStore()
+    catalog = BackupCatalog(database, store)
+    directory = tmp_path / "backups"
+    directory.mkdir()
+    (directory / "wg0_20260101120000.conf").write_text("[Interface]\n")
+    (directory / "wg0_20260101120000.sql").write_text("")
+    (directory / "notes.conf").write_text("not a backup\n")
+
+    catalog.sync("wg", str(directory))
+    assert [b['filename'] for b in catalog.list("wg")] == ["wg0_20260101120000.conf"]
+    assert (directory / "wg0_20260101120000.conf").is_file()
+
+    assert catalog.migrate("wg", str(directory)) == 1
+    assert not (directory / "wg0_20260101120000.conf").exists()
+    assert (directory / "notes.conf").is_file()
+    catalog.sync("wg", str(directory))
+    assert list(store.readLines(str(directory / "wg0_20260101120000.conf"))) == ["[Interface]\n"]
+    assert [b['filename'] for b in catalog.list("wg")] == ["wg0_20260101120000.conf"]
+    database.closeAll()
@@ -0,0 +1,43 @@
+import sqlite3
+import threading
+
+from modules.DashboardDatabase import DashboardDatabase, DatabaseWriter
+
+
+class ShortTimeoutDatabase(DashboardDatabase):
+    Pragmas = dict(DashboardDatabase.Pragmas, busy_timeout=10)
+
+
+def test_batch_is_retried_while_another_connection_holds_the_write_lock(tmp_path):
+    database = ShortTimeoutDatabase(str(tmp_path / "wgdashboard.db"))
+    database.update("CREATE TABLE telemetry (id INTEGER PRIMARY KEY, value INTEGER)")
+    writer = DatabaseWriter(database, retryDelay=0.02)
+
+    holder = sqlite3.connect(database.path, isolation_level=None, check_same_thread=False)
+    holder.execute("BEGIN IMMEDIATE")
+    future = writer.submit("INSERT INTO telemetry (value) VALUES (?)", (1, ))
+    release = threading.Timer(0.1, lambda: holder.execute("COMMIT"))
+    release.start()
+
+    assert future.result(timeout=5) == 1
+    release.join()
+    holder.close()
+    assert writer.toJson()['RetriedBatches'] >= 1
+    assert writer.toJson()['FailedStatements'] == 0
+    assert database.select("SELECT COUNT(*) FROM telemetry").fetchone()[0] == 1
+    database.closeAll()
+
+
+def test_batch_fails_once_retries_are_exhausted(tmp_path):
+    database = ShortTimeoutDatabase(str(tmp_path / "wgdashboard.db"))
+    database.update("CREATE TABLE telemetry (id INTEGER PRIMARY KEY, value INTEGER)")
+    writer = DatabaseWriter(database, retries=2, retryDelay=0.01)
+
+    holder = sqlite3.connect(database.path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    future = writer.submit("INSERT INTO telemetry (value) VALUES (?)", (1, ))
+    assert isinstance(future.exception(timeout=5), sqlite3.OperationalError)
+    holder.execute("ROLLBACK")
+    holder.close()
+    assert writer.toJson()['RetriedBatches'] == 2
+    database.closeAll()
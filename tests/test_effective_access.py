@@ -0,0 +1,67 @@
+import sqlite3
+
+import pytest
+
+from modules.EnhancedRBACManager import EnhancedRBACManager
+from modules.OrganizationManager import OrganizationManager
+
+
+@pytest.fixture
+def managers(databases):
+    paths, connections = databases
+    organizations = OrganizationManager(db_path=paths['organization'], connections=connections)
+    rbac = EnhancedRBACManager(db_path=paths['rbac'], connections=connections)
+    org_id = organizations.create_organization('Branch')['id']
+    organizations.add_subnet_to_organization(org_id, '10.20.0.0/24')
+    group_id = rbac.create_group('Branch users')['data']['id']
+    rbac.attach_group_to_organization(group_id, org_id)
+    with sqlite3.connect(paths['rbac']) as conn:
+        conn.execute("INSERT INTO rbac_group_peers (group_id, peer_name) VALUES (?, 'peer-a')", (group_id,))
+    rbac.refresh_effective_access(group_ids=[group_id])
+    return paths, organizations, rbac, org_id, group_id
+
+
+def materialized_subnets(paths, peer_name):
+    with sqlite3.connect(paths['rbac']) as conn:
+        return sorted(row[0] for row in conn.execute(
+            "SELECT subnet_cidr FROM rbac_effective_access WHERE peer_name = ?", (peer_name,)))
+
+
+def test_subnets_come_from_organization_database(managers):
+    paths, organizations, rbac, org_id, group_id = managers
+    subnets = rbac.calculate_effective_access('peer-a')['data']['subnets']
+    assert [s['subnet_cidr'] for s in subnets] == ['10.20.0.0/24']
+    assert materialized_subnets(paths, 'peer-a') == ['10.20.0.0/24']
+
+
+def test_adding_a_subnet_updates_materialized_access(managers):
+    paths, organizations, rbac, org_id, group_id = managers
+    organizations.add_subnet_to_organization(org_id, '10.30.0.0/24')
+    result = rbac.refresh_effective_access(organization_ids=[org_id])
+    assert result['data']['peers'] == ['peer-a']
+    assert materialized_subnets(paths, 'peer-a') == ['10.20.0.0/24', '10.30.0.0/24']
+    subnets = rbac.calculate_effective_access('peer-a')['data']['subnets']
+    assert sorted(s['subnet_cidr'] for s in subnets) == ['10.20.0.0/24', '10.30.0.0/24']
+
+
+def test_deleting_a_subnet_updates_materialized_access(managers):
+    paths, organizations, rbac, org_id, group_id = managers
+    subnet_id = organizations.get_organization(org_id)['data']['subnets'][0]['id']
+    organizations.delete_subnet(subnet_id)
+    rbac.refresh_effective_access(organization_ids=[org_id])
+    assert materialized_subnets(paths, 'peer-a') == []
+    assert rbac.calculate_effective_access('peer-a')['data']['subnets'] == []
+
+
+def test_cached_access_is_dropped_when_the_group_is_detached(managers):
+    paths, organizations, rbac, org_id, group_id = managers
+    assert rbac.calculate_effective_access('peer-a')['data']['subnets']
+    rbac.detach_group_from_organization(group_id, org_id)
+    assert rbac.calculate_effective_access('peer-a')['data']['subnets'] == []
+    assert materialized_subnets(paths, 'peer-a') == []
+
+
+def test_refresh_without_changes_keeps_rows(managers):
+    paths, organizations, rbac, org_id, group_id = managers
+    result = rbac.refresh_effective_access(organization_ids=[org_id])
+    assert result['data']['inserted'] == 0 and result['data']['deleted'] == 0
@@ -0,0 +1,161 @@
+import json
+
+import pytest
+
+from modules.FakeNft import FakeNft
+from modules.FirewallBackend import FirewallBackendError, NftablesBackend
+from modules.FirewallManager import FirewallManager
+
+
+class RBACGroups:
+    """The parts of RBACManager the reconciler reads"""
+    def __init__(self, groups):
+        self.groups = groups
+
+    def get_all_groups(self):
+        return [{'id': group['id']} for group in self.groups]
+
+    def get_group_spec(self, group_id):
+        return next(group for group in self.groups if group['id'] == group_id)
+
+
+def group(group_id, networks, filter_policies=(), nat_policies=()):
+    return {'id': group_id, 'networks': list(networks),
+            'filter_policies': list(filter_policies), 'nat_policies': list(nat_policies)}
+
+
+def policy(policy_id, destination, action='ACCEPT', protocol='tcp', port='443'):
+    return {'id': policy_id, 'destination': destination, 'protocol': protocol, 'port': port, 'action': action}
+
+
+@pytest.fixture
+def fake(tmp_path):
+    return FakeNft(str(tmp_path / 'nft.json'))
+
+
+@pytest.fixture
+def backend(fake, tmp_path):
+    return NftablesBackend(command=fake.command(), rules_file=str(tmp_path / 'saved' / 'nftables.json'))
+
+
+@pytest.fixture
+def manager(backend, tmp_path):
+    manager = FirewallManager(cache_ttl=0, backend=backend)
+    manager.log_file = str(tmp_path / 'firewall.log')
+    return manager
+
+
+def test_filter_rule_is_added_listed_and_deleted(manager, backend):
+    result = manager.add_firewall_rule({'chain': 'INPUT', 'protocol': 'tcp', 'port': '22',
+                                        'source': '10.0.0.0/24', 'target': 'ACCEPT'})
+    assert result['status'], result['message']
+    rules = manager.get_firewall_rules(force=True)
+    assert [(r['chain'], r['source'], r['protocol'], r['port'], r['target']) for r in rules] == \
+        [('INPUT', '10.0.0.0/24', 'tcp', '22', 'ACCEPT')]
+    # The saved rules file is what reload and reconcile compare against
+    assert len(backend.saved_ruleset()['filter']['rules']) == 1
+
+    assert manager.delete_firewall_rule(1)['status']
+    assert manager.get_firewall_rules(force=True) == []
+
+
+def test_invalid_rules_are_rejected_without_changes(manager):
+    assert not manager.add_firewall_rule({'chain': 'PREROUTING', 'target': 'ACCEPT'})['status']
+    assert not manager.add_firewall_rule({'chain': 'INPUT', 'protocol': 'any', 'port': '22', 'target': 'ACCEPT'})['status']
+    assert manager.get_firewall_rules(force=True) == []
+
+
+def test_nat_rules(manager):
+    assert manager.add_nat_rule({'source': '10.8.0.0/24'})['status']
+    assert manager.add_nat_rule({'chain': 'PREROUTING', 'protocol': 'tcp', 'port': '8080',
+                                 'target': 'DNAT', 'toDestination': '10.8.0.2:80'})['status']
+    rules = manager.get_nat_rules(force=True)
+    assert [(r['chain'], r['target']) for r in rules] == [('PREROUTING', 'DNAT'), ('POSTROUTING', 'MASQUERADE')]
+    assert 'dnat to 10.8.0.2:80' in rules[0]['raw']
+
+
+def test_reorder_only_moves_the_rules_that_changed_place(manager, backend):
+    for port in ('22', '80', '443'):
+        assert manager.add_firewall_rule({'chain': 'INPUT', 'protocol': 'tcp', 'port': port, 'target': 'ACCEPT'})['status']
+    before = {r['port']: r['handle'] for r in backend.list_ruleset()['filter']['rules']}
+
+    assert manager.reorder_firewall_rules([{'id': 3}, {'id': 1}, {'id': 2}])['status']
+    after = backend.list_ruleset()['filter']['rules']
+    assert [r['port'] for r in after] == ['443', '22', '80']
+    # Only the moved rule is re-added, the others keep their handles
+    assert {r['port']: r['handle'] for r in after if r['port'] != '443'} == \
+        {port: handle for port, handle in before.items() if port != '443'}
+
+    assert not manager.reorder_firewall_rules([{'id': 1}])['status']
+
+
+def test_reload_restores_the_saved_rules(manager, backend):
+    assert manager.add_firewall_rule({'chain': 'INPUT', 'protocol': 'tcp', 'port': '22', 'target': 'ACCEPT'})['status']
+    backend.add_rule('filter', {'chain': 'INPUT', 'protocol': 'udp', 'port': '53', 'target': 'DROP'})
+    assert len(manager.get_firewall_rules(force=True)) == 2
+
+    assert manager.reload_firewall_rules()['status']
+    assert [r['port'] for r in manager.get_firewall_rules(force=True)] == ['22']
+
+
+def test_rbac_groups_are_applied_and_removed(backend, fake):
+    groups = [group(1, ['10.0.0.2/32', '10.0.0.3/32'], [policy(1, '192.168.1.0/24')],
+                    [{'id': 2, 'destination': '0.0.0.0/0', 'action': 'MASQUERADE',
+                      'translated_ip': None, 'translated_port': None}])]
+    report = backend.apply_rbac(groups, [])
+    assert report['rules'] == 2 and report['members'] == 2
+    assert backend.list_rbac_sets() == {'rbac_1': ['10.0.0.2/32', '10.0.0.3/32']}
+    ruleset = backend.list_ruleset()
+    assert [r['raw'] for r in ruleset['filter']['rules'] if r['chain'] == 'FORWARD'] == ['jump RBAC-FWD-1']
+    assert [r['raw'] for r in ruleset['nat']['rules'] if r['chain'] == 'POSTROUTING'] == ['jump RBAC-NAT-1']
+    forward = [r for r in ruleset['filter']['rules'] if r['chain'] == 'RBAC-FWD-1']
+    assert forward[0]['comment'] == 'RBAC-1-1' and forward[0]['source'] == '@rbac_1'
+
+    # Applying again does not add a second jump
+    backend.apply_rbac(groups, [])
+    assert len([r for r in backend.list_ruleset()['filter']['rules'] if r['chain'] == 'FORWARD']) == 1
+
+    backend.update_rbac_set(1, ['10.0.0.4/32'])
+    assert '10.0.0.4/32' in backend.list_rbac_sets()['rbac_1']
+
+    # A group chain that is still jumped to cannot be deleted, so the jump has to go in the same transaction
+    backend.apply_rbac([], [1])
+    ruleset = backend.list_ruleset()
+    assert backend.list_rbac_sets() == {}
+    assert not any(chain.startswith('RBAC-') for table in ruleset.values() for chain in table['chains'])
+    assert ruleset['filter']['rules'] == [] and ruleset['nat']['rules'] == []
+
+
+def test_rbac_prune_drops_groups_that_no_longer_exist(backend):
+    backend.apply_rbac([group(1, ['10.0.0.2/32']), group(2, ['10.0.0.3/32'])], [])
+    report = backend.apply_rbac([group(1, ['10.0.0.2/32'])], [], prune=True)
+    assert report['removed'] == 1
+    assert set(backend.list_rbac_sets()) == {'rbac_1'}
+
+
+def test_reconcile_converges_and_is_idempotent(manager, backend):
+    rbac = RBACGroups([group(1, ['10.0.0.2/32'], [policy(1, '192.168.1.0/24', action='DROP')])])
+    manager.reconciler.set_rbac_manager(rbac)
+    assert manager.add_firewall_rule({'chain': 'INPUT', 'protocol': 'tcp', 'port': '22', 'target': 'ACCEPT'})['status']
+
+    report = manager.reconciler.reconcile(source='live')
+    assert report['applied'] and 'create set rbac_1' in report['summary']
+    assert backend.list_rbac_sets() == {'rbac_1': ['10.0.0.2/32']}
+
+    report = manager.reconciler.reconcile(source='live')
+    assert report['estimated_cost']['operations'] == 0 and not report['applied']
+
+    rbac.groups[0]['networks'] = ['10.0.0.2/32', '10.0.0.5/32']
+    report = manager.reconciler.reconcile(source='live')
+    assert report['summary'] == ['add 10.0.0.5/32 to set rbac_1']
+    assert backend.list_rbac_sets() == {'rbac_1': ['10.0.0.2/32', '10.0.0.5/32']}
+
+
+def test_failed_transaction_changes_nothing(backend, fake):
+    backend.add_rule('filter', {'chain': 'INPUT', 'protocol': 'tcp', 'port': '22', 'target': 'ACCEPT'})
+    state = fake.load()
+    with pytest.raises(FirewallBackendError):
+        backend.delete_rule('filter', {'chain': 'INPUT', 'handle': 9999})
+    with pytest.raises(FirewallBackendError):
+        backend.add_rule('filter', {'chain': 'INPUT', 'target': 'NO-SUCH-CHAIN'})
+    assert json.dumps(fake.load(), sort_keys=True) == json.dumps(state, sort_keys=True)
@@ -0,0 +1,81 @@
+import sqlite3
+
+import pytest
+
+from modules.EnhancedRBACManager import EnhancedRBACManager
+from modules.OrganizationManager import OrganizationManager
+
+INTERFACE = 'wgtest-down'
+
+
+class Configuration:
+    """The parts of WireguardConfiguration provisioning uses, recording what reached the interface"""
+    Name = INTERFACE
+
+    def __init__(self):
+        self.peers = {}
+
+    def getAvailableIP(self, count):
+        return True, {'10.9.0.1/24': [f'10.9.0.{i}/32' for i in range(2, 20)]}
+
+    def addPeers(self, peers):
+        self.peers.update({peer['id']: peer for peer in peers})
+        return True, {}
+
+    def deletePeers(self, keys):
+        for key in keys:
+            self.peers.pop(key, None)
+
+
+@pytest.fixture
+def provisioning(databases, fake_wg):
+    paths, connections = databases
+    organizations = OrganizationManager(db_path=paths['organization'], connections=connections)
+    rbac = EnhancedRBACManager(db_path=paths['rbac'], connections=connections)
+    configuration = Configuration()
+    rbac.set_wireguard_configurations({INTERFACE: configuration})
+    org_id = organizations.create_organization('Branch')['id']
+    organizations.add_subnet_to_organization(org_id, '10.20.0.0/24')
+    group_id = rbac.create_group('Branch users')['data']['id']
+    rbac.attach_group_to_organization(group_id, org_id)
+    rbac.update_group_vpn_assignment(group_id, {'vpn_enabled': True, 'vpn_server_name': INTERFACE})
+    with sqlite3.connect(paths['users']) as conn:
+        for name in ('alice', 'bob', 'carol'):
+            user_id = conn.execute("INSERT INTO users (username, password_hash) VALUES (?, 'x')", (name,)).lastrowid
+            conn.execute("INSERT INTO user_groups (user_id, group_id) VALUES (?, ?)", (user_id, group_id))
+    return paths, rbac, configuration, group_id
+
+
+def count(path, table, group_id):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE group_id = ?", (group_id,)).fetchone()[0]
+
+
+def test_members_are_provisioned_with_one_route_apply(provisioning):
+    paths, rbac, configuration, group_id = provisioning
+    result = rbac.provision_group_peers(group_id)
+    assert result['status'], result['message']
+    assert len(result['data']) == 3 and len(configuration.peers) == 3
+    assert count(paths['users'], 'user_vpn_peers', group_id) == 3
+    assert count(paths['rbac'], 'rbac_group_peers', group_id) == 3
+    routes = rbac.push_routes.get_routes(INTERFACE)['data']
+    assert sorted(route['next_hop'] for route in routes) == sorted(m['peer_ip'] for m in result['data'])
+    assert [route['active'] for route in routes] == [True, False, False]
+
+    again = rbac.provision_group_peers(group_id)
+    assert again['status'] and again['data'] == []
+
+
+def test_peers_are_removed_when_the_database_writes_fail(provisioning):
+    paths, rbac, configuration, group_id = provisioning
+    with sqlite3.connect(paths['rbac']) as conn:
+        conn.execute("""
+            CREATE TRIGGER fail_group_peers BEFORE INSERT ON rbac_group_peers
+            BEGIN SELECT RAISE(ABORT, 'disk full'); END
+        """)
+    result = rbac.provision_group_peers(group_id)
+    assert not result['status'] and 'disk full' in result['message']
+    assert configuration.peers == {}
+    # The users.db rows were written in the same commit and are rolled back with it
+    assert count(paths['users'], 'user_vpn_peers', group_id) == 0
+    assert rbac.push_routes.get_routes(INTERFACE)['data'] == []
@@ -0,0 +1,51 @@
+import pytest
+
+from modules.PushRouteManager import PushRouteManager
+
+# No such interface exists, so routes are only stored and never applied
+INTERFACE = 'wgtest-down'
+
+
+@pytest.fixture
+def routes(tmp_path):
+    return PushRouteManager(str(tmp_path / 'rbac.db'))
+
+
+def served(routes):
+    return {(route['subnet'], route['next_hop']) for route in routes.get_routes(INTERFACE)['data'] if route['active']}
+
+
+def test_collapse_merges_adjacent_and_overlapping_subnets_per_family():
+    assert PushRouteManager._collapse(['10.0.0.0/25', '10.0.0.128/25', '10.0.0.7/32', 'fd00::/65', 'fd00:0:0:0:8000::/65']) == \
+        ['10.0.0.0/24', 'fd00::/64']
+    assert PushRouteManager._collapse(['10.0.0.1/24', '10.1.0.0/24']) == ['10.0.0.0/24', '10.1.0.0/24']
+
+
+def test_exclude_cuts_the_removed_address_space():
+    assert sorted(PushRouteManager._exclude(['10.0.0.0/24'], ['10.0.0.0/25'])) == ['10.0.0.128/25']
+    assert PushRouteManager._exclude(['10.0.0.0/24', '10.1.0.0/24'], ['10.1.0.0/24']) == ['10.0.0.0/24']
+    assert PushRouteManager._exclude(['10.0.0.0/24'], ['fd00::/64']) == ['10.0.0.0/24']
+    # A removed subnet wider than a stored one takes it away completely
+    assert PushRouteManager._exclude(['10.0.0.0/25'], ['10.0.0.0/16']) == []
+
+
+def test_routes_are_stored_collapsed(routes):
+    assert routes.add_routes(INTERFACE, ['10.0.0.0/25'], '10.8.0.2')['status']
+    assert routes.add_routes(INTERFACE, ['10.0.0.128/25'], '10.8.0.2')['status']
+    assert served(routes) == {('10.0.0.0/24', '10.8.0.2')}
+    assert not routes.add_routes(INTERFACE, ['10.0.0.0/24'], 'not-an-address')['status']
+
+
+def test_removed_subnet_is_handed_to_the_next_peer(routes):
+    routes.add_routes(INTERFACE, ['10.0.0.0/24'], '10.8.0.2')
+    routes.add_routes(INTERFACE, ['10.0.0.0/24'], '10.8.0.3')
+    assert served(routes) == {('10.0.0.0/24', '10.8.0.2')}
+
+    assert routes.remove_routes(INTERFACE, '10.8.0.2')['status']
+    assert served(routes) == {('10.0.0.0/24', '10.8.0.3')}
+
+
+def test_removing_part_of_a_subnet_keeps_the_rest(routes):
+    routes.add_routes(INTERFACE, ['10.0.0.0/24'], '10.8.0.2')
+    assert routes.remove_routes(INTERFACE, '10.8.0.2', ['10.0.0.0/25'])['status']
+    assert served(routes) == {('10.0.0.128/25', '10.8.0.2')}
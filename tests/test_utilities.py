@@ -0,0 +1,42 @@
+import base64
+
+import pytest
+
+from Utilities import GenerateWireguardKeyPairs, ValidateWireguardKey
+
+KEY = base64.b64encode(bytes(range(32))).decode()
+
+
+def test_valid_key():
+    assert ValidateWireguardKey(KEY)
+
+
+@pytest.mark.parametrize('key', [
+    '',
+    KEY[:-1],
+    KEY + 'A',
+    KEY[:-2] + '==',
+    'A' * 43 + '$',
+    f'{KEY[:20]} ; rm -rf / #{KEY[:10]}',
+    'x; touch /tmp/owned; echo aaaaaaaaaaaaaaaaaaaaaaaaaaaaa='[:44],
+    None,
+    42,
+])
+def test_invalid_key(key):
+    assert not ValidateWireguardKey(key)
+
+
+def test_key_pairs_are_derived_in_one_batch(fake_wg):
+    pairs = GenerateWireguardKeyPairs(5)
+    assert len(pairs) == 5 and len({private for private, _ in pairs}) == 5
+    for private, public in pairs:
+        assert ValidateWireguardKey(private) and ValidateWireguardKey(public)
+        raw = base64.b64decode(private)
+        assert raw[0] & 7 == 0 and raw[31] & 0xC0 == 0x40
+    assert GenerateWireguardKeyPairs(0) == []
+
+
+def test_key_pairs_fail_when_wg_fails(fake_wg):
+    fake_wg.write_text("#!/bin/sh\necho 'Unable to read private key' >&2\nexit 1\n")
+    with pytest.raises(RuntimeError, match='Unable to read private key'):
+        GenerateWireguardKeyPairs(2)